@@ -1,5 +1,6 @@
 #!/bin/bash
-# Regenerate figures and tables after attacks are executed.
+# Regenerate figures after attacks are executed; unchanged figures are skipped.
+# Usage: ./scripts/export_figures.sh [--jobs N] [--manifest extra.json] [--force]
 set -euo pipefail
 
-echo "[TODO] Execute 11_figures_and_tables.ipynb and sync outputs in reports/."
+python -m src.utils.plots --jobs "${FIGURE_JOBS:-4}" "$@"
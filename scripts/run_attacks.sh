@@ -1,10 +1,13 @@
 #!/bin/bash
-# Execute the attack notebooks for a given slice and replay track.
-# Usage: ./scripts/run_attacks.sh <slice_id> <replay_tag>
+# Score, attack and evaluate a given slice and replay track through the sweep orchestrator.
+# Usage: ./scripts/run_attacks.sh <slice_id> <replay_tag> [extra src.sweep args]
+# Stage handlers come from $SWEEP_HANDLERS (a module calling src.sweep.register_stage).
 set -euo pipefail
 
 SLICE_ID=${1:-1}
 REPLAY_TAG=${2:-noreplay}
+shift $(( $# < 2 ? $# : 2 ))
 
-echo "[TODO] Chain notebooks 05-10 for slice ${SLICE_ID} (${REPLAY_TAG})."
-echo "Use papermill or nbconvert --execute with proper environment variables."
+python -m src.sweep ${SWEEP_HANDLERS:+--handlers "$SWEEP_HANDLERS"} \
+  --slices "${SLICE_ID}" --tracks "${REPLAY_TAG}" \
+  --stages score attack_features ensemble metrics "$@"
@@ -1,11 +1,14 @@
 #!/bin/bash
-# Launch finetuning for a given slice on Colab or local machine.
-# Usage: ./scripts/run_finetune_slice.sh <slice_id> <replay_tag> <seed>
+# Build, tokenize and fine-tune one slice/track/seed through the sweep orchestrator.
+# Usage: ./scripts/run_finetune_slice.sh <slice_id> <replay_tag> <seed> [extra src.sweep args]
+# Stage handlers come from $SWEEP_HANDLERS (a module calling src.sweep.register_stage).
 set -euo pipefail
 
 SLICE_ID=${1:-1}
 REPLAY_TAG=${2:-noreplay}
 SEED=${3:-17}
+shift $(( $# < 3 ? $# : 3 ))
 
-echo "[TODO] Trigger notebook execution for slice ${SLICE_ID} (${REPLAY_TAG}) with seed ${SEED}."
-echo "Consider using papermill or colab-cli once paths are configured."
+python -m src.sweep ${SWEEP_HANDLERS:+--handlers "$SWEEP_HANDLERS"} \
+  --slices "${SLICE_ID}" --tracks "${REPLAY_TAG}" --seeds "${SEED}" \
+  --stages slice_build tokenize finetune "$@"
@@ -1,17 +1,181 @@
-"""Adaptive/stability-based attack stubs."""
+"""Adaptive/stability-based attack: variance of log-probs across repeated queries."""
 from __future__ import annotations
 
-from typing import Dict, Sequence
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Mapping, Optional, Sequence
 
 import numpy as np
+from scipy.stats import norm
+
+from ..utils.profiling import instrument
+
+
+@dataclass(frozen=True)
+class ProbeStoppingRule:
+    """When to stop re-querying an example.
+
+    An example stops once it has `min_queries` results and the normal
+    confidence bound on its stability variance is within
+    `rel_tol * variance + abs_tol`, or when it reaches `max_queries`.
+    """
+
+    max_queries: int = 5
+    min_queries: int = 3
+    rel_tol: float = 0.1
+    abs_tol: float = 1e-6
+    confidence: float = 0.95
+
+    @classmethod
+    def from_config(cls, attack_cfg: Mapping[str, Any]) -> "ProbeStoppingRule":
+        """Build from the `attacks.adaptive` block of `configs/attacks.yaml`."""
+        max_queries = int(attack_cfg.get("stability_probes", cls.max_queries))
+        return cls(
+            max_queries=max_queries,
+            min_queries=min(int(attack_cfg.get("min_probes", cls.min_queries)), max_queries),
+            rel_tol=float(attack_cfg.get("variance_rel_tol", cls.rel_tol)),
+        )
+
+
+class StabilityAccumulator:
+    """Online per-position moments (Welford up to M4) plus running min/max.
+
+    Memory is `O(examples x max_length)` regardless of how many queries are
+    ingested. Rows are right-padded to `lengths`; padded positions never enter
+    the per-example summaries.
+    """
+
+    def __init__(self, lengths: np.ndarray) -> None:
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        shape = (len(self.lengths), int(self.lengths.max(initial=0)))
+        self.valid = np.arange(shape[1])[None, :] < self.lengths[:, None]
+        self.counts = np.zeros(len(self.lengths), dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.m3 = np.zeros(shape)
+        self.m4 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+
+    def update(self, log_probs: np.ndarray, rows: Optional[np.ndarray] = None) -> None:
+        """Ingest one query result for `rows` (default: all examples).
+
+        `log_probs` is a padded `(len(rows), tokens)` matrix covering at least
+        each row's length; extra columns are ignored.
+        """
+        rows = np.arange(len(self.counts)) if rows is None else np.asarray(rows, dtype=np.int64)
+        values = np.asarray(log_probs, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[None, :]
+        if values.shape[0] != len(rows):
+            raise ValueError("log_probs must have one row per updated example")
+        width = min(values.shape[1], self.mean.shape[1])
+        if len(rows) and width < self.lengths[rows].max():
+            raise ValueError("log_probs is shorter than the examples' lengths")
+        x = values[:, :width]
+        block = (rows[:, None], np.arange(width)[None, :])
+
+        n = (self.counts[rows] + 1).astype(np.float64)[:, None]
+        mean, m2, m3 = self.mean[block], self.m2[block], self.m3[block]
+        delta = x - mean
+        delta_n = delta / n
+        delta_n2 = delta_n * delta_n
+        term1 = delta * delta_n * (n - 1)
+        self.mean[block] = mean + delta_n
+        self.m4[block] += term1 * delta_n2 * (n * n - 3 * n + 3) + 6 * delta_n2 * m2 - 4 * delta_n * m3
+        self.m3[block] = m3 + term1 * delta_n * (n - 2) - 3 * delta_n * m2
+        self.m2[block] = m2 + term1
+        self.min[block] = np.minimum(self.min[block], x)
+        self.max[block] = np.maximum(self.max[block], x)
+        self.counts[rows] += 1
+
+    def _masked_mean(self, values: np.ndarray) -> np.ndarray:
+        totals = np.where(self.valid, values, 0.0).sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return totals / self.lengths
+
+    def variance(self) -> np.ndarray:
+        """Per-example mean over positions of the across-query variance (`ddof=0`)."""
+        n = np.maximum(self.counts, 1)[:, None]
+        return self._masked_mean(self.m2 / n)
+
+    def value_range(self) -> np.ndarray:
+        """Per-example mean over positions of `max - min` across queries."""
+        with np.errstate(invalid="ignore"):
+            return self._masked_mean(self.max - self.min)
+
+    def variance_stderr(self) -> np.ndarray:
+        """Per-query standard error of the variance estimate, from the fourth central moment.
+
+        Per position, `Var(s^2) ~ (mu4 - sigma^4 (n-3)/(n-1)) / n`; the result
+        is the root of its mean over positions. Positions of one note are
+        strongly correlated across queries, so no `1 / length` reduction is
+        applied (it would stop every long note at `min_queries`). Infinite
+        until an example has two queries.
+        """
+        n = self.counts.astype(np.float64)[:, None]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sigma2 = self.m2 / n
+            var_s2 = np.clip((self.m4 / n - sigma2 * sigma2 * (n - 3) / (n - 1)) / n, 0.0, None)
+            stderr = np.sqrt(self._masked_mean(var_s2))
+        return np.where(self.counts >= 2, stderr, np.inf)
+
+    def converged(self, rule: ProbeStoppingRule) -> np.ndarray:
+        z = norm.ppf(0.5 + rule.confidence / 2)
+        tight = z * self.variance_stderr() <= rule.rel_tol * self.variance() + rule.abs_tol
+        return (self.counts >= rule.min_queries) & tight
+
+    def active(self, rule: ProbeStoppingRule) -> np.ndarray:
+        """Indices of examples that still need queries under `rule`."""
+        return np.flatnonzero((self.counts < rule.max_queries) & ~self.converged(rule))
+
+    def summary(self, rule: Optional[ProbeStoppingRule] = None) -> Dict[str, np.ndarray]:
+        result = {
+            "stability_var": self.variance(),
+            "stability_range": self.value_range(),
+            "queries": self.counts.copy(),
+        }
+        if rule is not None:
+            result["queries_saved"] = np.maximum(rule.max_queries - self.counts, 0)
+            result["converged"] = self.converged(rule)
+        return result
+
+
+@instrument()
+def stability_probe_examples(
+    query: Callable[[np.ndarray], np.ndarray],
+    lengths: np.ndarray,
+    rule: ProbeStoppingRule = ProbeStoppingRule(),
+) -> Dict[str, np.ndarray]:
+    """Re-query a batch of examples until each one's variance estimate settles.
+
+    `query(rows)` returns a padded `(len(rows), tokens)` log-prob matrix for the
+    requested example indices. Each round only re-queries examples that are
+    still active, so converged examples stop consuming scoring calls; the
+    per-example `queries_saved` against the fixed `max_queries` budget is
+    included in the result.
+    """
+    accumulator = StabilityAccumulator(lengths)
+    rows = accumulator.active(rule)
+    while len(rows):
+        accumulator.update(query(rows), rows)
+        rows = accumulator.active(rule)
+    return accumulator.summary(rule)
 
 
 def stability_probe(log_probs: Sequence[np.ndarray]) -> Dict[str, float]:
-    """Measure variance across repeated queries."""
-    stacked = np.stack(log_probs, axis=0)
-    variance = stacked.var(axis=0).mean()
-    max_variation = np.abs(stacked.max(axis=0) - stacked.min(axis=0)).mean()
+    """Measure variance across repeated queries (all results given up front).
+
+    Each result may have any shape; statistics are taken per element across
+    queries and averaged over all elements.
+    """
+    size = np.asarray(log_probs[0]).size
+    accumulator = StabilityAccumulator(np.array([size]))
+    for result in log_probs:
+        result = np.asarray(result)
+        if result.size != size:
+            raise ValueError("all query results must have the same shape")
+        accumulator.update(result.reshape(1, -1))
     return {
-        "stability_var": float(variance),
-        "stability_range": float(max_variation),
+        "stability_var": float(accumulator.variance()[0]),
+        "stability_range": float(accumulator.value_range()[0]),
     }
@@ -1,17 +1,28 @@
 """Feature stacking and ensemble attacks."""
 from __future__ import annotations
 
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedKFold
+
+from ..eval.metrics import RocSummary
+from ..utils.profiling import instrument
+from ..utils.seed import SeedLike, int_seed
 
 try:  # XGBoost is optional.
     from xgboost import XGBClassifier
 except Exception:  # pragma: no cover
     XGBClassifier = None  # type: ignore
 
+XGB_ROUNDS = 200
+XGB_MAX_TOTAL_ROUNDS = 1000
+
 
 def standardize_features(features: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
     mean = features.mean(axis=0, keepdims=True)
@@ -28,22 +39,59 @@ class EnsembleModels:
     std: np.ndarray
 
 
-def train_ensemble(features: np.ndarray, labels: np.ndarray) -> EnsembleModels:
-    normalized, mean, std = standardize_features(features)
-    logreg = LogisticRegression(max_iter=1000)
+@instrument()
+def train_ensemble(
+    features: np.ndarray,
+    labels: np.ndarray,
+    *,
+    n_jobs: Optional[int] = None,
+    init: Optional[EnsembleModels] = None,
+    seed: Optional[int] = None,
+    max_total_rounds: int = XGB_MAX_TOTAL_ROUNDS,
+) -> EnsembleModels:
+    """Fit the base members on standardized features.
+
+    `init` warm-starts from models trained on another slice: the logistic
+    regression starts from its coefficients and XGBoost keeps boosting on top
+    of its booster, adding up to `XGB_ROUNDS` rounds while the booster stays
+    within `max_total_rounds`. Warm-started models keep `init`'s
+    standardization so the inherited trees see features on the scale they were
+    fit on; once the round cap is reached, the booster and the scaler are refit
+    from scratch. `n_jobs` caps XGBoost threads.
+    """
+    previous = init.xgboost.get_booster() if init is not None and init.xgboost is not None else None
+    rounds = XGB_ROUNDS
+    if previous is not None:
+        rounds = min(XGB_ROUNDS, max_total_rounds - previous.num_boosted_rounds())
+        if rounds <= 0:
+            previous, rounds = None, XGB_ROUNDS
+    if init is not None and (previous is not None or init.xgboost is None):
+        mean, std = init.mean, init.std
+        normalized = (features - mean) / std
+    else:
+        normalized, mean, std = standardize_features(features)
+
+    if init is not None:
+        logreg = copy.deepcopy(init.logistic)
+        logreg.set_params(warm_start=True)
+    else:
+        logreg = LogisticRegression(max_iter=1000)
     logreg.fit(normalized, labels)
 
     xgb_model = None
     if XGBClassifier is not None:
+        extra = {} if seed is None else {"random_state": seed}
         xgb_model = XGBClassifier(
-            n_estimators=200,
+            n_estimators=rounds,
             max_depth=4,
             learning_rate=0.1,
             subsample=0.8,
             colsample_bytree=0.8,
             eval_metric="logloss",
+            n_jobs=n_jobs,
+            **extra,
         )
-        xgb_model.fit(normalized, labels)
+        xgb_model.fit(normalized, labels, xgb_model=previous)
 
     return EnsembleModels(logistic=logreg, xgboost=xgb_model, mean=mean, std=std)
 
@@ -56,3 +104,109 @@ def predict_proba(models: EnsembleModels, features: np.ndarray) -> Dict[str, np.
     if models.xgboost is not None:
         out["xgboost"] = models.xgboost.predict_proba(normalized)[:, 1]
     return out
+
+
+@dataclass
+class StackingResult:
+    """Out-of-fold member/stacked probabilities plus full-data models.
+
+    `oof_probs` holds one probability per example for every member and for the
+    `stacked` meta-learner, each predicted by a model that never saw that
+    example, so they can be bootstrapped directly. `thresholds` and `val_tpr`
+    are the operating points at the configured validation FPR. `models` and
+    `meta` are refit on all examples and seed the next slice via `warm_start`.
+    """
+
+    oof_probs: Dict[str, np.ndarray]
+    folds: np.ndarray
+    thresholds: Dict[str, float]
+    val_tpr: Dict[str, float]
+    models: EnsembleModels
+    meta: LogisticRegression
+
+
+def _fit_fold(args: Tuple) -> Tuple[int, Dict[str, np.ndarray]]:
+    fold, features, labels, train_idx, test_idx, n_jobs, init, seed = args
+    models = train_ensemble(features[train_idx], labels[train_idx], n_jobs=n_jobs, init=init, seed=seed)
+    return fold, predict_proba(models, features[test_idx])
+
+
+def _stack(member_probs: Dict[str, np.ndarray]) -> np.ndarray:
+    return np.column_stack([member_probs[name] for name in sorted(member_probs)])
+
+
+@instrument()
+def train_oof_stacking(
+    features: np.ndarray,
+    labels: np.ndarray,
+    *,
+    n_folds: int = 5,
+    validation_fpr: float = 0.01,
+    seed: SeedLike = 17,
+    n_jobs: int = 1,
+    warm_start: Optional[StackingResult] = None,
+) -> StackingResult:
+    """K-fold out-of-fold stacking of the ensemble members.
+
+    Folds are fit on a process pool of `n_jobs` workers, and each worker's
+    XGBoost gets `cpu_count // n_jobs` threads so cores are not oversubscribed.
+    A logistic meta-learner is then fit on the out-of-fold member probabilities
+    using the same folds. `seed` may be an int or a Generator; it fixes the
+    fold assignment and XGBoost's subsampling.
+    """
+    labels = np.asarray(labels)
+    seed = int_seed(seed)
+    splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=seed)
+    splits: List[Tuple[np.ndarray, np.ndarray]] = list(splitter.split(features, labels))
+    folds = np.empty(len(labels), dtype=np.int64)
+    for fold, (_, test_idx) in enumerate(splits):
+        folds[test_idx] = fold
+
+    workers = max(1, min(n_jobs, n_folds))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    init = warm_start.models if warm_start is not None else None
+    tasks = [
+        (fold, features, labels, train_idx, test_idx, threads, init, seed)
+        for fold, (train_idx, test_idx) in enumerate(splits)
+    ]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            fold_outputs = list(pool.map(_fit_fold, tasks))
+    else:
+        fold_outputs = [_fit_fold(task) for task in tasks]
+
+    oof_probs: Dict[str, np.ndarray] = {}
+    for fold, probs in fold_outputs:
+        test_idx = splits[fold][1]
+        for name, values in probs.items():
+            oof_probs.setdefault(name, np.empty(len(labels)))[test_idx] = values
+
+    stacked_inputs = _stack(oof_probs)
+    stacked = np.empty(len(labels))
+    for train_idx, test_idx in splits:
+        fold_meta = LogisticRegression(max_iter=1000).fit(stacked_inputs[train_idx], labels[train_idx])
+        stacked[test_idx] = fold_meta.predict_proba(stacked_inputs[test_idx])[:, 1]
+    oof_probs["stacked"] = stacked
+
+    thresholds, val_tpr = {}, {}
+    for name, values in oof_probs.items():
+        threshold, tpr = RocSummary.from_scores(labels, values).threshold_at([validation_fpr])
+        thresholds[name], val_tpr[name] = float(threshold[0]), float(tpr[0])
+
+    models = train_ensemble(features, labels, n_jobs=os.cpu_count(), init=init, seed=seed)
+    meta = LogisticRegression(max_iter=1000).fit(stacked_inputs, labels)
+    return StackingResult(
+        oof_probs=oof_probs,
+        folds=folds,
+        thresholds=thresholds,
+        val_tpr=val_tpr,
+        models=models,
+        meta=meta,
+    )
+
+
+def predict_stacked(result: StackingResult, features: np.ndarray) -> Dict[str, np.ndarray]:
+    """Member and stacked probabilities for new examples from the full-data models."""
+    probs = predict_proba(result.models, features)
+    probs["stacked"] = result.meta.predict_proba(_stack(probs))[:, 1]
+    return probs
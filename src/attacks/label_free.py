@@ -6,6 +6,8 @@ from typing import List
 
 import numpy as np
 
+from ..utils.profiling import instrument
+
 
 @dataclass
 class CalibrationPrompt:
@@ -15,6 +17,7 @@ class CalibrationPrompt:
         return f"{self.template}\n\nContext:\n{context}"  # TODO: replace with richer prompts.
 
 
+@instrument()
 def stability_score(log_probs: np.ndarray) -> np.ndarray:
     """Compute a stability score based on prediction entropy."""
     entropy = -np.sum(np.exp(log_probs) * log_probs, axis=-1)
@@ -2,9 +2,15 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Dict
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
 
 import numpy as np
+from scipy.stats import norm
+
+from ..utils.profiling import instrument
+
+ReferenceBatch = Union[np.ndarray, Tuple[np.ndarray, Optional[np.ndarray]]]
 
 
 @dataclass
@@ -23,8 +29,313 @@ def compute_llr(log_probs_ft: np.ndarray, log_probs_base: np.ndarray) -> LiRARes
     return LiRAResult(llr=llr, normalized_llr=normalized)
 
 
-def temporal_llr(llr_matrix: np.ndarray) -> Dict[str, np.ndarray]:
-    """Summaries for temporal leakage analysis."""
+def _welford_update(count: np.ndarray, mean: np.ndarray, m2: np.ndarray, values: np.ndarray, mask: np.ndarray) -> None:
+    """In-place Welford step for the examples selected by `mask`."""
+    count[mask] += 1
+    delta = values[mask] - mean[mask]
+    mean[mask] += delta / count[mask]
+    m2[mask] += delta * (values[mask] - mean[mask])
+
+
+@dataclass
+class ReferenceStats:
+    """Per-example running mean/variance of reference-model scores.
+
+    Each reference (shadow) model contributes one score per example; examples
+    that were in that model's training data update the `in` moments, the rest
+    update the `out` moments. Only O(examples) state is kept, however many
+    references are ingested.
+    """
+
+    count_in: np.ndarray
+    mean_in: np.ndarray
+    m2_in: np.ndarray
+    count_out: np.ndarray
+    mean_out: np.ndarray
+    m2_out: np.ndarray
+
+    @classmethod
+    def empty(cls, n_examples: int) -> "ReferenceStats":
+        counts = [np.zeros(n_examples, dtype=np.int64) for _ in range(2)]
+        moments = [np.zeros(n_examples) for _ in range(4)]
+        return cls(counts[0], moments[0], moments[1], counts[1], moments[2], moments[3])
+
+    def update(self, scores: np.ndarray, in_mask: Optional[np.ndarray] = None) -> None:
+        """Ingest one reference model's per-example scores."""
+        scores = np.asarray(scores, dtype=np.float64)
+        if scores.shape != self.mean_out.shape:
+            raise ValueError("reference scores must have one entry per example")
+        in_mask = np.zeros(scores.shape, dtype=bool) if in_mask is None else np.asarray(in_mask, dtype=bool)
+        _welford_update(self.count_in, self.mean_in, self.m2_in, scores, in_mask)
+        _welford_update(self.count_out, self.mean_out, self.m2_out, scores, ~in_mask)
+
+    @staticmethod
+    def _variance(count: np.ndarray, m2: np.ndarray) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(count > 1, m2 / np.maximum(count - 1, 1), np.nan)
+
+    @property
+    def var_in(self) -> np.ndarray:
+        return self._variance(self.count_in, self.m2_in)
+
+    @property
+    def var_out(self) -> np.ndarray:
+        return self._variance(self.count_out, self.m2_out)
+
+    def save(self, path: Path) -> Path:
+        """Write the moments to `path` (suffix forced to `.npz`) and return the file written."""
+        path = Path(path).with_suffix(".npz")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, **self.__dict__)
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> "ReferenceStats":
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in data.files})
+
+
+def iter_reference_scores(paths: Iterable[Path]) -> Iterator[Tuple[np.ndarray, Optional[np.ndarray]]]:
+    """Yield `(scores, in_mask)` per reference model from `.npy` or `.npz` files.
+
+    `.npy` files hold out-only scores; `.npz` files hold `scores` and an
+    optional boolean `in_mask`. Arrays are memory-mapped where possible.
+    """
+    for path in paths:
+        path = Path(path)
+        if path.suffix == ".npz":
+            with np.load(path) as data:
+                yield data["scores"], data["in_mask"] if "in_mask" in data.files else None
+        else:
+            yield np.load(path, mmap_mode="r"), None
+
+
+@instrument()
+def accumulate_reference_stats(
+    reference_scores: Iterable[ReferenceBatch],
+    n_examples: int,
+    stats: Optional[ReferenceStats] = None,
+) -> ReferenceStats:
+    """Fold reference-model scores (arrays or `(scores, in_mask)` pairs) one model at a time."""
+    stats = stats or ReferenceStats.empty(n_examples)
+    for item in reference_scores:
+        scores, in_mask = item if isinstance(item, tuple) else (item, None)
+        stats.update(scores, in_mask)
+    return stats
+
+
+def _with_pooled_fallback(var: np.ndarray, side: str) -> np.ndarray:
+    """Replace undefined per-example variances (fewer than two references) by the pooled variance."""
+    missing = np.isnan(var)
+    if not missing.any():
+        return var
+    if missing.all():
+        raise ValueError(f"LiRA needs at least two {side}-reference scores for some example to estimate a variance")
+    return np.where(missing, np.nanmean(var), var)
+
+
+@instrument()
+def lira_scores(
+    target_scores: np.ndarray,
+    stats: ReferenceStats,
+    *,
+    online: bool = True,
+    fix_variance: bool = False,
+    min_std: float = 1e-6,
+) -> LiRAResult:
+    """Gaussian LiRA on per-example target-model scores (higher = more member-like).
+
+    Online mode compares the in/out Gaussians; offline mode uses the one-sided
+    out-only test `log P(out score <= target)`. `normalized_llr` is the target
+    score's z-value under the out distribution. `fix_variance` pools one variance
+    across examples, which is more stable with few references; examples with
+    fewer than two references on a side always use that pooled variance.
+    """
+    target_scores = np.asarray(target_scores, dtype=np.float64)
+    var_out = _with_pooled_fallback(stats.var_out, "out")
+    var_in = _with_pooled_fallback(stats.var_in, "in") if online else stats.var_in
+    if fix_variance:
+        var_out = np.full_like(var_out, np.nanmean(var_out))
+        var_in = np.full_like(var_in, np.nanmean(var_in)) if online else var_in
+    std_out = np.maximum(np.sqrt(var_out), min_std)
+    z_out = (target_scores - stats.mean_out) / std_out
+
+    if online:
+        if (stats.count_in == 0).any():
+            raise ValueError("Online LiRA needs at least one in-reference score per example")
+        std_in = np.maximum(np.sqrt(var_in), min_std)
+        llr = norm.logpdf(target_scores, stats.mean_in, std_in) - norm.logpdf(target_scores, stats.mean_out, std_out)
+    else:
+        llr = norm.logcdf(z_out)
+    return LiRAResult(llr=llr, normalized_llr=z_out)
+
+
+def _merge_moments(count: np.ndarray, mean: np.ndarray, m2: np.ndarray) -> Tuple[float, float, float]:
+    """Pool per-slice `(count, mean, m2)` moments (Chan et al.) into one."""
+    total = count.sum()
+    if total == 0:
+        return 0.0, np.nan, np.nan
+    pooled_mean = float((count * mean).sum() / total)
+    pooled_m2 = float((m2 + count * (mean - pooled_mean) ** 2).sum())
+    return float(total), pooled_mean, pooled_m2
+
+
+@dataclass
+class PanelTrajectory:
+    """Per-slice and per-example LLR moments for one panel.
+
+    Per-slice moments are pooled over the panel's examples; per-example moments
+    run over slices. `window` is a ring buffer holding the last `len(window)`
+    slices' scores (NaN where an example was not scored).
+    """
+
+    slice_ids: np.ndarray
+    slice_count: np.ndarray
+    slice_mean: np.ndarray
+    slice_m2: np.ndarray
+    example_count: np.ndarray
+    example_mean: np.ndarray
+    example_m2: np.ndarray
+    window: np.ndarray
+
+    @classmethod
+    def empty(cls, n_examples: int, window_size: int) -> "PanelTrajectory":
+        return cls(
+            slice_ids=np.zeros(0, dtype=np.int64),
+            slice_count=np.zeros(0, dtype=np.int64),
+            slice_mean=np.zeros(0),
+            slice_m2=np.zeros(0),
+            example_count=np.zeros(n_examples, dtype=np.int64),
+            example_mean=np.zeros(n_examples),
+            example_m2=np.zeros(n_examples),
+            window=np.full((window_size, n_examples), np.nan),
+        )
+
+    def append(self, slice_id: int, scores: np.ndarray) -> None:
+        scores = np.asarray(scores, dtype=np.float64)
+        if scores.shape != self.example_mean.shape:
+            raise ValueError("slice scores must have one entry per panel example")
+        finite = np.isfinite(scores)
+        values = scores[finite]
+        m2 = float(((values - values.mean()) ** 2).sum()) if values.size else 0.0
+        self.slice_ids = np.append(self.slice_ids, slice_id)
+        self.slice_count = np.append(self.slice_count, values.size)
+        self.slice_mean = np.append(self.slice_mean, values.mean() if values.size else np.nan)
+        self.slice_m2 = np.append(self.slice_m2, m2)
+        _welford_update(self.example_count, self.example_mean, self.example_m2, scores, finite)
+        self.window[(len(self.slice_ids) - 1) % len(self.window)] = scores
+
+    def trajectory(self) -> Dict[str, np.ndarray]:
+        """Per-slice mean/std plus the same pooled over the trailing window (`ddof=0`)."""
+        size = len(self.window)
+        rolling = np.empty((len(self.slice_ids), 3))
+        for t in range(len(self.slice_ids)):
+            span = slice(max(0, t - size + 1), t + 1)
+            rolling[t] = _merge_moments(self.slice_count[span], self.slice_mean[span], self.slice_m2[span])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return {
+                "slice_id": self.slice_ids.copy(),
+                "mean": self.slice_mean.copy(),
+                "std": np.sqrt(self.slice_m2 / self.slice_count),
+                "rolling_mean": rolling[:, 1],
+                "rolling_std": np.sqrt(rolling[:, 2] / rolling[:, 0]),
+            }
+
+    def example_summary(self) -> Dict[str, np.ndarray]:
+        """Per-example mean/std over all slices so far and mean over the trailing window."""
+        seen = np.isfinite(self.window)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(self.example_m2 / self.example_count)
+            rolling_mean = np.where(seen, self.window, 0.0).sum(axis=0) / seen.sum(axis=0)
+        return {
+            "mean": np.where(self.example_count > 0, self.example_mean, np.nan),
+            "std": std,
+            "rolling_mean": rolling_mean,
+            "slices_seen": self.example_count.copy(),
+        }
+
+
+class TemporalLeakageTracker:
+    """Incremental temporal LLR summaries per panel, one slice checkpoint at a time.
+
+    Panels are keyed by name (e.g. `members`, `past_members`,
+    `future_non_members`) with a fixed example order; `window` is
+    `attacks.lira.rolling_temporal_window`.
+
+    Appending slice `t` costs O(examples x window) rather than rebuilding the
+    examples x slices matrix. State round-trips through `save`/`load` so each
+    sweep run only appends the new slice.
+    """
+
+    def __init__(self, window: int = 2) -> None:
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.window = window
+        self.panels: Dict[str, PanelTrajectory] = {}
+
+    def append(self, slice_id: int, panel_scores: Dict[str, np.ndarray]) -> bool:
+        """Add one slice's per-example LLRs for each panel.
+
+        Slices must arrive in increasing order. A slice already recorded for
+        every given panel is ignored (returns False), so resumed runs can replay
+        their last append safely.
+        """
+        appended = False
+        for panel, scores in panel_scores.items():
+            scores = np.asarray(scores, dtype=np.float64)
+            trajectory = self.panels.setdefault(panel, PanelTrajectory.empty(len(scores), self.window))
+            last = int(trajectory.slice_ids[-1]) if len(trajectory.slice_ids) else None
+            if last is not None and slice_id <= last:
+                if slice_id in trajectory.slice_ids:
+                    continue
+                raise ValueError(f"slice {slice_id} arrives after slice {last} for panel {panel!r}")
+            trajectory.append(slice_id, scores)
+            appended = True
+        return appended
+
+    def trajectory(self, panel: str) -> Dict[str, np.ndarray]:
+        return self.panels[panel].trajectory()
+
+    def example_summary(self, panel: str) -> Dict[str, np.ndarray]:
+        return self.panels[panel].example_summary()
+
+    def save(self, path: Path) -> Path:
+        """Write the tracker to `path` (suffix forced to `.npz`) and return the file written."""
+        path = Path(path).with_suffix(".npz")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {"window": np.array(self.window), "panels": np.array(list(self.panels), dtype=str)}
+        for panel, trajectory in self.panels.items():
+            arrays.update({f"{panel}.{name}": value for name, value in trajectory.__dict__.items()})
+        np.savez(path, **arrays)
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> "TemporalLeakageTracker":
+        with np.load(path) as data:
+            tracker = cls(window=int(data["window"]))
+            for panel in data["panels"].tolist():
+                prefix = f"{panel}."
+                tracker.panels[panel] = PanelTrajectory(
+                    **{name[len(prefix) :]: data[name] for name in data.files if name.startswith(prefix)}
+                )
+        return tracker
+
+
+@instrument()
+def temporal_llr(llr_matrix: np.ndarray, window: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """Summaries for temporal leakage analysis of an examples x slices LLR matrix.
+
+    With `window`, also returns `rolling_mean`/`rolling_std` pooled over the
+    trailing `window` slices (see `TemporalLeakageTracker` for incremental use).
+    """
+    llr_matrix = np.asarray(llr_matrix, dtype=np.float64)
     mean_traj = llr_matrix.mean(axis=0)
     std_traj = llr_matrix.std(axis=0)
-    return {"mean": mean_traj, "std": std_traj}
+    summary = {"mean": mean_traj, "std": std_traj}
+    if window is not None:
+        trajectory = PanelTrajectory.empty(llr_matrix.shape[0], window)
+        for slice_id in range(llr_matrix.shape[1]):
+            trajectory.append(slice_id, llr_matrix[:, slice_id])
+        rolling = trajectory.trajectory()
+        summary.update(rolling_mean=rolling["rolling_mean"], rolling_std=rolling["rolling_std"])
+    return summary
@@ -2,10 +2,13 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Dict
+from typing import Dict, Optional
 
 import numpy as np
 
+from ..utils.profiling import instrument
+from .ragged import as_masked, masked_mean
+
 
 @dataclass
 class LossConfidenceScores:
@@ -23,11 +26,24 @@ def summarize_token_stats(nll: np.ndarray, entropy: np.ndarray, max_prob: np.nda
     )
 
 
-def score_examples(nll: np.ndarray, entropy: np.ndarray, max_prob: np.ndarray) -> Dict[str, np.ndarray]:
-    """Return per-example aggregate scores."""
+@instrument()
+def score_examples(
+    nll: np.ndarray,
+    entropy: np.ndarray,
+    max_prob: np.ndarray,
+    *,
+    lengths: Optional[np.ndarray] = None,
+    mask: Optional[np.ndarray] = None,
+) -> Dict[str, np.ndarray]:
+    """Return per-example aggregate scores over valid tokens only.
+
+    Inputs may be padded `(examples, tokens)` matrices with `lengths`/`mask`, or
+    flat ragged arrays with `lengths` (see `ragged.as_masked`).
+    """
+    mean_nll = masked_mean(*as_masked(nll, lengths, mask))
     return {
-        "mean_nll": nll.mean(axis=1),
-        "entropy": entropy.mean(axis=1),
-        "max_prob": max_prob.mean(axis=1),
-        "perplexity": np.exp(nll.mean(axis=1)),
+        "mean_nll": mean_nll,
+        "entropy": masked_mean(*as_masked(entropy, lengths, mask)),
+        "max_prob": masked_mean(*as_masked(max_prob, lengths, mask)),
+        "perplexity": np.exp(mean_nll),
     }
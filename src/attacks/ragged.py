@@ -0,0 +1,59 @@
+"""Helpers for per-token features with a variable number of valid tokens."""
+from __future__ import annotations
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+def as_masked(
+    values: np.ndarray,
+    lengths: Optional[np.ndarray] = None,
+    mask: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return `(matrix, valid)` for padded, masked, or flat ragged token values.
+
+    Accepted layouts:
+    - 2-D `(examples, tokens)` with every token valid;
+    - 2-D with `lengths` (right padding) or a boolean `mask` of the same shape;
+    - 1-D concatenated values with `lengths`, as served by `TokenStatsStore.ragged`.
+      These are padded only to the longest row present.
+    """
+    if lengths is not None and mask is not None:
+        raise ValueError("Pass either lengths or mask, not both")
+    values = np.asarray(values)
+
+    if values.ndim == 1:
+        if lengths is None:
+            raise ValueError("Flat ragged values require lengths")
+        lengths = np.asarray(lengths, dtype=np.int64)
+        if lengths.sum() != values.size:
+            raise ValueError("lengths must sum to the number of ragged values")
+        width = int(lengths.max(initial=0))
+        valid = np.arange(width)[None, :] < lengths[:, None]
+        matrix = np.zeros(valid.shape, dtype=values.dtype)
+        matrix[valid] = values
+        return matrix, valid
+
+    if values.ndim != 2:
+        raise ValueError("Token values must be 1-D ragged or 2-D (examples, tokens)")
+    if mask is not None:
+        valid = np.asarray(mask, dtype=bool)
+        if valid.shape != values.shape:
+            raise ValueError("mask must match the shape of values")
+    elif lengths is not None:
+        lengths = np.asarray(lengths, dtype=np.int64)
+        if lengths.shape != (values.shape[0],) or (lengths > values.shape[1]).any():
+            raise ValueError("lengths must give at most `tokens` valid entries per example")
+        valid = np.arange(values.shape[1])[None, :] < lengths[:, None]
+    else:
+        valid = np.ones(values.shape, dtype=bool)
+    return values, valid
+
+
+def masked_mean(values: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """Per-example mean over valid tokens (NaN for examples without any)."""
+    counts = valid.sum(axis=1)
+    totals = np.where(valid, values, 0).sum(axis=1, dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, totals / counts, np.nan)
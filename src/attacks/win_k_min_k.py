@@ -1,31 +1,93 @@
 """Win-k and Min-k% attack utilities."""
 from __future__ import annotations
 
-from typing import Dict, Iterable, Tuple
+from typing import Dict, Iterable, Optional
 
 import numpy as np
 
+from ..utils.profiling import instrument
+from .ragged import as_masked, masked_mean
 
-def win_k_fraction(win_matrix: np.ndarray) -> np.ndarray:
-    """Compute fraction of tokens that fall within top-k."""
-    return win_matrix.mean(axis=1)
 
+def win_k_fraction(
+    win_matrix: np.ndarray,
+    *,
+    lengths: Optional[np.ndarray] = None,
+    mask: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Compute fraction of valid tokens that fall within top-k."""
+    values, valid = as_masked(win_matrix, lengths, mask)
+    return masked_mean(values, valid)
 
-def min_k_percent_loss(nll: np.ndarray, percent: float) -> np.ndarray:
+
+@instrument()
+def min_k_percent_losses(
+    nll: np.ndarray,
+    percents: Iterable[float],
+    *,
+    lengths: Optional[np.ndarray] = None,
+    mask: Optional[np.ndarray] = None,
+) -> Dict[float, np.ndarray]:
+    """Average loss over the worst-k% valid tokens for several percents at once.
+
+    `k` is computed per example from its own number of valid tokens. A single
+    `np.partition` isolates the largest `k_max` losses per row; only that block
+    is sorted, and every percent is read off its running sum.
+    """
+    percents = list(percents)
+    for percent in percents:
+        if not 0 < percent <= 1:
+            raise ValueError("percent must be in (0, 1]")
+    values, valid = as_masked(nll, lengths, mask)
+    counts = valid.sum(axis=1)
+    ks = {
+        percent: np.clip(np.rint(percent * counts).astype(np.int64), 1, np.maximum(counts, 1))
+        for percent in percents
+    }
+    if not percents:
+        return {}
+
+    width = values.shape[1]
+    filled = np.where(valid, values.astype(np.float64), -np.inf)
+    k_max = int(max(k.max(initial=1) for k in ks.values()))
+    if 0 < k_max < width:
+        filled = np.partition(filled, width - k_max, axis=1)[:, width - k_max :]
+    top = -np.sort(-filled, axis=1)
+    running = np.cumsum(top, axis=1)
+
+    rows = np.arange(values.shape[0])
+    out = {}
+    for percent, k in ks.items():
+        loss = running[rows, k - 1] / k if width else np.zeros(len(rows))
+        out[percent] = np.where(counts > 0, loss, np.nan)
+    return out
+
+
+def min_k_percent_loss(
+    nll: np.ndarray,
+    percent: float,
+    *,
+    lengths: Optional[np.ndarray] = None,
+    mask: Optional[np.ndarray] = None,
+) -> np.ndarray:
     """Average loss over the worst-k% tokens."""
-    if not 0 < percent <= 1:
-        raise ValueError("percent must be in (0, 1]")
-    sorted_loss = np.sort(nll, axis=1)[:, ::-1]
-    k = max(1, int(round(percent * nll.shape[1])))
-    return sorted_loss[:, :k].mean(axis=1)
+    return min_k_percent_losses(nll, [percent], lengths=lengths, mask=mask)[percent]
 
 
-def aggregate_features(win_dict: Dict[str, np.ndarray], nll: np.ndarray, worst_percents: Iterable[float]) -> Dict[str, np.ndarray]:
+@instrument()
+def aggregate_features(
+    win_dict: Dict[str, np.ndarray],
+    nll: np.ndarray,
+    worst_percents: Iterable[float],
+    *,
+    lengths: Optional[np.ndarray] = None,
+    mask: Optional[np.ndarray] = None,
+) -> Dict[str, np.ndarray]:
     """Combine Win-k fractions with worst-percentile losses."""
     features = {}
     for key, values in win_dict.items():
         label = key.replace("win@", "")
-        features[f"win_frac_{label}"] = win_k_fraction(values.astype(float))
-    for percent in worst_percents:
-        features[f"min_loss_top_{int(percent*100)}pct"] = min_k_percent_loss(nll, percent)
+        features[f"win_frac_{label}"] = win_k_fraction(values.astype(float), lengths=lengths, mask=mask)
+    for percent, losses in min_k_percent_losses(nll, worst_percents, lengths=lengths, mask=mask).items():
+        features[f"min_loss_top_{int(percent*100)}pct"] = losses
     return features
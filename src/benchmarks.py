@@ -0,0 +1,321 @@
+"""CPU benchmarks for the attack and evaluation hot paths on synthetic data.
+
+Usage::
+
+    python -m src.benchmarks --scale smoke
+    python -m src.benchmarks --scale subset --only token_level_stats bootstrap_rank_metrics
+    python -m src.benchmarks --scale smoke --save-baseline
+    python -m src.benchmarks --scale smoke --fail-on-regression
+
+Each benchmark runs in a fresh spawned process so its peak RSS is its own.
+Results are appended to `reports/benchmarks/history.jsonl` and compared with
+`reports/benchmarks/baseline.json` (keyed by benchmark and scale).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, replace
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .constants import PROJECT_ROOT
+
+BENCH_DIR = PROJECT_ROOT / "reports" / "benchmarks"
+
+
+@dataclass(frozen=True)
+class BenchScale:
+    """Synthetic problem size: `examples` panel rows of `tokens` tokens over `vocab`, in `slices` slices.
+
+    `batch` is the number of sequences per `token_level_stats` call; `resamples`
+    the bootstrap resamples per call.
+    """
+
+    name: str
+    examples: int
+    tokens: int
+    vocab: int
+    slices: int
+    batch: int = 4
+    resamples: int = 200
+
+
+SCALES: Dict[str, BenchScale] = {
+    "smoke": BenchScale("smoke", examples=2_000, tokens=128, vocab=4_096, slices=4, batch=2, resamples=100),
+    "subset": BenchScale("subset", examples=30_000, tokens=512, vocab=32_000, slices=4),
+    "full": BenchScale("full", examples=270_000, tokens=1_024, vocab=128_256, slices=8),
+}
+
+# A benchmark's setup builds inputs and returns (run, work items per run, unit).
+Setup = Callable[[BenchScale, np.random.Generator], Tuple[Callable[[], Any], float, str]]
+_BENCHMARKS: Dict[str, Setup] = {}
+
+
+def benchmark(name: str) -> Callable[[Setup], Setup]:
+    def decorator(fn: Setup) -> Setup:
+        _BENCHMARKS[name] = fn
+        return fn
+
+    return decorator
+
+
+def synthetic_token_nll(scale: BenchScale, rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    """Padded per-token NLL matrix with ragged lengths in `[tokens / 4, tokens]`."""
+    lengths = rng.integers(max(scale.tokens // 4, 1), scale.tokens + 1, size=scale.examples)
+    return rng.gamma(2.0, 1.0, size=(scale.examples, scale.tokens)).astype(np.float32), lengths
+
+
+def synthetic_scores(scale: BenchScale, rng: np.random.Generator, n_attacks: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """Balanced member labels and `(n_attacks, examples)` scores with a small member shift."""
+    labels = rng.permutation(np.arange(scale.examples) % 2)
+    scores = rng.normal(size=(n_attacks, scale.examples)) + 0.3 * labels
+    return labels, scores
+
+
+def synthetic_notes(scale: BenchScale, rng: np.random.Generator) -> pd.DataFrame:
+    """Canonical-like frame with `subject_id`, `slice_id`, `split_tag` and `discharge_time`."""
+    subjects = rng.integers(0, max(scale.examples // 2, 1), size=scale.examples)
+    slice_id = np.sort(rng.integers(0, scale.slices, size=scale.examples))
+    split = np.where(rng.random(scale.examples) < 0.1, "global_holdout", "train")
+    return pd.DataFrame(
+        {
+            "subject_id": subjects,
+            "slice_id": slice_id,
+            "split_tag": split,
+            "discharge_time": pd.Timestamp("2020-01-01") + pd.to_timedelta(np.arange(scale.examples), unit="min"),
+        }
+    )
+
+
+@benchmark("token_level_stats")
+def _bench_token_level_stats(scale: BenchScale, rng: np.random.Generator):
+    from .modeling.logprobs import token_level_stats
+
+    logits = rng.normal(size=(scale.batch, scale.tokens, scale.vocab)).astype(np.float32)
+    targets = rng.integers(0, scale.vocab, size=(scale.batch, scale.tokens))
+    return lambda: token_level_stats(logits, targets, vocab_chunk_size=8192, return_log_probs=False), scale.batch * scale.tokens, "tokens"
+
+
+@benchmark("min_k_percent_loss")
+def _bench_min_k(scale: BenchScale, rng: np.random.Generator):
+    from .attacks.win_k_min_k import min_k_percent_losses
+
+    nll, lengths = synthetic_token_nll(scale, rng)
+    return lambda: min_k_percent_losses(nll, (0.05, 0.1, 0.2), lengths=lengths), float(lengths.sum()), "tokens"
+
+
+@benchmark("bootstrap_metric")
+def _bench_bootstrap_metric(scale: BenchScale, rng: np.random.Generator):
+    from sklearn.metrics import roc_auc_score
+
+    from .eval.bootstrap import bootstrap_metric
+
+    labels, scores = synthetic_scores(scale, rng)
+    return lambda: bootstrap_metric(labels, scores[0], roc_auc_score, n_resamples=scale.resamples), scale.resamples, "resamples"
+
+
+@benchmark("bootstrap_rank_metrics")
+def _bench_bootstrap_rank(scale: BenchScale, rng: np.random.Generator):
+    from .eval.bootstrap import bootstrap_rank_metrics
+
+    labels, scores = synthetic_scores(scale, rng)
+    return lambda: bootstrap_rank_metrics(labels, scores[0], n_resamples=scale.resamples), scale.resamples, "resamples"
+
+
+@benchmark("compute_midrank")
+def _bench_midrank(scale: BenchScale, rng: np.random.Generator):
+    from .eval.delong import _compute_midrank
+
+    _, scores = synthetic_scores(scale, rng, n_attacks=4)
+    scores = np.round(scores, 2)  # ties, as with quantized attack scores
+    return lambda: _compute_midrank(scores), scores.size, "scores"
+
+
+@benchmark("delong_covariance")
+def _bench_delong(scale: BenchScale, rng: np.random.Generator):
+    from .eval.delong import delong_covariance
+
+    labels, scores = synthetic_scores(scale, rng, n_attacks=4)
+    return lambda: delong_covariance(labels, scores), scores.size, "scores"
+
+
+@benchmark("expected_calibration_error")
+def _bench_ece(scale: BenchScale, rng: np.random.Generator):
+    from .eval.metrics import expected_calibration_error
+
+    labels, scores = synthetic_scores(scale, rng)
+    probs = 1.0 / (1.0 + np.exp(-scores[0]))
+    return lambda: expected_calibration_error(labels, probs), scale.examples, "examples"
+
+
+@benchmark("build_member_panels")
+def _bench_panels(scale: BenchScale, rng: np.random.Generator):
+    from .data.slicing import SliceConfig, build_member_panels
+
+    df = synthetic_notes(scale, rng)
+    config = SliceConfig(total_slices=scale.slices)
+    # Fixed scratch location, overwritten on every run, so repeated runs do not pile up ID lists.
+    artifact_dir = str(Path(tempfile.gettempdir()) / "secure_llm_mia_bench_panels")
+    return lambda: build_member_panels(df, config=config, artifact_dir=artifact_dir), scale.examples, "rows"
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_one(args: Tuple[str, BenchScale, int, int]) -> Dict[str, Any]:
+    name, scale, repeats, seed = args
+    rng = np.random.default_rng(seed)
+    run, work, unit = _BENCHMARKS[name](scale, rng)
+    run()  # warm-up: imports, caches, first-touch allocations
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return {
+        "benchmark": name,
+        "scale": scale.name,
+        "wall_s": best,
+        "wall_median_s": float(np.median(times)),
+        "repeats": repeats,
+        "throughput": work / best if best > 0 else float("inf"),
+        "unit": f"{unit}/s",
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run_benchmarks(
+    scale: BenchScale,
+    names: Optional[Sequence[str]] = None,
+    *,
+    repeats: int = 3,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    """Run the selected benchmarks, each in its own spawned process."""
+    names = list(names or _BENCHMARKS)
+    unknown = set(names) - set(_BENCHMARKS)
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {sorted(unknown)}")
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results.append(pool.submit(_run_one, (name, scale, repeats, seed)).result())
+    return results
+
+
+def flag_regressions(
+    results: Sequence[Dict[str, Any]],
+    baseline: Dict[str, Dict[str, float]],
+    *,
+    time_tolerance: float = 0.25,
+    memory_tolerance: float = 0.25,
+) -> List[Dict[str, Any]]:
+    """Annotate results with `regressions` relative to `baseline["{benchmark}@{scale}"]`."""
+    flagged = []
+    for result in results:
+        reference = baseline.get(f"{result['benchmark']}@{result['scale']}")
+        regressions = []
+        if reference:
+            if result["wall_s"] > reference["wall_s"] * (1 + time_tolerance):
+                regressions.append(f"wall_s {result['wall_s']:.4g} > {reference['wall_s']:.4g}")
+            if result["peak_rss_mb"] > reference["peak_rss_mb"] * (1 + memory_tolerance):
+                regressions.append(f"peak_rss_mb {result['peak_rss_mb']:.1f} > {reference['peak_rss_mb']:.1f}")
+        flagged.append({**result, "baseline": reference is not None, "regressions": regressions})
+    return flagged
+
+
+def _environment() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def append_history(path: Path, results: Sequence[Dict[str, Any]], scale: BenchScale) -> Path:
+    """Append one JSON record per result (with scale and environment) to a JSONL history."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+    env = _environment()
+    with path.open("a", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps({"timestamp": stamp, **result, "scale_params": asdict(scale), "env": env}) + "\n")
+    return path
+
+
+def load_baseline(path: Path) -> Dict[str, Dict[str, float]]:
+    return json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+
+
+def save_baseline(path: Path, results: Sequence[Dict[str, Any]]) -> Path:
+    """Merge results into the baseline file, replacing entries for the same benchmark and scale."""
+    baseline = load_baseline(path)
+    for result in results:
+        baseline[f"{result['benchmark']}@{result['scale']}"] = {
+            "wall_s": result["wall_s"],
+            "peak_rss_mb": result["peak_rss_mb"],
+        }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(baseline, indent=2, sort_keys=True), encoding="utf-8")
+    return path
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark attack/eval hot paths on synthetic data (CPU only).")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="smoke")
+    parser.add_argument("--examples", type=int)
+    parser.add_argument("--tokens", type=int)
+    parser.add_argument("--vocab", type=int)
+    parser.add_argument("--slices", type=int)
+    parser.add_argument("--only", nargs="*", choices=sorted(_BENCHMARKS))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--history", type=Path, default=BENCH_DIR / "history.jsonl")
+    parser.add_argument("--baseline", type=Path, default=BENCH_DIR / "baseline.json")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown / memory growth.")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    overrides = {key: getattr(args, key) for key in ("examples", "tokens", "vocab", "slices") if getattr(args, key)}
+    scale = replace(SCALES[args.scale], **overrides)
+    if overrides:
+        scale = replace(scale, name=f"{scale.name}-custom-" + "-".join(f"{k}{v}" for k, v in sorted(overrides.items())))
+
+    results = run_benchmarks(scale, args.only, repeats=args.repeats)
+    results = flag_regressions(
+        results, load_baseline(args.baseline), time_tolerance=args.tolerance, memory_tolerance=args.tolerance
+    )
+    append_history(args.history, results, scale)
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+
+    for result in results:
+        flag = "REGRESSION " + "; ".join(result["regressions"]) if result["regressions"] else "ok"
+        print(
+            f"{result['benchmark']:<28} {result['wall_s'] * 1e3:10.2f} ms  "
+            f"{result['throughput']:12.4g} {result['unit']:<14} {result['peak_rss_mb']:8.1f} MiB  {flag}"
+        )
+    regressed = any(result["regressions"] for result in results)
+    return 1 if regressed and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,15 +1,61 @@
 """Loader utilities for the MIMIC-IV-Ext-BHC dataset."""
 from __future__ import annotations
 
+import heapq
+import itertools
+import tempfile
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Iterator, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
+from ..utils.profiling import instrument
 from ..utils.runtime import RunModeConfig
 
+if TYPE_CHECKING:
+    import pyarrow as pa
+
 EXPECTED_COLUMNS = {"note_id", "input", "target", "input_tokens", "target_tokens"}
+CANONICAL_COLUMNS = [
+    "subject_id",
+    "hadm_id",
+    "discharge_time",
+    "text",
+    "tokens_estimate",
+    "note_id",
+    "input",
+    "target",
+    "input_tokens",
+    "target_tokens",
+]
+# Streaming reads pin the dtypes so every chunk matches `canonical_arrow_schema`
+# (token counts stay integer when some are missing).
+CSV_DTYPES = {"note_id": str, "input": str, "target": str, "input_tokens": "Int64", "target_tokens": "Int64"}
+INSTRUCTION = "Summarize the discharge note into a Brief Hospital Course."
+BASELINE_TIME = pd.Timestamp("2018-01-01")
+
+
+def canonical_arrow_schema() -> "pa.Schema":
+    """Arrow schema of the canonical BHC parquet written by `stream_bhc_to_parquet`."""
+    import pyarrow as pa
+
+    text = pa.large_string()
+    return pa.schema(
+        [
+            ("subject_id", text),
+            ("hadm_id", text),
+            ("discharge_time", pa.timestamp("ns")),
+            ("text", text),
+            ("tokens_estimate", pa.int64()),
+            ("note_id", text),
+            ("input", text),
+            ("target", text),
+            ("input_tokens", pa.int64()),
+            ("target_tokens", pa.int64()),
+        ]
+    )
 
 
 @dataclass
@@ -20,61 +66,139 @@ class BHCDataConfig:
     seed: int = 17
 
 
-def load_bhc_dataframe(config: BHCDataConfig) -> pd.DataFrame:
-    """Load the BHC CSV with optional row limiting based on run mode."""
-
+def _check_csv(config: BHCDataConfig) -> None:
     if not config.csv_path.exists():
         raise FileNotFoundError(
             f"BHC dataset not found at {config.csv_path}. Upload it to Drive before running this notebook."
         )
 
+
+def _validate_columns(columns) -> None:
+    missing = EXPECTED_COLUMNS - set(columns)
+    if missing:
+        raise ValueError(f"BHC CSV is missing required columns: {sorted(missing)}")
+
+
+@instrument()
+def load_bhc_dataframe(config: BHCDataConfig) -> pd.DataFrame:
+    """Load the BHC CSV with optional row limiting based on run mode."""
+
+    _check_csv(config)
     row_limit = config.subset_rows or config.run_mode.max_rows
     read_kwargs = {"dtype": {"note_id": str}}
     if row_limit:
         read_kwargs["nrows"] = row_limit
 
     df = pd.read_csv(config.csv_path, **read_kwargs)
-    missing = EXPECTED_COLUMNS - set(df.columns)
-    if missing:
-        raise ValueError(f"BHC CSV is missing required columns: {sorted(missing)}")
+    _validate_columns(df.columns)
     return df
 
 
+def render_text(inputs: pd.Series, targets: pd.Series) -> pd.Series:
+    """Vectorized prompt rendering for the canonical `text` column."""
+    return (
+        f"{INSTRUCTION}\n\n### Discharge Note\n"
+        + inputs.astype(str)
+        + "\n\n### Expected Brief Hospital Course\n"
+        + targets.astype(str)
+    )
+
+
+def _canonical_frame(df: pd.DataFrame, time_rank: np.ndarray) -> pd.DataFrame:
+    """Canonical columns for `df`, where `time_rank` is each row's chronological position."""
+    subject_id = df["note_id"].astype(str)
+    canonical = pd.DataFrame(
+        {
+            "subject_id": subject_id,
+            "hadm_id": subject_id,
+            # Synthesize a monotonic timestamp for chronological slicing.
+            "discharge_time": BASELINE_TIME + pd.to_timedelta(time_rank, unit="h"),
+            "text": render_text(df["input"], df["target"]),
+            "tokens_estimate": df["input_tokens"] + df["target_tokens"],
+        },
+        index=df.index,
+    )
+    for column in ("note_id", "input", "target", "input_tokens", "target_tokens"):
+        canonical[column] = df[column]
+    return canonical[CANONICAL_COLUMNS]
+
+
+@instrument()
 def bhc_to_canonical(df: pd.DataFrame) -> pd.DataFrame:
     """Convert BHC dataframe into the canonical schema used downstream."""
 
-    canonical = df.copy()
-    canonical["subject_id"] = canonical["note_id"].astype(str)
-    canonical["hadm_id"] = canonical["subject_id"]
-
-    # Synthesize a monotonic timestamp for chronological slicing.
-    canonical = canonical.sort_values("note_id").reset_index(drop=True)
-    baseline = pd.Timestamp("2018-01-01")
-    canonical["discharge_time"] = baseline + pd.to_timedelta(canonical.index, unit="h")
-
-    instruction = "Summarize the discharge note into a Brief Hospital Course."
-
-    def render_example(row: pd.Series) -> str:
-        return (
-            f"{instruction}\n\n"
-            f"### Discharge Note\n{row['input']}\n\n"
-            f"### Expected Brief Hospital Course\n{row['target']}"
-        )
-
-    canonical["text"] = canonical.apply(render_example, axis=1)
-    canonical["tokens_estimate"] = canonical["input_tokens"] + canonical["target_tokens"]
-    canonical = canonical[
-        [
-            "subject_id",
-            "hadm_id",
-            "discharge_time",
-            "text",
-            "tokens_estimate",
-            "note_id",
-            "input",
-            "target",
-            "input_tokens",
-            "target_tokens",
-        ]
-    ]
-    return canonical
+    ordered = df.sort_values("note_id").reset_index(drop=True)
+    return _canonical_frame(ordered, np.arange(len(ordered)))
+
+
+def _sorted_run(path: Path, batch_rows: int) -> Iterator[Tuple[str, int]]:
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows):
+        yield from zip(batch.column("note_id").to_pylist(), batch.column("row").to_pylist())
+
+
+def _note_id_ranks(config: BHCDataConfig, row_limit: Optional[int], chunk_rows: int, tmp_dir: Path) -> np.ndarray:
+    """Chronological rank of every CSV row: note_id order, ties in file order.
+
+    An external sort: each chunk's note_ids are sorted and spilled to
+    `tmp_dir`, then the runs are k-way merged into a memory-mapped rank array,
+    so memory scales with `chunk_rows` rather than the row count.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    runs = []
+    rows = 0
+    reader = pd.read_csv(config.csv_path, usecols=["note_id"], dtype={"note_id": str}, chunksize=chunk_rows, nrows=row_limit)
+    for chunk in reader:
+        note_ids = chunk["note_id"].astype(str).to_numpy(dtype=object)
+        order = np.argsort(note_ids, kind="stable")
+        runs.append(tmp_dir / f"run_{len(runs):05d}.parquet")
+        pq.write_table(pa.table({"note_id": note_ids[order].tolist(), "row": rows + order}), runs[-1])
+        rows += len(note_ids)
+    if rows == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    ranks = np.lib.format.open_memmap(tmp_dir / "ranks.npy", mode="w+", dtype=np.int64, shape=(rows,))
+    batch_rows = max(1, chunk_rows // len(runs))
+    merged = heapq.merge(*(_sorted_run(path, batch_rows) for path in runs))
+    done = 0
+    while done < rows:
+        block = [row for _, row in itertools.islice(merged, chunk_rows)]
+        ranks[block] = np.arange(done, done + len(block))
+        done += len(block)
+    return ranks
+
+
+@instrument()
+def stream_bhc_to_parquet(config: BHCDataConfig, out_path: Path, *, chunk_rows: int = 20_000) -> Path:
+    """Stream the BHC CSV into a canonical Parquet file one row group per chunk.
+
+    The header is validated before any data is read. A first pass externally
+    sorts `note_id` to fix each row's chronological rank (the same note_id
+    order that `bhc_to_canonical` uses); the second pass renders chunks against
+    `canonical_arrow_schema` and writes them, so peak memory scales with
+    `chunk_rows`. Rows keep CSV order on disk; sort by `discharge_time` to
+    recover the `bhc_to_canonical` ordering.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    _check_csv(config)
+    _validate_columns(pd.read_csv(config.csv_path, nrows=0).columns)
+    row_limit = config.subset_rows or config.run_mode.max_rows
+    schema = canonical_arrow_schema()
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=out_path.parent, prefix=".bhc_ranks.") as tmp:
+        ranks = _note_id_ranks(config, row_limit, chunk_rows, Path(tmp))
+        with pq.ParquetWriter(out_path, schema) as writer:
+            offset = 0
+            reader = pd.read_csv(config.csv_path, dtype=CSV_DTYPES, chunksize=chunk_rows, nrows=row_limit)
+            for chunk in reader:
+                canonical = _canonical_frame(chunk, ranks[offset : offset + len(chunk)])
+                offset += len(chunk)
+                writer.write_table(pa.Table.from_pandas(canonical, schema=schema, preserve_index=False))
+        del ranks
+    return out_path
@@ -1,14 +1,21 @@
 """Dataset loading stubs with synthetic fallbacks for development."""
 from __future__ import annotations
 
+import shutil
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional, Sequence, Tuple, Union
 
 import numpy as np
 import pandas as pd
 
-from ..utils.seed import set_global_seed
+from ..utils.profiling import instrument
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+# Full schema of a partitioned export (partition columns included, in frame order).
+SCHEMA_FILE = "_common_metadata"
 
 
 @dataclass
@@ -44,7 +51,6 @@ def load_notes(config: LoaderConfig) -> pd.DataFrame:
     Returns a synthetic DataFrame unless a real path is provided. Replace with secure
     data access logic (e.g., PhysioNet downloads) before production use.
     """
-    set_global_seed(config.seed)
     if not config.root.exists():
         return _synthetic_notes(config.limit or 1000)
 
@@ -78,15 +84,121 @@ def tag_split(df: pd.DataFrame, *, train_frac: float = 0.8) -> pd.DataFrame:
     return df
 
 
-def export_canonical(df: pd.DataFrame, path: Path) -> Path:
-    """Export canonical parquet used by later notebooks."""
-    path.parent.mkdir(parents=True, exist_ok=True)
-    df.to_parquet(path, index=False)
+def export_canonical(
+    df: pd.DataFrame,
+    path: Path,
+    *,
+    partition_cols: Optional[Sequence[str]] = None,
+    row_group_rows: int = 64_000,
+    keep_other_partitions: bool = False,
+) -> Path:
+    """Export canonical parquet used by later notebooks.
+
+    With `partition_cols` (e.g. `["slice_id"]` or `["slice_id", "split_tag"]`)
+    `path` becomes a Hive-partitioned dataset directory, replaced as a whole
+    unless `keep_other_partitions` is set, in which case only the partitions
+    present in `df` are rewritten (incremental per-slice exports). The full
+    schema is kept in `SCHEMA_FILE` so `load_canonical` restores column types
+    and order. Rows are written in `discharge_time` order so per-row-group
+    min/max statistics let readers skip row groups outside a requested time
+    range.
+    """
+    if not partition_cols:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(path, index=False)
+        return path
+
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    missing = set(partition_cols) - set(df.columns)
+    if missing:
+        raise KeyError(f"Partition columns not found in DataFrame: {sorted(missing)}")
+    if "discharge_time" in df.columns:
+        df = df.sort_values("discharge_time", kind="stable")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if not keep_other_partitions and path.is_dir():
+        shutil.rmtree(path)
+    elif not keep_other_partitions and path.exists():
+        path.unlink()
+    ds.write_dataset(
+        table,
+        path,
+        format="parquet",
+        partitioning=list(partition_cols),
+        partitioning_flavor="hive",
+        max_rows_per_group=row_group_rows,
+        min_rows_per_group=min(row_group_rows, max(1, len(df))),
+        existing_data_behavior="delete_matching",
+    )
+    pq.write_metadata(table.schema, path / SCHEMA_FILE)
     return path
 
 
-def load_canonical(path: Path, columns: Optional[Iterable[str]] = None) -> pd.DataFrame:
-    """Load canonical parquet if it exists, else return empty DF."""
+def _canonical_filter(
+    slice_ids: Optional[Iterable[int]],
+    split_tags: Optional[Iterable[str]],
+    time_range: Optional[Tuple[pd.Timestamp, pd.Timestamp]],
+):
+    import pyarrow.dataset as ds
+
+    expression = None
+    clauses = []
+    if slice_ids is not None:
+        clauses.append(ds.field("slice_id").isin([int(s) for s in slice_ids]))
+    if split_tags is not None:
+        clauses.append(ds.field("split_tag").isin([str(tag) for tag in split_tags]))
+    if time_range is not None:
+        start, end = (pd.Timestamp(t) for t in time_range)
+        clauses.append((ds.field("discharge_time") >= start) & (ds.field("discharge_time") < end))
+    for clause in clauses:
+        expression = clause if expression is None else expression & clause
+    return expression
+
+
+@instrument()
+def load_canonical(
+    path: Path,
+    columns: Optional[Iterable[str]] = None,
+    *,
+    slice_ids: Optional[Iterable[int]] = None,
+    split_tags: Optional[Iterable[str]] = None,
+    time_range: Optional[Tuple[pd.Timestamp, pd.Timestamp]] = None,
+    output: str = "pandas",
+    batch_size: int = 65_536,
+) -> Union[pd.DataFrame, "pa.Table", Iterator["pa.RecordBatch"]]:
+    """Load canonical parquet if it exists, else return empty data in the requested `output` form.
+
+    Works on a single file or a Hive-partitioned directory from
+    `export_canonical`. Slice/split filters prune partitions and the
+    `time_range` (half-open) filter is checked against row-group statistics, so
+    only matching bytes are read. Partitioned exports come back with their
+    original column types and order (or the order of `columns`). `output` selects `"pandas"`, `"arrow"` (a
+    `pyarrow.Table`) or `"batches"` (an iterator of record batches).
+    """
+    if output not in {"pandas", "arrow", "batches"}:
+        raise ValueError("output must be 'pandas', 'arrow' or 'batches'")
     if not path.exists():
-        return pd.DataFrame(columns=list(columns or []))
-    return pd.read_parquet(path, columns=list(columns) if columns else None)
+        if output == "batches":
+            return iter(())
+        empty = pd.DataFrame(columns=list(columns or []))
+        if output == "arrow":
+            import pyarrow as pa
+
+            return pa.Table.from_pandas(empty, preserve_index=False)
+        return empty
+
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    schema = pq.read_schema(path / SCHEMA_FILE) if (path / SCHEMA_FILE).exists() else None
+    dataset = ds.dataset(path, format="parquet", schema=schema, partitioning="hive" if path.is_dir() else None)
+    scan_kwargs = {
+        "columns": list(columns) if columns else None,
+        "filter": _canonical_filter(slice_ids, split_tags, time_range),
+    }
+    if output == "batches":
+        return dataset.to_batches(batch_size=batch_size, **scan_kwargs)
+    table = dataset.to_table(**scan_kwargs)
+    return table if output == "arrow" else table.to_pandas()
@@ -1,12 +1,16 @@
 """Paraphrase utilities for stability-based attacks."""
 from __future__ import annotations
 
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import Iterable, List, Tuple
+from functools import lru_cache
+from typing import Iterable, List, Optional, Sequence, Tuple
 
 import numpy as np
 
-from ..utils.seed import set_global_seed
+from ..utils.profiling import instrument
+from ..utils.seed import SeedLike, as_seed_sequence, make_rng
 
 
 @dataclass
@@ -42,30 +46,88 @@ def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     return float(np.dot(a, b) / denom)
 
 
+def text_digest(text: str) -> bytes:
+    """Stable digest of a text (unlike `hash()`, identical across processes)."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+@lru_cache(maxsize=65536)
+def _embed_digest(digest: bytes) -> np.ndarray:
+    rng = np.random.default_rng(int.from_bytes(digest, "little"))
+    embedding = rng.normal(size=768)
+    embedding.setflags(write=False)
+    return embedding
+
+
 def _embed(text: str) -> np.ndarray:
     """Toy embedding via hashing for lightweight testing."""
-    rng = np.random.default_rng(abs(hash(text)) % (2**32))
-    return rng.normal(size=768)
-
-
-def generate_paraphrases(texts: Iterable[str], config: ParaphraseConfig) -> List[List[str]]:
-    """Generate synthetic paraphrases meeting similarity constraints."""
-    set_global_seed(config.seed)
-    rng = np.random.default_rng(config.seed)
-    paraphrases: List[List[str]] = []
-    for text in texts:
-        base_emb = _embed(text)
-        num_variants = rng.integers(config.variants_per_example[0], config.variants_per_example[1] + 1)
-        variants: List[str] = []
-        for _ in range(num_variants):
-            candidate = _simple_synonym_swap(text)
-            if rng.random() < 0.3:
-                candidate = _reverse_sentence(candidate)
-            cand_emb = _embed(candidate)
-            sim = cosine_similarity(base_emb, cand_emb)
-            length_ratio = len(candidate) / max(len(text), 1)
-            if sim < config.similarity_threshold or not (config.length_ratio_bounds[0] <= length_ratio <= config.length_ratio_bounds[1]):
-                continue
-            variants.append(candidate)
-        paraphrases.append(variants)
+    return _embed_digest(text_digest(text))
+
+
+def embed_batch(texts: Sequence[str]) -> np.ndarray:
+    """Stack embeddings for `texts`, computing each distinct text once."""
+    return np.stack([_embed(text) for text in texts]) if texts else np.empty((0, 768))
+
+
+def _paraphrase_chunk(args: Tuple[Sequence[str], int, ParaphraseConfig, np.random.SeedSequence]) -> List[List[str]]:
+    """Generate and filter candidates for a contiguous chunk of texts.
+
+    Each text draws from its own child stream keyed by its global index, so the
+    result does not depend on how texts are chunked or scheduled.
+    """
+    texts, start, config, seed_seq = args
+    low, high = config.variants_per_example
+    owners: List[int] = []
+    candidates: List[str] = []
+    for offset, text in enumerate(texts):
+        rng = make_rng(seed_seq, start + offset)
+        num_variants = int(rng.integers(low, high + 1))
+        swapped = _simple_synonym_swap(text)
+        reversed_text = _reverse_sentence(swapped)
+        for reverse in rng.random(num_variants) < 0.3:
+            candidates.append(reversed_text if reverse else swapped)
+            owners.append(offset)
+
+    paraphrases: List[List[str]] = [[] for _ in texts]
+    if not candidates:
+        return paraphrases
+    owner_idx = np.asarray(owners)
+    base = embed_batch(list(texts))[owner_idx]
+    cand = embed_batch(candidates)
+    norms = np.linalg.norm(base, axis=1) * np.linalg.norm(cand, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sim = np.where(norms > 0, np.einsum("ij,ij->i", base, cand) / norms, 0.0)
+    text_lengths = np.array([max(len(text), 1) for text in texts])[owner_idx]
+    length_ratio = np.array([len(candidate) for candidate in candidates]) / text_lengths
+    lo, hi = config.length_ratio_bounds
+    keep = (sim >= config.similarity_threshold) & (length_ratio >= lo) & (length_ratio <= hi)
+    for i in np.flatnonzero(keep):
+        paraphrases[owners[i]].append(candidates[i])
     return paraphrases
+
+
+@instrument()
+def generate_paraphrases(
+    texts: Iterable[str],
+    config: ParaphraseConfig,
+    *,
+    n_jobs: int = 1,
+    chunk_size: int = 64,
+    rng: Optional[SeedLike] = None,
+) -> List[List[str]]:
+    """Generate synthetic paraphrases meeting similarity constraints.
+
+    Texts are processed in chunks (candidate embeddings and filters are batched
+    per chunk) and chunks can be spread over `n_jobs` processes; output is
+    identical for any `n_jobs` or `chunk_size`. `rng` (a seed or Generator)
+    overrides `config.seed`; global RNG state is never touched.
+    """
+    seed_seq = as_seed_sequence(config.seed if rng is None else rng)
+    texts = list(texts)
+    tasks = [(texts[start : start + chunk_size], start, config, seed_seq) for start in range(0, len(texts), chunk_size)]
+    if n_jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            chunks = list(pool.map(_paraphrase_chunk, tasks))
+    else:
+        chunks = [_paraphrase_chunk(task) for task in tasks]
+    return [variants for chunk in chunks for variants in chunk]
@@ -0,0 +1,179 @@
+"""Replay mixtures for continual fine-tuning tracks (e.g. `replay10`)."""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ..utils.profiling import instrument
+from .loaders import load_canonical
+from .slicing import save_panel_ids
+
+
+@dataclass
+class ReplayPlan:
+    """Which examples (and how many of their tokens) make up slice `t`'s training mix.
+
+    `*_tokens` align with `*_ids`; only the last example of each part may be
+    truncated, so `current_tokens.sum() + replay_tokens.sum()` equals the slice
+    budget whenever enough data exists.
+    """
+
+    slice_id: int
+    current_ids: np.ndarray
+    current_tokens: np.ndarray
+    replay_ids: np.ndarray
+    replay_tokens: np.ndarray
+
+    @property
+    def total_tokens(self) -> int:
+        return int(self.current_tokens.sum() + self.replay_tokens.sum())
+
+    @property
+    def replay_share(self) -> float:
+        total = self.total_tokens
+        return float(self.replay_tokens.sum() / total) if total else 0.0
+
+
+def replay_keys(ids: np.ndarray, seed: int) -> np.ndarray:
+    """Seeded pseudo-random uint64 key per ID, independent of scan order."""
+    hash_key = f"{seed:016d}"[-16:]
+    return pd.util.hash_array(np.asarray(ids, dtype=object), hash_key=hash_key, categorize=False)
+
+
+def _check_unique(ids: np.ndarray, id_column: str) -> None:
+    if len(pd.unique(ids)) != len(ids):
+        raise ValueError(
+            f"`{id_column}` must identify rows uniquely for replay planning (e.g. `hadm_id` or `note_id`, "
+            "not `subject_id`)"
+        )
+
+
+def _take_budget(tokens: np.ndarray, budget: int) -> np.ndarray:
+    """Tokens used from each row when filling `budget` in order (last row truncated)."""
+    before = np.cumsum(tokens) - tokens
+    return np.clip(budget - before, 0, tokens).astype(np.int64)
+
+
+def _scan(
+    canonical_path: Path,
+    slice_ids: Iterable[int],
+    columns: Iterable[str],
+    batch_size: int,
+) -> Iterator[pd.DataFrame]:
+    for batch in load_canonical(canonical_path, list(columns), slice_ids=slice_ids, output="batches", batch_size=batch_size):
+        yield batch.to_pandas()
+
+
+@instrument()
+def plan_replay_mixture(
+    canonical_path: Path,
+    slice_id: int,
+    *,
+    tokens_per_slice: int,
+    replay_fraction: float,
+    seed: int,
+    id_column: str = "hadm_id",
+    token_column: str = "tokens_estimate",
+    batch_size: int = 65_536,
+) -> ReplayPlan:
+    """Plan slice `slice_id`'s mix of own examples and replay from slices `< slice_id`.
+
+    Own examples are taken in stored (chronological) order until
+    `(1 - replay_fraction) * tokens_per_slice`. The replay part is a reservoir
+    sample: every earlier example gets a seeded key from `replay_keys`, and the
+    smallest-key examples are kept until the replay budget is met. Only IDs,
+    token counts and keys of the reservoir are held in memory while earlier
+    slices are streamed in batches.
+
+    `id_column` must be unique per row (a subject can have several admissions);
+    duplicates raise `ValueError` rather than double-counting tokens.
+    """
+    if not 0 <= replay_fraction < 1:
+        raise ValueError("replay_fraction must be in [0, 1)")
+    replay_budget = int(round(replay_fraction * tokens_per_slice)) if slice_id > 0 else 0
+    current_budget = tokens_per_slice - replay_budget
+    columns = (id_column, token_column)
+
+    current_ids, current_tokens = [], []
+    remaining = current_budget
+    for frame in _scan(canonical_path, [slice_id], columns, batch_size):
+        if remaining <= 0:
+            break
+        used = _take_budget(frame[token_column].to_numpy(), remaining)
+        keep = used > 0
+        current_ids.append(frame[id_column].to_numpy()[keep])
+        current_tokens.append(used[keep])
+        remaining -= int(used.sum())
+    if current_ids:
+        _check_unique(np.concatenate(current_ids), id_column)
+
+    reservoir_ids = np.array([], dtype=object)
+    reservoir_tokens = np.array([], dtype=np.int64)
+    reservoir_keys = np.array([], dtype=np.uint64)
+    if replay_budget > 0:
+        for frame in _scan(canonical_path, range(slice_id), columns, batch_size):
+            ids = frame[id_column].to_numpy()
+            reservoir_ids = np.concatenate([reservoir_ids, ids.astype(object)])
+            reservoir_tokens = np.concatenate([reservoir_tokens, frame[token_column].to_numpy(dtype=np.int64)])
+            reservoir_keys = np.concatenate([reservoir_keys, replay_keys(ids, seed)])
+            # Equal IDs get equal keys, so a duplicate is either trimmed with its twin or caught here.
+            _check_unique(reservoir_ids, id_column)
+            order = np.argsort(reservoir_keys, kind="stable")
+            # Keep the shortest smallest-key prefix that covers the replay budget.
+            covered = np.cumsum(reservoir_tokens[order]) >= replay_budget
+            cut = int(np.argmax(covered)) + 1 if covered.any() else len(order)
+            order = order[:cut]
+            reservoir_ids, reservoir_tokens, reservoir_keys = (
+                reservoir_ids[order],
+                reservoir_tokens[order],
+                reservoir_keys[order],
+            )
+
+    return ReplayPlan(
+        slice_id=slice_id,
+        current_ids=np.concatenate(current_ids) if current_ids else np.array([], dtype=object),
+        current_tokens=np.concatenate(current_tokens) if current_tokens else np.array([], dtype=np.int64),
+        replay_ids=reservoir_ids,
+        replay_tokens=_take_budget(reservoir_tokens, replay_budget),
+    )
+
+
+def iter_replay_mixture(
+    canonical_path: Path,
+    plan: ReplayPlan,
+    *,
+    columns: Optional[Iterable[str]] = None,
+    id_column: str = "hadm_id",
+    batch_size: int = 65_536,
+) -> Iterator[pd.DataFrame]:
+    """Stream the planned rows with `tokens_used` and `is_replay` columns attached."""
+    columns = list(columns) if columns else None
+    if columns is not None and id_column not in columns:
+        columns.append(id_column)
+    parts: Tuple[Tuple[Iterable[int], np.ndarray, np.ndarray, bool], ...] = (
+        ([plan.slice_id], plan.current_ids, plan.current_tokens, False),
+        (range(plan.slice_id), plan.replay_ids, plan.replay_tokens, True),
+    )
+    for slice_ids, ids, tokens, is_replay in parts:
+        if len(ids) == 0:
+            continue
+        lookup = pd.Series(tokens, index=pd.Index(ids))
+        batches = load_canonical(canonical_path, columns, slice_ids=slice_ids, output="batches", batch_size=batch_size)
+        for batch in batches:
+            frame = batch.to_pandas()
+            frame = frame[frame[id_column].isin(lookup.index)]
+            if frame.empty:
+                continue
+            frame = frame.assign(tokens_used=lookup.loc[frame[id_column]].to_numpy(), is_replay=is_replay)
+            yield frame.reset_index(drop=True)
+
+
+def save_replay_ids(plan: ReplayPlan, artifact_dir: Path, track: str) -> Path:
+    """Persist replayed IDs (for `past_members` panels) next to the slice ID lists."""
+    path = Path(artifact_dir) / f"slice_{plan.slice_id}" / "ids" / f"replay_{track}.txt"
+    save_panel_ids(path, plan.replay_ids)
+    return path
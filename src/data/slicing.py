@@ -3,12 +3,14 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Dict, Iterable, Optional, Tuple
 
 import numpy as np
 import pandas as pd
 
-from ..utils.io import write_lines
+from ..utils.io import read_lines, write_lines
+from ..utils.profiling import instrument
+from ..utils.seed import SeedLike, make_rng
 
 
 @dataclass
@@ -20,6 +22,7 @@ class SliceConfig:
     future_non_members: int = 500
 
 
+@instrument()
 def assign_temporal_slices(df: pd.DataFrame, *, total_slices: int = 8) -> pd.DataFrame:
     """Assign a `slice_id` column based on chronological order."""
     if "discharge_time" not in df.columns:
@@ -27,55 +30,136 @@ def assign_temporal_slices(df: pd.DataFrame, *, total_slices: int = 8) -> pd.Dat
 
     df = df.sort_values("discharge_time").copy()
     quantiles = np.linspace(0, 1, total_slices + 1)
-    bins = df["discharge_time"].quantile(quantiles).to_numpy()
+    bins = df["discharge_time"].quantile(quantiles).to_numpy(copy=True)
     # Ensure strictly increasing bins to avoid duplicates when data is synthetic.
     bins[-1] += pd.Timedelta(seconds=1)
     df["slice_id"] = pd.cut(df["discharge_time"], bins=bins, labels=False, include_lowest=True)
     return df
 
 
+@instrument()
 def enforce_token_budget(df: pd.DataFrame, tokens_per_slice: int) -> pd.DataFrame:
     """Trim datasets so that each slice stays under the defined token budget."""
-    df = df.sort_values(["slice_id", "discharge_time"]).copy()
-    trimmed_frames = []
-    for slice_id, group in df.groupby("slice_id"):
-        cumulative = group["tokens_estimate"].cumsum()
-        mask = cumulative <= tokens_per_slice
-        trimmed_frames.append(group.loc[mask])
-    return pd.concat(trimmed_frames, ignore_index=True)
-
-
-def build_member_panels(df: pd.DataFrame, *, config: SliceConfig, artifact_dir: str) -> Dict[int, Dict[str, np.ndarray]]:
-    """Select member/non-member panels per slice and persist ID lists."""
-    rng = np.random.default_rng(0)
-    panels: Dict[int, Dict[str, np.ndarray]] = {}
+    df = df.sort_values(["slice_id", "discharge_time"])
+    cumulative = df.groupby("slice_id", sort=False)["tokens_estimate"].cumsum()
+    return df.loc[cumulative <= tokens_per_slice].reset_index(drop=True)
 
-    global_holdout = df[df["split_tag"] == "global_holdout"] if "global_holdout" in df["split_tag"].unique() else None
 
-    for slice_id, group in df.groupby("slice_id"):
-        slice_members = group[group["split_tag"] == "train"]["subject_id"].unique()
-        if len(slice_members) == 0:
-            continue
+@dataclass
+class SliceIndex:
+    """Subject-to-slice lookup built once per dataframe.
+
+    `slice_codes[offsets[i]:offsets[i + 1]]` are the sorted slice ids in which
+    `subjects[i]` appears. Per-slice train subjects and the optional global
+    holdout pool are stored as sorted unique arrays.
+    """
+
+    subjects: np.ndarray
+    offsets: np.ndarray
+    slice_codes: np.ndarray
+    train_subjects: Dict[int, np.ndarray]
+    holdout: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "SliceIndex":
+        pairs = df[["subject_id", "slice_id"]].drop_duplicates().sort_values(["subject_id", "slice_id"])
+        subjects, counts = np.unique(pairs["subject_id"].to_numpy(), return_counts=True)
+        offsets = np.r_[0, np.cumsum(counts)]
+
+        train = df.loc[df["split_tag"] == "train", ["slice_id", "subject_id"]].drop_duplicates()
+        train_subjects = {
+            int(slice_id): np.sort(group.to_numpy()) for slice_id, group in train.groupby("slice_id")["subject_id"]
+        }
+        holdout_ids = df.loc[df["split_tag"] == "global_holdout", "subject_id"].to_numpy()
+        return cls(
+            subjects=subjects,
+            offsets=offsets,
+            slice_codes=pairs["slice_id"].to_numpy(),
+            train_subjects=train_subjects,
+            holdout=np.unique(holdout_ids) if len(holdout_ids) else None,
+        )
 
-        member_count = min(config.members, len(slice_members))
-        members = rng.choice(slice_members, size=member_count, replace=False)
+    @property
+    def first_slice(self) -> np.ndarray:
+        return self.slice_codes[self.offsets[:-1]]
+
+    @property
+    def last_slice(self) -> np.ndarray:
+        return self.slice_codes[self.offsets[1:] - 1]
+
+    def subjects_outside(self, slice_id: int) -> np.ndarray:
+        """Subjects with at least one record outside `slice_id`."""
+        spans_slices = np.diff(self.offsets) > 1
+        return self.subjects[spans_slices | (self.first_slice != slice_id)]
+
+    def subjects_after(self, slice_id: int) -> np.ndarray:
+        """Subjects with at least one record in a later slice."""
+        return self.subjects[self.last_slice > slice_id]
+
+
+def _sample(rng: np.random.Generator, pool: np.ndarray, count: int) -> np.ndarray:
+    count = min(count, len(pool))
+    return rng.choice(pool, size=count, replace=False) if count else pool[:0]
+
+
+def save_panel_ids(path: Path, values: np.ndarray) -> None:
+    """Persist a panel as `{path}.txt` (human-readable) and `{path}.npy` (fast reload).
+
+    String IDs (e.g. BHC `note_id`s) are stored as fixed-width unicode so the
+    binary copy loads without pickling.
+    """
+    values = np.asarray(values)
+    if values.dtype == object:
+        values = values.astype(str)
+    write_lines(path.with_suffix(".txt"), map(str, values))
+    np.save(path.with_suffix(".npy"), values)
+
+
+def load_panel_ids(path: Path) -> np.ndarray:
+    """Load a panel saved by `save_panel_ids`, preferring the binary copy."""
+    binary = path.with_suffix(".npy")
+    if binary.exists():
+        return np.load(binary, allow_pickle=False)
+    return np.asarray(read_lines(path.with_suffix(".txt")))
+
+
+@instrument()
+def build_member_panels(
+    df: pd.DataFrame,
+    *,
+    config: SliceConfig,
+    artifact_dir: str,
+    index: Optional[SliceIndex] = None,
+    rng: SeedLike = 0,
+    slice_ids: Optional[Iterable[int]] = None,
+) -> Dict[int, Dict[str, np.ndarray]]:
+    """Select member/non-member panels per slice and persist ID lists.
+
+    Each slice samples from its own child stream of `rng` (a seed or
+    Generator), so panels for a slice are the same whether slices are built
+    together, separately, or in parallel. `slice_ids` restricts which slices
+    are built (the whole frame still defines the non-member pools).
+    """
+    index = index or SliceIndex.from_frame(df)
+    panels: Dict[int, Dict[str, np.ndarray]] = {}
+    wanted = None if slice_ids is None else {int(slice_id) for slice_id in slice_ids}
 
-        if global_holdout is not None and not global_holdout.empty:
-            pool = global_holdout["subject_id"].unique()
-        else:
-            pool = df[df["slice_id"] != slice_id]["subject_id"].unique()
+    for slice_id in np.unique(index.slice_codes):
+        slice_id = int(slice_id)
+        if wanted is not None and slice_id not in wanted:
+            continue
+        slice_members = index.train_subjects.get(slice_id)
+        if slice_members is None or len(slice_members) == 0:
+            continue
+
+        slice_rng = make_rng(rng, slice_id)
+        members = _sample(slice_rng, slice_members, config.members)
+        pool = index.holdout if index.holdout is not None else index.subjects_outside(slice_id)
         if len(pool) == 0:
             continue
-        non_member_count = min(config.non_members, len(pool))
-        non_members = rng.choice(pool, size=non_member_count, replace=False)
-
-        past_count = min(config.past_members, len(slice_members))
-        past_members = rng.choice(slice_members, size=past_count, replace=False)
-        future_pool = df[df["slice_id"] > slice_id]["subject_id"].unique()
-        future_count = min(config.future_non_members, len(future_pool)) if len(future_pool) else 0
-        future_non_members = (
-            rng.choice(future_pool, size=future_count, replace=False) if future_count else np.array([], dtype=int)
-        )
+        non_members = _sample(slice_rng, pool, config.non_members)
+        past_members = _sample(slice_rng, slice_members, config.past_members)
+        future_non_members = _sample(slice_rng, index.subjects_after(slice_id), config.future_non_members)
 
         panels[slice_id] = {
             "members": members,
@@ -85,6 +169,6 @@ def build_member_panels(df: pd.DataFrame, *, config: SliceConfig, artifact_dir:
         }
 
         for key, values in panels[slice_id].items():
-            write_lines(Path(artifact_dir) / f"slice_{slice_id}" / "ids" / f"{key}.txt", map(str, values))
+            save_panel_ids(Path(artifact_dir) / f"slice_{slice_id}" / "ids" / f"{key}.txt", values)
 
     return panels
@@ -0,0 +1,255 @@
+"""Parallel tokenization, flat token storage, and sequence packing (notebook 03)."""
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+
+from ..utils.io import read_lines, write_lines
+from ..utils.profiling import instrument
+
+TOKENS_FILE = "tokens.bin"
+OFFSETS_FILE = "offsets.npy"
+IDS_FILE = "ids.txt"
+META_FILE = "meta.json"
+
+
+class Tokenizer(Protocol):
+    def encode_batch(self, texts: Sequence[str]) -> List[List[int]]:
+        ...
+
+
+@dataclass
+class RegexHashTokenizer:
+    """Dependency-free stand-in: regex pre-tokens hashed into a fixed vocabulary.
+
+    Deterministic across processes, so it can back tests and CPU benchmarks in
+    place of the Llama tokenizer.
+    """
+
+    vocab_size: int = 32_000
+    pattern: str = r"\w+|[^\w\s]"
+
+    def encode_batch(self, texts: Sequence[str]) -> List[List[int]]:
+        regex = re.compile(self.pattern)
+        return [
+            [
+                int.from_bytes(hashlib.blake2b(piece.encode("utf-8"), digest_size=8).digest(), "little") % self.vocab_size
+                for piece in regex.findall(text)
+            ]
+            for text in texts
+        ]
+
+
+class HFTokenizer:
+    """Picklable wrapper that loads a Hugging Face tokenizer lazily in each worker."""
+
+    def __init__(self, name_or_path: str, **kwargs: Any) -> None:
+        self.name_or_path = name_or_path
+        self.kwargs = kwargs
+        self._tokenizer = None
+
+    def __getstate__(self) -> dict:
+        return {"name_or_path": self.name_or_path, "kwargs": self.kwargs, "_tokenizer": None}
+
+    def encode_batch(self, texts: Sequence[str]) -> List[List[int]]:
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+
+            self._tokenizer = AutoTokenizer.from_pretrained(self.name_or_path, **self.kwargs)
+        return self._tokenizer(list(texts), add_special_tokens=True)["input_ids"]
+
+
+def _encode_chunk(args: Tuple[Tokenizer, Sequence[str]]) -> np.ndarray:
+    tokenizer, texts = args
+    encoded = tokenizer.encode_batch(texts)
+    lengths = np.fromiter((len(ids) for ids in encoded), dtype=np.int64, count=len(encoded))
+    flat = np.fromiter((tok for ids in encoded for tok in ids), dtype=np.int32, count=int(lengths.sum()))
+    return np.concatenate([lengths.astype(np.int32), flat]) if len(encoded) else flat
+
+
+@dataclass
+class TokenizedCorpus:
+    """Memory-mapped flat int32 token IDs with per-document offsets."""
+
+    path: Path
+    tokens: np.ndarray
+    offsets: np.ndarray
+    ids: List[str]
+
+    @classmethod
+    def open(cls, path: Path) -> "TokenizedCorpus":
+        path = Path(path)
+        meta = json.loads((path / META_FILE).read_text(encoding="utf-8"))
+        tokens = (
+            np.memmap(path / TOKENS_FILE, dtype="<i4", mode="r") if meta["tokens"] else np.empty(0, dtype="<i4")
+        )
+        return cls(path=path, tokens=tokens, offsets=np.load(path / OFFSETS_FILE), ids=read_lines(path / IDS_FILE))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def document(self, i: int) -> np.ndarray:
+        return self.tokens[self.offsets[i] : self.offsets[i + 1]]
+
+
+@instrument()
+def tokenize_corpus(
+    texts: Iterable[str],
+    ids: Iterable[Any],
+    tokenizer: Tokenizer,
+    out_dir: Path,
+    *,
+    n_jobs: int = 1,
+    chunk_size: int = 256,
+) -> TokenizedCorpus:
+    """Batch-tokenize `texts` (optionally over a process pool) into a flat store.
+
+    Chunks are encoded in parallel and appended to `tokens.bin` in input order,
+    so the result is identical for any `n_jobs`.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    texts = list(texts)
+    ids = [str(i) for i in ids]
+    if len(ids) != len(texts):
+        raise ValueError("texts and ids must align")
+
+    tasks = [(tokenizer, texts[start : start + chunk_size]) for start in range(0, len(texts), chunk_size)]
+    lengths: List[np.ndarray] = []
+    pool = ProcessPoolExecutor(max_workers=n_jobs) if n_jobs > 1 and len(tasks) > 1 else None
+    try:
+        results: Iterator[np.ndarray] = pool.map(_encode_chunk, tasks) if pool else map(_encode_chunk, tasks)
+        with (out_dir / TOKENS_FILE).open("wb") as handle:
+            # Each chunk result is `[lengths..., flat tokens...]`.
+            for (_, chunk), packed in zip(tasks, results):
+                lengths.append(packed[: len(chunk)].astype(np.int64))
+                handle.write(packed[len(chunk) :].astype("<i4").tobytes())
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    all_lengths = np.concatenate(lengths) if lengths else np.zeros(0, dtype=np.int64)
+    np.save(out_dir / OFFSETS_FILE, np.r_[0, np.cumsum(all_lengths)].astype(np.int64))
+    write_lines(out_dir / IDS_FILE, ids)
+    meta = {"documents": len(ids), "tokens": int(all_lengths.sum())}
+    (out_dir / META_FILE).write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    return TokenizedCorpus.open(out_dir)
+
+
+class _FirstFitTree:
+    """Max-segment-tree over bin capacities: leftmost bin with room in O(log n)."""
+
+    def __init__(self, size: int, capacity: int) -> None:
+        self.leaves = 1
+        while self.leaves < size:
+            self.leaves *= 2
+        self.tree = [0] * self.leaves + [capacity] * size + [0] * (self.leaves - size)
+        for node in range(self.leaves - 1, 0, -1):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def place(self, need: int) -> int:
+        node = 1
+        while node < self.leaves:
+            node = 2 * node if self.tree[2 * node] >= need else 2 * node + 1
+        self.tree[node] -= need
+        leaf = node - self.leaves
+        node //= 2
+        while node:
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+            node //= 2
+        return leaf
+
+
+@dataclass
+class PackingResult:
+    """Sequences packed into windows; `bin_items[bin_offsets[b]:bin_offsets[b+1]]` are documents in window b."""
+
+    max_context_tokens: int
+    bin_offsets: np.ndarray
+    bin_items: np.ndarray
+    bin_tokens: np.ndarray
+    truncated_tokens: int
+
+    @property
+    def num_sequences(self) -> int:
+        return len(self.bin_tokens)
+
+    @property
+    def packed_tokens(self) -> int:
+        return int(self.bin_tokens.sum())
+
+    @property
+    def padding_tokens(self) -> int:
+        return self.num_sequences * self.max_context_tokens - self.packed_tokens
+
+    @property
+    def efficiency(self) -> float:
+        capacity = self.num_sequences * self.max_context_tokens
+        return self.packed_tokens / capacity if capacity else 0.0
+
+    @property
+    def average_tokens_per_sample(self) -> float:
+        return self.packed_tokens / self.num_sequences if self.num_sequences else 0.0
+
+    def window(self, b: int) -> np.ndarray:
+        return self.bin_items[self.bin_offsets[b] : self.bin_offsets[b + 1]]
+
+    def report_to(self, tracker: Any) -> None:
+        """Record real packed token counts on a `modeling.train.TokenBudgetTracker`."""
+        tracker.record_packing(
+            packed_tokens=self.packed_tokens,
+            padding_tokens=self.padding_tokens,
+            sequences=self.num_sequences,
+        )
+
+
+@instrument()
+def pack_sequences(lengths: np.ndarray, max_context_tokens: int) -> PackingResult:
+    """First-fit-decreasing bin packing of documents into `max_context_tokens` windows.
+
+    Documents longer than a window are truncated to it (as with
+    `truncation=True`); the dropped tokens are reported in `truncated_tokens`.
+    """
+    if max_context_tokens <= 0:
+        raise ValueError("max_context_tokens must be positive")
+    lengths = np.asarray(lengths, dtype=np.int64)
+    clipped = np.minimum(lengths, max_context_tokens)
+    order = np.argsort(-clipped, kind="stable")
+    order = order[clipped[order] > 0]
+
+    tree = _FirstFitTree(max(len(order), 1), max_context_tokens)
+    assignment = np.empty(len(order), dtype=np.int64)
+    for position, doc in enumerate(order):
+        assignment[position] = tree.place(int(clipped[doc]))
+
+    num_bins = int(assignment.max()) + 1 if len(assignment) else 0
+    by_bin = np.argsort(assignment, kind="stable")
+    bin_items = order[by_bin]
+    counts = np.bincount(assignment, minlength=num_bins)
+    bin_tokens = np.bincount(assignment, weights=clipped[order], minlength=num_bins).astype(np.int64)
+    return PackingResult(
+        max_context_tokens=max_context_tokens,
+        bin_offsets=np.r_[0, np.cumsum(counts)].astype(np.int64),
+        bin_items=bin_items,
+        bin_tokens=bin_tokens,
+        truncated_tokens=int((lengths - clipped).sum()),
+    )
+
+
+def pack_corpus(corpus: TokenizedCorpus, max_context_tokens: int, tracker: Optional[Any] = None) -> PackingResult:
+    """Pack a tokenized corpus and optionally report real counts to a tracker."""
+    result = pack_sequences(corpus.lengths, max_context_tokens)
+    if tracker is not None:
+        result.report_to(tracker)
+    return result
@@ -1,31 +1,162 @@
 """Bootstrap utilities."""
 from __future__ import annotations
 
-from typing import Callable, Dict, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Sequence, Tuple
 
 import numpy as np
 
+from ..utils.profiling import instrument
+from ..utils.seed import SeedLike, make_rng, spawn_seeds
+from .metrics import operating_index, operating_mask, roc_auc, tie_block_starts, tied_roc_counts
 
+RANK_METRICS: Tuple[str, ...] = ("auc", "tpr_at_fpr", "threshold_at_fpr")
+
+
+def _percentile_ci(values: np.ndarray, confidence: float, axis: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    lower = np.nanpercentile(values, (1 - confidence) / 2 * 100, axis=axis)
+    upper = np.nanpercentile(values, (1 + confidence) / 2 * 100, axis=axis)
+    return lower, upper
+
+
+@instrument()
 def bootstrap_metric(
     labels: np.ndarray,
     scores: np.ndarray,
     metric_fn: Callable[[np.ndarray, np.ndarray], float],
     *,
     n_resamples: int = 2000,
-    seed: int = 17,
+    seed: SeedLike = 17,
     confidence: float = 0.95,
 ) -> Dict[str, float]:
-    rng = np.random.default_rng(seed)
+    rng = make_rng(seed)
     values = []
     n = len(labels)
     for _ in range(n_resamples):
         idx = rng.integers(0, n, size=n)
         values.append(metric_fn(labels[idx], scores[idx]))
     values_arr = np.array(values)
-    lower = np.percentile(values_arr, (1 - confidence) / 2 * 100)
-    upper = np.percentile(values_arr, (1 + confidence) / 2 * 100)
+    lower, upper = _percentile_ci(values_arr, confidence)
     return {
         "estimate": float(metric_fn(labels, scores)),
         "ci_low": float(lower),
         "ci_high": float(upper),
     }
+
+
+class _SortedScores:
+    """Scores sorted once (descending) and grouped into tied blocks.
+
+    The ROC points, AUC and operating points come from the same helpers as
+    `metrics.roc_summaries`, so bootstrap estimates match the point metrics.
+    """
+
+    def __init__(self, labels: np.ndarray, scores: np.ndarray) -> None:
+        self.order = np.argsort(-scores, kind="mergesort")
+        sorted_scores = scores[self.order]
+        self.positive = labels[self.order].astype(bool)
+        self.group_starts = tie_block_starts(sorted_scores)
+        self.thresholds = np.r_[np.inf, sorted_scores[self.group_starts]]
+
+    def metrics(self, counts: np.ndarray, target_fprs: Sequence[float]) -> Dict[str, np.ndarray]:
+        """Rank metrics for a (resamples, n) matrix of per-example multiplicities.
+
+        Resamples without both classes yield NaN.
+        """
+        cum_neg, cum_pos = tied_roc_counts(self.positive, counts[:, self.order], self.group_starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fpr, tpr = cum_neg / cum_neg[:, -1:], cum_pos / cum_pos[:, -1:]
+        degenerate = np.isnan(fpr[:, -1]) | np.isnan(tpr[:, -1])
+        out = {"auc": np.where(degenerate, np.nan, roc_auc(fpr, tpr))}
+
+        rows = np.arange(len(counts))
+        mask = operating_mask(cum_neg, cum_pos)
+        for target in target_fprs:
+            idx = operating_index(fpr, target, mask)
+            out[f"tpr@{target}"] = np.where(degenerate, np.nan, tpr[rows, idx])
+            out[f"threshold@{target}"] = np.where(degenerate, np.nan, self.thresholds[idx])
+        return out
+
+
+def _resample_counts(rng: np.random.Generator, n: int, size: int, method: str) -> np.ndarray:
+    if method == "poisson":
+        return rng.poisson(1.0, size=(size, n))
+    idx = rng.integers(0, n, size=(size, n))
+    flat = idx + (np.arange(size) * n)[:, None]
+    return np.bincount(flat.ravel(), minlength=size * n).reshape(size, n)
+
+
+def _bootstrap_shard(args: Tuple) -> Dict[str, np.ndarray]:
+    sorted_scores, n, size, seed_seq, method, target_fprs = args
+    rng = np.random.default_rng(seed_seq)
+    return sorted_scores.metrics(_resample_counts(rng, n, size, method), target_fprs)
+
+
+@instrument()
+def bootstrap_rank_metrics(
+    labels: np.ndarray,
+    scores: np.ndarray,
+    *,
+    metrics: Iterable[str] = RANK_METRICS,
+    target_fprs: Sequence[float] = (0.01,),
+    n_resamples: int = 2000,
+    seed: SeedLike = 17,
+    confidence: float = 0.95,
+    method: str = "multinomial",
+    shard_size: int = 250,
+    n_jobs: int = 1,
+) -> Dict[str, Dict[str, float]]:
+    """Batched bootstrap for AUC, TPR@FPR and threshold@FPR.
+
+    Scores are sorted once; each resample is a row of per-example counts
+    (`multinomial` index draws or `poisson` weights) evaluated in NumPy.
+    Resamples are split into fixed shards of `shard_size`, each with its own
+    `SeedSequence` child of `seed` (an int or Generator), so results are
+    identical for any `n_jobs`.
+    Keys are `auc`, `tpr@{fpr}` and `threshold@{fpr}`, each mapping to the same
+    `estimate`/`ci_low`/`ci_high` dict returned by `bootstrap_metric`.
+    """
+    metrics = tuple(metrics)
+    unknown = set(metrics) - set(RANK_METRICS)
+    if unknown:
+        raise ValueError(f"Unsupported rank metrics: {sorted(unknown)}")
+    if method not in {"multinomial", "poisson"}:
+        raise ValueError("method must be 'multinomial' or 'poisson'")
+    if shard_size <= 0:
+        raise ValueError("shard_size must be positive")
+
+    labels = np.asarray(labels)
+    scores = np.asarray(scores, dtype=np.float64)
+    n = len(labels)
+    sorted_scores = _SortedScores(labels, scores)
+    target_fprs = tuple(target_fprs)
+
+    sizes = [min(shard_size, n_resamples - start) for start in range(0, n_resamples, shard_size)]
+    seed_seqs = spawn_seeds(seed, len(sizes))
+    tasks = [(sorted_scores, n, size, seed_seq, method, target_fprs) for size, seed_seq in zip(sizes, seed_seqs)]
+    if n_jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            shards = list(pool.map(_bootstrap_shard, tasks))
+    else:
+        shards = [_bootstrap_shard(task) for task in tasks]
+
+    point = sorted_scores.metrics(np.ones((1, n), dtype=np.int64), target_fprs)
+    keep = {"auc"} if "auc" in metrics else set()
+    for target in target_fprs:
+        if "tpr_at_fpr" in metrics:
+            keep.add(f"tpr@{target}")
+        if "threshold_at_fpr" in metrics:
+            keep.add(f"threshold@{target}")
+
+    results: Dict[str, Dict[str, float]] = {}
+    for key in point:
+        if key not in keep:
+            continue
+        values = np.concatenate([shard[key] for shard in shards])
+        lower, upper = _percentile_ci(values, confidence)
+        results[key] = {
+            "estimate": float(point[key][0]),
+            "ci_low": float(lower),
+            "ci_high": float(upper),
+        }
+    return results
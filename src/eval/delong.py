@@ -1,67 +1,89 @@
-"""DeLong test implementation adapted for educational use."""
+"""DeLong test implementation adapted for educational use.
+
+Uses the fast O(N log N) formulation of Sun & Xu (2014): midranks of the
+positive, negative and pooled scores give every AUC and the full covariance
+matrix across attacks scored on the same examples.
+"""
 from __future__ import annotations
 
 import math
+from dataclasses import dataclass
 from typing import Tuple
 
 import numpy as np
+from scipy.stats import norm, rankdata
 
-
-def _compute_midrank(x: np.ndarray) -> np.ndarray:
-    J = x.shape[0]
-    sort_idx = np.argsort(x)
-    sorted_x = x[sort_idx]
-    midranks = np.zeros(J, dtype=float)
-
-    i = 0
-    while i < J:
-        j = i
-        while j < J and sorted_x[j] == sorted_x[i]:
-            j += 1
-        midrank = 0.5 * (i + j - 1)
-        midranks[i:j] = midrank
-        i = j
-    out = np.empty(J, dtype=float)
-    out[sort_idx] = midranks + 1
-    return out
+from ..utils.profiling import instrument
 
 
-def _delong_covariance(midranks: np.ndarray, label_positives: int, label_negatives: int) -> Tuple[np.ndarray, np.ndarray]:
-    pos = midranks[:label_positives]
-    neg = midranks[label_positives:]
-
-    V10 = (pos - pos.mean()) / label_negatives
-    V01 = (neg - neg.mean()) / label_positives
-    return V10, V01
+def _compute_midrank(x: np.ndarray) -> np.ndarray:
+    """1-based midranks along the last axis (ties share their average rank)."""
+    return rankdata(x, method="average", axis=-1)
+
+
+@dataclass
+class DeLongResult:
+    aucs: np.ndarray
+    covariance: np.ndarray
+
+
+@instrument()
+def delong_covariance(labels: np.ndarray, scores: np.ndarray) -> DeLongResult:
+    """AUCs and their DeLong covariance for a (K attacks, N examples) score matrix."""
+    labels = np.asarray(labels).astype(bool)
+    scores = np.atleast_2d(np.asarray(scores, dtype=np.float64))
+    if scores.shape[1] != labels.shape[0]:
+        raise ValueError("scores must be (attacks, examples) aligned with labels")
+    m = int(labels.sum())
+    n = labels.shape[0] - m
+    if m == 0 or n == 0:
+        raise ValueError("DeLong requires both positive and negative examples")
+
+    positives = scores[:, labels]
+    negatives = scores[:, ~labels]
+    tx = _compute_midrank(positives)
+    ty = _compute_midrank(negatives)
+    tz = _compute_midrank(np.concatenate([positives, negatives], axis=1))
+
+    aucs = tz[:, :m].sum(axis=1) / (m * n) - (m + 1.0) / (2.0 * n)
+    v01 = (tz[:, :m] - tx) / n
+    v10 = 1.0 - (tz[:, m:] - ty) / m
+    sx = np.atleast_2d(np.cov(v01))
+    sy = np.atleast_2d(np.cov(v10))
+    return DeLongResult(aucs=aucs, covariance=sx / m + sy / n)
 
 
 def auc_covariance(labels: np.ndarray, scores: np.ndarray) -> Tuple[float, float]:
-    order = np.argsort(-scores)
-    labels = labels[order]
-    scores = scores[order]
+    """Return the AUC of a single score vector and its DeLong variance."""
+    result = delong_covariance(labels, scores)
+    return float(result.aucs[0]), float(result.covariance[0, 0])
 
-    label_positives = int(labels.sum())
-    label_negatives = len(labels) - label_positives
 
-    midranks = _compute_midrank(scores)
-    auc_value = (midranks[:label_positives].sum() - label_positives * (label_positives + 1) / 2) / (
-        label_positives * label_negatives
-    )
+@instrument()
+def pairwise_delong(labels: np.ndarray, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray, DeLongResult]:
+    """All pairwise DeLong tests from one covariance computation.
 
-    V10, V01 = _delong_covariance(midranks, label_positives, label_negatives)
-    s10 = np.cov(V10, bias=True)
-    s01 = np.cov(V01, bias=True)
-    return float(auc_value), float(s10 / label_positives + s01 / label_negatives)
+    Returns `(z, p, result)` where `z[i, j]` compares attack `i` against `j`;
+    pairs with zero variance get `z = 0, p = 1` like `delong_test`.
+    """
+    result = delong_covariance(labels, scores)
+    diag = np.diag(result.covariance)
+    variance = diag[:, None] + diag[None, :] - 2 * result.covariance
+    diff = result.aucs[:, None] - result.aucs[None, :]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = np.where(variance > 0, diff / np.sqrt(np.maximum(variance, 0)), 0.0)
+    p = np.where(variance > 0, 2 * norm.sf(np.abs(z)), 1.0)
+    return z, p, result
 
 
 def delong_test(labels: np.ndarray, scores_a: np.ndarray, scores_b: np.ndarray) -> Tuple[float, float]:
-    """Return z-statistic and p-value comparing two ROC AUCs."""
-    auc_a, var_a = auc_covariance(labels, scores_a)
-    auc_b, var_b = auc_covariance(labels, scores_b)
-
-    covariance = var_a + var_b
-    if covariance == 0:
+    """Return z-statistic and p-value comparing two ROC AUCs on the same examples."""
+    result = delong_covariance(labels, np.vstack([scores_a, scores_b]))
+    auc_a, auc_b = result.aucs
+    cov = result.covariance
+    variance = cov[0, 0] + cov[1, 1] - 2 * cov[0, 1]
+    if variance <= 0:
         return 0.0, 1.0
-    z_score = (auc_a - auc_b) / math.sqrt(covariance)
+    z_score = (auc_a - auc_b) / math.sqrt(variance)
     p_value = 2 * (1 - 0.5 * (1 + math.erf(abs(z_score) / math.sqrt(2))))
     return float(z_score), float(p_value)
@@ -2,30 +2,226 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Dict, Iterable, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import numpy as np
-from sklearn.metrics import auc, precision_recall_curve, roc_auc_score, roc_curve
+
+from ..utils.profiling import instrument
+
+
+@dataclass
+class RocSummary:
+    """ROC/PR statistics for one attack, built from a single sort of its scores.
+
+    Points follow sklearn's `roc_curve(..., drop_intermediate=False)`: a leading
+    `(0, 0)` point at threshold `inf`, then one point per distinct score in
+    descending order. Operating points are chosen among the points sklearn's
+    default `roc_curve` keeps (`operating_mask`), taking the first whose FPR
+    reaches the target, so `tpr_at`/`threshold_at` match the sklearn-based
+    metrics reported before.
+    """
+
+    fpr: np.ndarray
+    tpr: np.ndarray
+    thresholds: np.ndarray
+    n_pos: int
+    n_neg: int
+
+    @classmethod
+    def from_scores(cls, labels: np.ndarray, scores: np.ndarray) -> "RocSummary":
+        return roc_summaries(labels, np.asarray(scores)[None, :])[0]
+
+    @property
+    def auc(self) -> float:
+        return float(roc_auc(self.fpr, self.tpr))
+
+    @property
+    def precision(self) -> np.ndarray:
+        """Precision at each threshold after the leading `inf` point."""
+        tps = self.tpr[1:] * self.n_pos
+        fps = self.fpr[1:] * self.n_neg
+        return tps / (tps + fps)
+
+    @property
+    def pr_auc(self) -> float:
+        """Step-wise PR-AUC (average precision)."""
+        return float(np.sum(np.diff(self.tpr) * self.precision))
+
+    def pr_curve(self) -> Tuple[np.ndarray, np.ndarray]:
+        """`(recall, precision)` ordered like `precision_recall_curve`."""
+        recall = np.r_[self.tpr[1:][::-1], 0.0]
+        precision = np.r_[self.precision[::-1], 1.0]
+        return recall, precision
+
+    @property
+    def operating_mask(self) -> np.ndarray:
+        # Rates are exact count ratios, so rounding recovers the cumulative counts.
+        return operating_mask(np.rint(self.fpr * self.n_neg), np.rint(self.tpr * self.n_pos))
+
+    def _operating_index(self, target_fprs: Sequence[float]) -> np.ndarray:
+        mask = self.operating_mask
+        return np.array([operating_index(self.fpr, target, mask) for target in target_fprs], dtype=np.int64)
+
+    def tpr_at(self, target_fprs: Sequence[float]) -> np.ndarray:
+        return self.tpr[self._operating_index(target_fprs)]
+
+    def threshold_at(self, target_fprs: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+        idx = self._operating_index(target_fprs)
+        return self.thresholds[idx], self.tpr[idx]
+
+    def curve(self, max_points: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """ROC points, optionally thinned to about `max_points` (see `downsample_roc`)."""
+        return downsample_roc(self.fpr, self.tpr, max_points)
+
+
+def tie_block_starts(sorted_scores: np.ndarray) -> np.ndarray:
+    """Start index of each block of tied values in a descending-sorted score vector."""
+    return np.flatnonzero(np.r_[True, sorted_scores[1:] != sorted_scores[:-1]])
+
+
+def tied_roc_counts(
+    positive: np.ndarray, weights: np.ndarray, starts: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Cumulative `(negatives, positives)` counted down the score order, one entry per tied block.
+
+    `positive` holds the labels in descending score order, `starts` comes from
+    `tie_block_starts`, and `weights` is a vector or a (rows, n) matrix of
+    per-example multiplicities in the same order (bootstrap resamples). The
+    leading `(0, 0)` entry is included.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    cum_pos = np.cumsum(np.add.reduceat(np.where(positive, weights, 0.0), starts, axis=-1), axis=-1)
+    cum_neg = np.cumsum(np.add.reduceat(np.where(positive, 0.0, weights), starts, axis=-1), axis=-1)
+    zeros = np.zeros(cum_pos.shape[:-1] + (1,))
+    return np.concatenate([zeros, cum_neg], axis=-1), np.concatenate([zeros, cum_pos], axis=-1)
+
+
+def tied_roc_points(
+    positive: np.ndarray, weights: np.ndarray, starts: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """`(fpr, tpr)` with the leading `(0, 0)` point, one point per tied block.
+
+    Arguments are those of `tied_roc_counts`. Rows without both classes come
+    out NaN.
+    """
+    cum_neg, cum_pos = tied_roc_counts(positive, weights, starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return cum_neg / cum_neg[..., -1:], cum_pos / cum_pos[..., -1:]
+
+
+def operating_mask(cum_neg: np.ndarray, cum_pos: np.ndarray) -> np.ndarray:
+    """ROC points kept by sklearn's `roc_curve(..., drop_intermediate=True)`.
+
+    Works along the last axis on `tied_roc_counts` output. The leading point,
+    the first and last scored points, and every point where the step in
+    `(negatives, positives)` changes are kept. Blocks with zero weight (absent
+    from a bootstrap resample) add no step and are never kept, so each row
+    matches `roc_curve` on the resampled data.
+    """
+    d_neg = np.diff(cum_neg, axis=-1)
+    d_pos = np.diff(cum_pos, axis=-1)
+    present = (d_neg != 0) | (d_pos != 0)
+    steps = d_neg.shape[-1]
+    # Index of the next present step after each step (`steps` when there is none).
+    following = np.where(present, np.arange(steps), steps)
+    following = np.minimum.accumulate(following[..., ::-1], axis=-1)[..., ::-1]
+    following = np.concatenate([following[..., 1:], np.full(following.shape[:-1] + (1,), steps)], axis=-1)
+    has_next = following < steps
+    nxt = np.minimum(following, steps - 1)
+    changes = (np.take_along_axis(d_neg, nxt, axis=-1) != d_neg) | (np.take_along_axis(d_pos, nxt, axis=-1) != d_pos)
+    first = present & (np.cumsum(present, axis=-1) == 1)
+    keep = present & (first | ~has_next | changes)
+    return np.concatenate([np.ones(keep.shape[:-1] + (1,), dtype=bool), keep], axis=-1)
+
+
+def roc_auc(fpr: np.ndarray, tpr: np.ndarray) -> np.ndarray:
+    """Trapezoidal AUC along the last axis (tied blocks count half, as in Mann-Whitney)."""
+    return np.sum(np.diff(fpr, axis=-1) * (tpr[..., 1:] + tpr[..., :-1]) / 2, axis=-1)
+
+
+def operating_index(fpr: np.ndarray, target_fpr: float, mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """Index of the first ROC point whose FPR reaches `target_fpr` (`searchsorted(..., side="left")`).
+
+    With `mask` (e.g. `operating_mask`), only those points are candidates; the
+    last point is used when none reaches the target. Works along the last
+    axis, so a (rows, points) FPR matrix gives one index per row.
+    """
+    reached = fpr >= target_fpr
+    if mask is not None:
+        reached = reached & mask
+    return np.where(reached.any(axis=-1), reached.argmax(axis=-1), fpr.shape[-1] - 1)
+
+
+def downsample_roc(
+    fpr: np.ndarray, tpr: np.ndarray, max_points: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Thin an FPR-ascending ROC curve to about `max_points` on a log-FPR grid.
+
+    Downsampling keeps actual curve points (no interpolation) and spaces them
+    evenly in log-FPR, so the low-FPR region stays resolved.
+    """
+    fpr, tpr = np.asarray(fpr), np.asarray(tpr)
+    positive = fpr[fpr > 0]
+    if max_points is None or len(fpr) <= max_points or len(positive) == 0:
+        return fpr, tpr
+    grid = np.geomspace(positive.min(), fpr[-1], max(max_points - 2, 1))
+    # Take the highest-TPR point at or below each grid FPR.
+    idx = np.searchsorted(fpr, grid, side="right") - 1
+    keep = np.unique(np.r_[0, idx, len(fpr) - 1])
+    return fpr[keep], tpr[keep]
+
+
+@instrument()
+def roc_summaries(labels: np.ndarray, scores: np.ndarray) -> List[RocSummary]:
+    """Build a `RocSummary` per row of a (attacks, examples) score matrix with one argsort."""
+    labels = np.asarray(labels).astype(bool)
+    scores = np.atleast_2d(np.asarray(scores, dtype=np.float64))
+    if scores.shape[1] != labels.shape[0]:
+        raise ValueError("scores must be (attacks, examples) aligned with labels")
+    n_pos = int(labels.sum())
+    n_neg = labels.shape[0] - n_pos
+    if n_pos == 0 or n_neg == 0:
+        raise ValueError("ROC statistics need both member and non-member examples")
+
+    order = np.argsort(-scores, axis=1, kind="mergesort")
+    sorted_scores = np.take_along_axis(scores, order, axis=1)
+    ones = np.ones(labels.shape[0])
+
+    summaries = []
+    for row_scores, row_positive in zip(sorted_scores, labels[order]):
+        starts = tie_block_starts(row_scores)
+        fpr, tpr = tied_roc_points(row_positive, ones, starts)
+        summaries.append(
+            RocSummary(
+                fpr=fpr,
+                tpr=tpr,
+                thresholds=np.r_[np.inf, row_scores[starts]],
+                n_pos=n_pos,
+                n_neg=n_neg,
+            )
+        )
+    return summaries
 
 
 def auc_metrics(labels: np.ndarray, scores: np.ndarray) -> Dict[str, float]:
-    roc_auc = roc_auc_score(labels, scores)
-    fpr, tpr, _ = roc_curve(labels, scores)
-    pr, rc, _ = precision_recall_curve(labels, scores)
+    summary = RocSummary.from_scores(labels, scores)
     return {
-        "auc": float(roc_auc),
-        "roc_curve": (fpr, tpr),
-        "pr_curve": (rc, pr),
+        "auc": summary.auc,
+        "pr_auc": summary.pr_auc,
+        "roc_curve": (summary.fpr, summary.tpr),
+        "pr_curve": summary.pr_curve(),
     }
 
 
+def _single_class(labels: np.ndarray) -> bool:
+    return len(np.unique(np.asarray(labels))) < 2
+
+
 def tpr_at_fpr(labels: np.ndarray, scores: np.ndarray, target_fpr: float) -> float:
-    fpr, tpr, thresholds = roc_curve(labels, scores)
-    if len(fpr) == 0:
-        return 0.0
-    idx = np.searchsorted(fpr, target_fpr, side="left")
-    idx = min(idx, len(tpr) - 1)
-    return float(tpr[idx])
+    """TPR at the first operating point reaching `target_fpr`; NaN without both classes."""
+    if _single_class(labels):
+        return float("nan")
+    return float(RocSummary.from_scores(labels, scores).tpr_at([target_fpr])[0])
 
 
 @dataclass
@@ -34,6 +230,7 @@ class CalibrationResult:
     bin_counts: np.ndarray
 
 
+@instrument()
 def expected_calibration_error(labels: np.ndarray, probs: np.ndarray, *, bins: int = 15) -> CalibrationResult:
     bin_edges = np.linspace(0.0, 1.0, bins + 1)
     indices = np.digitize(probs, bin_edges, right=True)
@@ -51,9 +248,8 @@ def expected_calibration_error(labels: np.ndarray, probs: np.ndarray, *, bins: i
 
 
 def threshold_at_fpr(labels: np.ndarray, scores: np.ndarray, target_fpr: float) -> Tuple[float, float]:
-    fpr, tpr, thresholds = roc_curve(labels, scores)
-    if len(fpr) == 0:
-        return 0.0, 0.0
-    idx = np.searchsorted(fpr, target_fpr, side="left")
-    idx = min(idx, len(fpr) - 1)
-    return thresholds[idx], tpr[idx]
+    """`(threshold, tpr)` at the first operating point reaching `target_fpr`; NaNs without both classes."""
+    if _single_class(labels):
+        return float("nan"), float("nan")
+    thresholds, tpr = RocSummary.from_scores(labels, scores).threshold_at([target_fpr])
+    return float(thresholds[0]), float(tpr[0])
@@ -1,10 +1,12 @@
 """Log-probability utilities used for attack features."""
 from __future__ import annotations
 
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 
 import numpy as np
 
+from ..utils.profiling import instrument
+
 
 def log_softmax(logits: np.ndarray) -> np.ndarray:
     logits = logits - logits.max(axis=-1, keepdims=True)
@@ -12,27 +14,102 @@ def log_softmax(logits: np.ndarray) -> np.ndarray:
     return logits - logsumexp
 
 
-def token_level_stats(logits: np.ndarray, target_ids: np.ndarray, top_k: Tuple[int, ...] = (1, 5, 10, 20)) -> Dict[str, np.ndarray]:
-    """Compute per-token log probability, entropy, and top-k hits."""
+def _gather_targets(values: np.ndarray, target_ids: np.ndarray) -> np.ndarray:
+    """Pick `values[b, t, target_ids[b, t]]` without materializing index grids."""
+    return np.take_along_axis(values, target_ids[..., None], axis=-1)[..., 0]
+
+
+def _win_k_from_rank(target_rank: np.ndarray, top_k: Tuple[int, ...]) -> Dict[str, np.ndarray]:
+    """A target is inside the top-k when fewer than k logits beat it."""
+    return {f"win@{k}": target_rank < k for k in top_k}
+
+
+def _streaming_token_stats(
+    logits: np.ndarray,
+    target_ids: np.ndarray,
+    top_k: Tuple[int, ...],
+    vocab_chunk_size: int,
+) -> Dict[str, np.ndarray]:
+    """Single pass over vocab chunks with an online logsumexp.
+
+    Keeps, per token, the running max `m`, `s = sum(exp(x - m))` and
+    `t = sum(exp(x - m) * (x - m))` so that `logZ = m + log(s)`,
+    `entropy = log(s) - t / s` and `max_prob = 1 / s` once the sweep ends.
+    """
+    prefix = target_ids.shape
+    vocab = logits.shape[-1]
+    target_logit = _gather_targets(logits, target_ids).astype(np.float64)
+
+    running_max = np.full(prefix, -np.inf)
+    sum_exp = np.zeros(prefix)
+    sum_weighted = np.zeros(prefix)
+    target_rank = np.zeros(prefix, dtype=np.int64)
+
+    for start in range(0, vocab, vocab_chunk_size):
+        chunk = np.asarray(logits[..., start : start + vocab_chunk_size], dtype=np.float64)
+        target_rank += (chunk > target_logit[..., None]).sum(axis=-1)
+
+        new_max = np.maximum(running_max, chunk.max(axis=-1))
+        # First chunk: nothing accumulated yet, so avoid `-inf * 0`.
+        shift = np.where(np.isneginf(running_max), 0.0, running_max - new_max)
+        scale = np.where(np.isneginf(running_max), 0.0, np.exp(shift))
+        # Re-express the accumulated terms relative to the new max before adding the chunk.
+        sum_weighted = scale * (sum_weighted + shift * sum_exp)
+        sum_exp = scale * sum_exp
+
+        centered = chunk - new_max[..., None]
+        weights = np.exp(centered)
+        sum_exp += weights.sum(axis=-1)
+        sum_weighted += (weights * centered).sum(axis=-1)
+        running_max = new_max
+
+    log_sum = np.log(sum_exp)
+    return {
+        "nll": running_max + log_sum - target_logit,
+        "entropy": log_sum - sum_weighted / sum_exp,
+        "max_prob": 1.0 / sum_exp,
+        "target_rank": target_rank,
+        **_win_k_from_rank(target_rank, top_k),
+    }
+
+
+@instrument()
+def token_level_stats(
+    logits: np.ndarray,
+    target_ids: np.ndarray,
+    top_k: Tuple[int, ...] = (1, 5, 10, 20),
+    *,
+    vocab_chunk_size: Optional[int] = None,
+    return_log_probs: bool = True,
+) -> Dict[str, np.ndarray]:
+    """Compute per-token log probability, entropy, and top-k hits.
+
+    Win@k is derived from the target rank (number of logits strictly greater
+    than the target logit). When `vocab_chunk_size` is set the vocabulary is
+    streamed in chunks and no (batch, seq, vocab) intermediate is built, so the
+    dense `log_probs` entry is omitted from the result; pass
+    `return_log_probs=False` to drop it from the dense path as well (e.g. when
+    writing to a `token_store.TokenStatsWriter`).
+    """
     if logits.shape[:-1] != target_ids.shape:
         raise ValueError("logits and target_ids must align on prefix dimensions")
 
+    if vocab_chunk_size is not None:
+        if vocab_chunk_size <= 0:
+            raise ValueError("vocab_chunk_size must be positive")
+        return _streaming_token_stats(logits, target_ids, top_k, vocab_chunk_size)
+
     log_probs = log_softmax(logits)
-    batch_indices = np.arange(target_ids.shape[0])[:, None]
-    token_indices = np.arange(target_ids.shape[1])[None, :]
-    nll = -log_probs[batch_indices, token_indices, target_ids]
-    max_prob = np.exp(log_probs.max(axis=-1))
-    entropy = -np.sum(np.exp(log_probs) * log_probs, axis=-1)
-
-    win_k = {}
-    sorted_indices = np.argsort(-log_probs, axis=-1)
-    for k in top_k:
-        hits = sorted_indices[:, :, :k] == target_ids[..., None]
-        win_k[f"win@{k}"] = hits.any(axis=-1)
-    return {
-        "nll": nll,
-        "entropy": entropy,
-        "max_prob": np.exp(log_probs.max(axis=-1)),
-        "log_probs": log_probs,
-        **win_k,
+    probs = np.exp(log_probs)
+    target_log_probs = _gather_targets(log_probs, target_ids)
+    target_rank = (log_probs > target_log_probs[..., None]).sum(axis=-1)
+    stats = {
+        "nll": -target_log_probs,
+        "entropy": -np.sum(probs * log_probs, axis=-1),
+        "max_prob": probs.max(axis=-1),
+        "target_rank": target_rank,
+        **_win_k_from_rank(target_rank, top_k),
     }
+    if return_log_probs:
+        stats["log_probs"] = log_probs
+    return stats
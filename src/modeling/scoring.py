@@ -0,0 +1,264 @@
+"""Scoring driver: ID panels + canonical text -> per-token statistics on disk."""
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+import queue
+import shutil
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Protocol, Sequence, Tuple, Union
+
+import numpy as np
+from scipy import sparse
+
+from ..utils.profiling import instrument
+from .logprobs import token_level_stats
+from .token_store import META_FILE, TokenStatsStore, TokenStatsWriter
+
+PANELS_FILE = "panels.json"
+FINGERPRINT_FILE = "inputs.fingerprint"
+
+
+class ScoringBackend(Protocol):
+    def logits(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        """Return `(batch, seq, vocab)` next-token logits for right-padded inputs."""
+        ...
+
+
+def bigram_counts(sequences: Iterable[np.ndarray], vocab_size: int) -> sparse.csr_matrix:
+    """Sparse `(vocab, vocab)` counts of the bigram transitions in `sequences`."""
+    pairs = [np.asarray(seq, dtype=np.int64) for seq in sequences]
+    rows = np.concatenate([seq[:-1] for seq in pairs]) if pairs else np.zeros(0, dtype=np.int64)
+    cols = np.concatenate([seq[1:] for seq in pairs]) if pairs else np.zeros(0, dtype=np.int64)
+    # Duplicate (row, col) entries are summed on conversion.
+    return sparse.coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(vocab_size, vocab_size)).tocsr()
+
+
+@dataclass
+class BigramBackend:
+    """Add-alpha bigram LM in NumPy; a CPU stand-in for benchmarking and tests.
+
+    Counts are kept sparse and log-probabilities are formed only for the rows a
+    batch needs, so memory scales with the observed bigrams rather than
+    `vocab ** 2` (about 8 GB dense at the 32k default vocabulary).
+    """
+
+    counts: sparse.csr_matrix
+    alpha: float = 0.1
+
+    def __post_init__(self) -> None:
+        self.counts = sparse.csr_matrix(self.counts, dtype=np.float64)
+        vocab_size = self.counts.shape[1]
+        self._log_totals = np.log(np.asarray(self.counts.sum(axis=1)).ravel() + self.alpha * vocab_size)
+
+    @classmethod
+    def fit(cls, sequences: Sequence[np.ndarray], vocab_size: int, *, alpha: float = 0.1) -> "BigramBackend":
+        return cls(bigram_counts(sequences, vocab_size), alpha=alpha)
+
+    @classmethod
+    def from_counts(cls, counts: Union[np.ndarray, sparse.spmatrix], *, alpha: float = 0.1) -> "BigramBackend":
+        """Backend from a (vocab, vocab) matrix of bigram counts (dense or sparse), smoothed with `alpha`."""
+        return cls(counts, alpha=alpha)
+
+    def logits(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        flat = np.asarray(input_ids).reshape(-1)
+        rows = self.counts[flat].toarray()
+        log_probs = np.log(rows + self.alpha) - self._log_totals[flat, None]
+        return log_probs.astype(np.float32).reshape(*np.shape(input_ids), -1)
+
+
+@dataclass(frozen=True)
+class ScoringBatch:
+    shard: int
+    note_ids: List[str]
+    input_ids: np.ndarray
+    lengths: np.ndarray
+
+
+def plan_length_buckets(lengths: np.ndarray, max_batch_tokens: int, max_batch_size: int = 64) -> List[np.ndarray]:
+    """Group examples (sorted by length) so each padded batch stays under `max_batch_tokens`."""
+    order = np.argsort(lengths, kind="stable")
+    batches: List[np.ndarray] = []
+    start = 0
+    while start < len(order):
+        stop = start + 1
+        # Lengths are ascending, so the padded width is the last member's length.
+        while (
+            stop < len(order)
+            and stop - start < max_batch_size
+            and (stop - start + 1) * lengths[order[stop]] <= max_batch_tokens
+        ):
+            stop += 1
+        batches.append(order[start:stop])
+        start = stop
+    return batches
+
+
+def _pad(sequences: Sequence[np.ndarray], pad_id: int) -> Tuple[np.ndarray, np.ndarray]:
+    lengths = np.array([len(seq) for seq in sequences], dtype=np.int64)
+    padded = np.full((len(sequences), int(lengths.max(initial=1))), pad_id, dtype=np.int64)
+    for row, seq in enumerate(sequences):
+        padded[row, : len(seq)] = seq
+    return padded, lengths
+
+
+def _prefetch(producer: Iterator[ScoringBatch], depth: int) -> Iterator[ScoringBatch]:
+    """Run `producer` on a background thread, keeping up to `depth` batches ready."""
+    buffer: "queue.Queue" = queue.Queue(maxsize=max(1, depth))
+    done = object()
+
+    def work() -> None:
+        try:
+            for item in producer:
+                buffer.put(item)
+        except BaseException as err:  # surfaced in the consumer thread
+            buffer.put(err)
+        buffer.put(done)
+
+    threading.Thread(target=work, daemon=True).start()
+    while True:
+        item = buffer.get()
+        if item is done:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def _tokenizer_identity(tokenizer: Any) -> str:
+    if dataclasses.is_dataclass(tokenizer):
+        return repr(tokenizer)
+    return f"{type(tokenizer).__qualname__}:{getattr(tokenizer, 'name_or_path', '')}"
+
+
+def scoring_fingerprint(
+    panels: Mapping[str, Sequence[str]],
+    texts: Mapping[str, str],
+    note_ids: Sequence[str],
+    tokenizer: Any,
+    model_key: str,
+    plan: Mapping[str, Any],
+) -> str:
+    """Digest of everything that determines the shards `score_panels` writes."""
+    digest = hashlib.blake2b(digest_size=16)
+    header = {
+        "panels": {name: [str(i) for i in ids] for name, ids in panels.items()},
+        "tokenizer": _tokenizer_identity(tokenizer),
+        "model": model_key,
+        "plan": dict(plan),
+    }
+    digest.update(json.dumps(header, sort_keys=True).encode("utf-8"))
+    for note_id in note_ids:
+        digest.update(hashlib.blake2b(texts[note_id].encode("utf-8"), digest_size=16).digest())
+    return digest.hexdigest()
+
+
+def _reset_if_changed(out_dir: Path, fingerprint: str) -> None:
+    """Drop shards scored from different inputs, then record `fingerprint`."""
+    marker = out_dir / FINGERPRINT_FILE
+    if marker.exists() and marker.read_text(encoding="utf-8") == fingerprint:
+        return
+    for shard in out_dir.glob("shard_*"):
+        shutil.rmtree(shard)
+    marker.write_text(fingerprint, encoding="utf-8")
+
+
+@instrument()
+def score_panels(
+    panels: Mapping[str, Sequence[str]],
+    texts: Mapping[str, str],
+    tokenizer,
+    backend: ScoringBackend,
+    out_dir: Path,
+    *,
+    max_context_tokens: int = 4096,
+    max_batch_tokens: int = 32_768,
+    batches_per_shard: int = 16,
+    prefetch: int = 2,
+    vocab_chunk_size: Optional[int] = 8192,
+    pad_id: int = 0,
+    model_key: str = "",
+) -> List[Path]:
+    """Score every ID in `panels` and stream per-token stats to shard stores.
+
+    Examples are tokenized, truncated to `max_context_tokens`, sorted into
+    length buckets to minimise padding, and batched on a background thread
+    while the backend runs. Each shard (`batches_per_shard` batches) is a
+    `TokenStatsStore`; shards whose `meta.json` already exists are skipped, so
+    an interrupted run resumes after the last completed shard. The shard plan
+    depends only on the inputs, never on timing.
+
+    Resumption is only trusted for the same inputs: a fingerprint of the
+    panels, texts, tokenizer, shard plan and `model_key` (e.g. a checkpoint
+    digest identifying the backend's weights) is kept in `out_dir`, and
+    existing shards are discarded when it changes.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    note_ids = list(dict.fromkeys(str(note_id) for ids in panels.values() for note_id in ids))
+    missing = [note_id for note_id in note_ids if note_id not in texts]
+    if missing:
+        raise KeyError(f"{len(missing)} panel IDs have no canonical text, e.g. {missing[:3]}")
+    plan = {
+        "max_context_tokens": max_context_tokens,
+        "max_batch_tokens": max_batch_tokens,
+        "batches_per_shard": batches_per_shard,
+        "pad_id": pad_id,
+    }
+    _reset_if_changed(out_dir, scoring_fingerprint(panels, texts, note_ids, tokenizer, model_key, plan))
+    (out_dir / PANELS_FILE).write_text(
+        json.dumps({name: [str(i) for i in ids] for name, ids in panels.items()}, indent=2), encoding="utf-8"
+    )
+
+    encoded = [np.asarray(ids[:max_context_tokens], dtype=np.int64) for ids in tokenizer.encode_batch([texts[i] for i in note_ids])]
+    lengths = np.array([len(ids) for ids in encoded], dtype=np.int64)
+    buckets = plan_length_buckets(lengths, max_batch_tokens)
+    shard_paths = [out_dir / f"shard_{shard:05d}" for shard in range((len(buckets) + batches_per_shard - 1) // batches_per_shard)]
+    pending = [not (path / META_FILE).exists() for path in shard_paths]
+
+    def produce() -> Iterator[ScoringBatch]:
+        for number, members in enumerate(buckets):
+            shard = number // batches_per_shard
+            if not pending[shard]:
+                continue
+            input_ids, batch_lengths = _pad([encoded[i] for i in members], pad_id)
+            yield ScoringBatch(shard, [note_ids[i] for i in members], input_ids, batch_lengths)
+
+    writer: Optional[TokenStatsWriter] = None
+    current = -1
+    try:
+        for batch in _prefetch(produce(), prefetch):
+            if batch.shard != current:
+                if writer is not None:
+                    writer.close()
+                current = batch.shard
+                writer = TokenStatsWriter(shard_paths[current])
+            mask = np.arange(batch.input_ids.shape[1])[None, :] < batch.lengths[:, None]
+            logits = backend.logits(batch.input_ids, mask.astype(np.int64))
+            # Position t predicts token t + 1, so each example yields `length - 1` scored tokens.
+            stats = token_level_stats(
+                logits[:, :-1],
+                batch.input_ids[:, 1:],
+                vocab_chunk_size=vocab_chunk_size,
+                return_log_probs=False,
+            )
+            writer.append(batch.note_ids, stats, lengths=np.maximum(batch.lengths - 1, 0))
+    except BaseException:
+        # The partial shard stays without meta.json and is rescored on resume.
+        if writer is not None:
+            writer.abort()
+        raise
+    if writer is not None:
+        writer.close()
+    return shard_paths
+
+
+def open_scored_shards(out_dir: Path) -> Tuple[Dict[str, List[str]], List[TokenStatsStore]]:
+    """Panels and completed shard stores written by `score_panels`."""
+    out_dir = Path(out_dir)
+    panels = json.loads((out_dir / PANELS_FILE).read_text(encoding="utf-8"))
+    stores = [TokenStatsStore.open(path) for path in sorted(out_dir.glob("shard_*")) if (path / META_FILE).exists()]
+    return panels, stores
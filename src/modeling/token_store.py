@@ -0,0 +1,175 @@
+"""Compact, memory-mapped storage for per-token attack statistics."""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from functools import cached_property
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..utils.io import read_lines, write_lines
+
+COLUMN_DTYPES: Dict[str, str] = {
+    "nll": "float32",
+    "entropy": "float16",
+    "max_prob": "float16",
+    "target_rank": "int32",
+}
+META_FILE = "meta.json"
+OFFSETS_FILE = "offsets.npy"
+NOTE_IDS_FILE = "note_ids.txt"
+
+
+def token_store_dir(root: Path, slice_id: int, checkpoint: str) -> Path:
+    """Location of the store for one slice/checkpoint pair."""
+    return Path(root) / f"slice_{slice_id}" / checkpoint / "token_stats"
+
+
+def _valid_mask(shape: Tuple[int, int], lengths: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    if lengths is None:
+        return None
+    lengths = np.asarray(lengths)
+    if lengths.shape != (shape[0],) or (lengths > shape[1]).any() or (lengths < 0).any():
+        raise ValueError("lengths must give 0..seq valid tokens per row")
+    return np.arange(shape[1])[None, :] < lengths[:, None]
+
+
+@dataclass
+class TokenStatsWriter:
+    """Append batches of `token_level_stats` output to a columnar store.
+
+    Columns are raw little-endian binaries (one per statistic) so batches can be
+    streamed to disk; ragged rows are recorded as offsets into those columns.
+    """
+
+    path: Path
+    columns: Mapping[str, str] = field(default_factory=lambda: dict(COLUMN_DTYPES))
+    _handles: Dict[str, BinaryIO] = field(default_factory=dict, init=False, repr=False)
+    _offsets: list = field(default_factory=lambda: [0], init=False, repr=False)
+    _note_ids: list = field(default_factory=list, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.path = Path(self.path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        for name in self.columns:
+            self._handles[name] = (self.path / f"{name}.bin").open("wb")
+
+    def append(
+        self,
+        note_ids: Sequence[str],
+        stats: Mapping[str, np.ndarray],
+        lengths: Optional[np.ndarray] = None,
+    ) -> None:
+        """Write one (batch, seq) batch; `lengths` trims right padding per row."""
+        first = np.asarray(stats[next(iter(self.columns))])
+        if first.ndim != 2 or first.shape[0] != len(note_ids):
+            raise ValueError("stats must be (batch, seq) arrays aligned with note_ids")
+        mask = _valid_mask(first.shape, lengths)
+        row_lengths = np.full(first.shape[0], first.shape[1]) if lengths is None else np.asarray(lengths)
+
+        for name, dtype in self.columns.items():
+            values = np.asarray(stats[name])
+            flat = values[mask] if mask is not None else values.reshape(-1)
+            self._handles[name].write(np.ascontiguousarray(flat, dtype=np.dtype(dtype).newbyteorder("<")).tobytes())
+
+        self._offsets.extend((self._offsets[-1] + np.cumsum(row_lengths)).tolist())
+        self._note_ids.extend(str(note_id) for note_id in note_ids)
+
+    def abort(self) -> None:
+        """Close the column files without writing `meta.json`, so the store never opens as complete."""
+        for handle in self._handles.values():
+            handle.close()
+
+    def close(self) -> Path:
+        for handle in self._handles.values():
+            handle.close()
+        np.save(self.path / OFFSETS_FILE, np.asarray(self._offsets, dtype=np.int64))
+        write_lines(self.path / NOTE_IDS_FILE, self._note_ids)
+        meta = {"columns": dict(self.columns), "rows": len(self._note_ids), "tokens": int(self._offsets[-1])}
+        (self.path / META_FILE).write_text(json.dumps(meta, indent=2), encoding="utf-8")
+        return self.path
+
+    def __enter__(self) -> "TokenStatsWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        # A batch that failed mid-write must not look complete to resume logic keyed on `meta.json`.
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+@dataclass
+class TokenStatsStore:
+    """Read-only, memory-mapped view over a store written by `TokenStatsWriter`."""
+
+    path: Path
+    offsets: np.ndarray
+    note_ids: list[str]
+    columns: Dict[str, np.ndarray]
+
+    @classmethod
+    def open(cls, path: Path) -> "TokenStatsStore":
+        path = Path(path)
+        meta_path = path / META_FILE
+        if not meta_path.exists():
+            raise FileNotFoundError(f"No token statistics store at {path}")
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        columns = {}
+        for name, dtype in meta["columns"].items():
+            dt = np.dtype(dtype).newbyteorder("<")
+            # np.memmap rejects empty files, so zero-token stores get an empty array.
+            columns[name] = (
+                np.memmap(path / f"{name}.bin", dtype=dt, mode="r") if meta["tokens"] else np.empty(0, dtype=dt)
+            )
+        offsets = np.load(path / OFFSETS_FILE, mmap_mode="r")
+        return cls(path=path, offsets=offsets, note_ids=read_lines(path / NOTE_IDS_FILE), columns=columns)
+
+    def __len__(self) -> int:
+        return len(self.note_ids)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @cached_property
+    def _positions(self) -> Dict[str, int]:
+        """note_id -> row, built on first lookup."""
+        return {note_id: i for i, note_id in enumerate(self.note_ids)}
+
+    def index_of(self, note_ids: Iterable[str]) -> np.ndarray:
+        lookup = self._positions
+        try:
+            return np.array([lookup[str(note_id)] for note_id in note_ids], dtype=np.int64)
+        except KeyError as err:
+            raise KeyError(f"note_id {err.args[0]} not in store {self.path}") from None
+
+    def row(self, note_id: str) -> Dict[str, np.ndarray]:
+        """Zero-copy per-token columns for a single note."""
+        i = int(self.index_of([note_id])[0])
+        start, stop = int(self.offsets[i]), int(self.offsets[i + 1])
+        return {name: values[start:stop] for name, values in self.columns.items()}
+
+    def ragged(self, column: str, note_ids: Optional[Iterable[str]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return `(values, lengths)` for a column, optionally restricted to `note_ids`.
+
+        Without `note_ids` the values are the memory-mapped column itself; with
+        them, only the selected rows are gathered (in the requested order).
+        """
+        values = self.columns[column]
+        if note_ids is None:
+            return values, self.lengths
+        rows = self.index_of(note_ids)
+        starts = np.asarray(self.offsets)[rows]
+        lengths = np.asarray(self.offsets)[rows + 1] - starts
+        # Flat gather index: each row's start repeated, plus its within-row position.
+        within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return values[np.repeat(starts, lengths) + within], lengths
+
+    def win_at(self, k: int, note_ids: Optional[Iterable[str]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Ragged Win@k hits reconstructed from the stored target ranks."""
+        ranks, lengths = self.ragged("target_rank", note_ids)
+        return np.asarray(ranks) < k, lengths
@@ -1,8 +1,14 @@
 """Training utilities with explicit token accounting."""
 from __future__ import annotations
 
-from dataclasses import dataclass, field
-from typing import Iterable, Tuple
+import json
+import math
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .lora import compute_gradient_accumulation
 
 
 def _ensure_positive(value: int, name: str) -> None:
@@ -14,6 +20,25 @@ def _ensure_positive(value: int, name: str) -> None:
 class TokenBudgetTracker:
     tokens_per_slice: int
     consumed_tokens: int = 0
+    packed_tokens: int = 0
+    padding_tokens: int = 0
+    packed_sequences: int = 0
+
+    def record_packing(self, *, packed_tokens: int, padding_tokens: int, sequences: int) -> None:
+        """Store real (tokenizer-counted) totals from the packing stage."""
+        self.packed_tokens = packed_tokens
+        self.padding_tokens = padding_tokens
+        self.packed_sequences = sequences
+
+    @property
+    def packing_efficiency(self) -> float:
+        capacity = self.packed_tokens + self.padding_tokens
+        return self.packed_tokens / capacity if capacity else 0.0
+
+    @property
+    def avg_tokens_per_sample(self) -> float:
+        """Real packed tokens per sequence, for `compute_gradient_accumulation`."""
+        return self.packed_tokens / self.packed_sequences if self.packed_sequences else 0.0
 
     def update(self, tokens_in_batch: int) -> bool:
         """Update token usage. Returns True if the budget is exhausted."""
@@ -26,7 +51,177 @@ class TokenBudgetTracker:
         return max(0, self.tokens_per_slice - self.consumed_tokens)
 
 
-def simulate_training_loop(batches: Iterable[Tuple[int, int]], tracker: TokenBudgetTracker) -> int:
+@dataclass(frozen=True)
+class StepPlan:
+    """Optimizer-step plan derived from real packed token counts."""
+
+    micro_batch_size: int
+    grad_accum: int
+    avg_tokens_per_sample: float
+    tokens_per_step: float
+    total_sequences: int
+    total_steps: int
+    warmup_steps: int
+
+
+def plan_steps(
+    tracker: TokenBudgetTracker,
+    *,
+    tokens_per_step_target: int,
+    micro_batch_size: int = 1,
+    warmup_steps: int = 200,
+    max_steps: Optional[int] = None,
+    max_warmup_fraction: float = 0.1,
+) -> StepPlan:
+    """Resolve `gradient_accumulation: auto` and `max_steps: null` from the tracker.
+
+    Uses the packed tokens per sequence recorded by `record_packing`; the slice
+    budget then fixes how many sequences (and optimizer steps) are needed.
+    Warmup is capped at `max_warmup_fraction` of the steps so short 3M-token
+    slices are not all warmup.
+    """
+    _ensure_positive(tokens_per_step_target, "tokens_per_step_target")
+    _ensure_positive(micro_batch_size, "micro_batch_size")
+    avg_tokens = tracker.avg_tokens_per_sample
+    if avg_tokens <= 0:
+        raise ValueError("tracker has no packing statistics; call record_packing first")
+    grad_accum = compute_gradient_accumulation(tokens_per_step_target, micro_batch_size, int(round(avg_tokens)))
+    sequences = min(tracker.packed_sequences, math.ceil(tracker.tokens_per_slice / avg_tokens))
+    steps = math.ceil(sequences / (micro_batch_size * grad_accum))
+    if max_steps is not None:
+        steps = min(steps, max_steps)
+    warmup = min(warmup_steps, int(max_warmup_fraction * steps))
+    return StepPlan(
+        micro_batch_size=micro_batch_size,
+        grad_accum=grad_accum,
+        avg_tokens_per_sample=avg_tokens,
+        tokens_per_step=grad_accum * micro_batch_size * avg_tokens,
+        total_sequences=sequences,
+        total_steps=steps,
+        warmup_steps=warmup,
+    )
+
+
+@dataclass
+class TrainingScheduler:
+    """Drives optimizer steps against a `StepPlan` and records throughput.
+
+    Feed it one micro-batch at a time via `record_micro_batch`; every
+    `grad_accum` micro-batches completes an optimizer step, whose tokens/sec and
+    padding waste are appended to `history`. `state_dict`/`save`/`load` allow a
+    mid-slice resume: skip the first `micro_step` micro-batches of the data
+    stream and continue.
+    """
+
+    plan: StepPlan
+    tracker: TokenBudgetTracker
+    step: int = 0
+    micro_step: int = 0
+    real_tokens: int = 0
+    padding_tokens: int = 0
+    elapsed_seconds: float = 0.0
+    history: List[Dict[str, float]] = field(default_factory=list)
+    clock: Callable[[], float] = field(default=time.perf_counter, repr=False, compare=False)
+    _step_tokens: int = field(default=0, repr=False)
+    _step_padding: int = field(default=0, repr=False)
+    _step_started: Optional[float] = field(default=None, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.step >= self.plan.total_steps or self.tracker.remaining == 0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.real_tokens / self.elapsed_seconds if self.elapsed_seconds > 0 else 0.0
+
+    @property
+    def padding_waste(self) -> float:
+        total = self.real_tokens + self.padding_tokens
+        return self.padding_tokens / total if total else 0.0
+
+    def lr_scale(self, step: Optional[int] = None) -> float:
+        """Linear warmup followed by cosine decay (`lr_scheduler: cosine`)."""
+        step = self.step if step is None else step
+        warmup, total = self.plan.warmup_steps, self.plan.total_steps
+        if warmup and step < warmup:
+            return (step + 1) / warmup
+        progress = (step - warmup) / max(1, total - warmup)
+        return 0.5 * (1 + math.cos(math.pi * min(1.0, progress)))
+
+    def record_micro_batch(self, real_tokens: int, padding_tokens: int = 0) -> bool:
+        """Account one micro-batch; returns True when it completes an optimizer step."""
+        if self._step_started is None:
+            self._step_started = self.clock()
+        self.tracker.update(real_tokens)
+        self.micro_step += 1
+        self._step_tokens += real_tokens
+        self._step_padding += padding_tokens
+        if self.micro_step % self.plan.grad_accum and self.tracker.remaining:
+            return False
+
+        seconds = self.clock() - self._step_started
+        self.step += 1
+        self.real_tokens += self._step_tokens
+        self.padding_tokens += self._step_padding
+        self.elapsed_seconds += seconds
+        self.history.append(
+            {
+                "step": self.step,
+                "tokens": self._step_tokens,
+                "padding_tokens": self._step_padding,
+                "seconds": seconds,
+                "tokens_per_sec": self._step_tokens / seconds if seconds > 0 else 0.0,
+                "lr_scale": self.lr_scale(self.step - 1),
+            }
+        )
+        self._step_tokens = self._step_padding = 0
+        self._step_started = None
+        return True
+
+    def state_dict(self) -> Dict:
+        return {
+            "plan": asdict(self.plan),
+            "tracker": asdict(self.tracker),
+            "step": self.step,
+            "micro_step": self.micro_step,
+            "real_tokens": self.real_tokens,
+            "padding_tokens": self.padding_tokens,
+            "elapsed_seconds": self.elapsed_seconds,
+            "history": self.history,
+            "pending": {"tokens": self._step_tokens, "padding_tokens": self._step_padding},
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "TrainingScheduler":
+        scheduler = cls(
+            plan=StepPlan(**state["plan"]),
+            tracker=TokenBudgetTracker(**state["tracker"]),
+            step=state["step"],
+            micro_step=state["micro_step"],
+            real_tokens=state["real_tokens"],
+            padding_tokens=state["padding_tokens"],
+            elapsed_seconds=state["elapsed_seconds"],
+            history=list(state["history"]),
+        )
+        scheduler._step_tokens = state["pending"]["tokens"]
+        scheduler._step_padding = state["pending"]["padding_tokens"]
+        return scheduler
+
+    def save(self, path: Path) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.state_dict(), indent=2), encoding="utf-8")
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> "TrainingScheduler":
+        return cls.from_state(json.loads(path.read_text(encoding="utf-8")))
+
+
+def simulate_training_loop(
+    batches: Iterable[Tuple[int, int]],
+    tracker: TokenBudgetTracker,
+    scheduler: Optional[TrainingScheduler] = None,
+) -> int:
     """Simulate a training loop and return the number of processed batches.
 
     Parameters
@@ -35,11 +230,24 @@ def simulate_training_loop(batches: Iterable[Tuple[int, int]], tracker: TokenBud
         Each tuple holds `(micro_batch_size, avg_tokens_per_sample)`.
     tracker: TokenBudgetTracker
         Tracks the running token consumption.
+    scheduler: TrainingScheduler, optional
+        When given, micro-batches are routed through the scheduler and the loop
+        stops once its plan is complete. `tracker` must then be
+        `scheduler.tracker`, the tracker the scheduler updates.
     """
+    if scheduler is not None and scheduler.tracker is not tracker:
+        raise ValueError("tracker must be scheduler.tracker when a scheduler is given")
     processed = 0
     for micro_batch, avg_tokens in batches:
         batch_tokens = micro_batch * avg_tokens
-        exhausted = tracker.update(batch_tokens)
+        if scheduler is not None:
+            # A resumed or zero-step plan may already be complete; never record past it.
+            if scheduler.done:
+                break
+            scheduler.record_micro_batch(batch_tokens)
+            exhausted = scheduler.done
+        else:
+            exhausted = tracker.update(batch_tokens)
         processed += 1
         if exhausted:
             break
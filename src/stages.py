@@ -0,0 +1,670 @@
+"""Default stage handlers for `src.sweep`: a CPU reference pipeline.
+
+Each handler wires one stage to the library entry points (slicing, replay
+planning, tokenization and packing, scoring, attack features, stacking,
+bootstrap metrics and figure export). Fine-tuning and scoring use the
+dependency-free stand-ins (`RegexHashTokenizer` and a continually trained
+`BigramBackend`), so a sweep runs end to end without a GPU. To plug in real
+training, import this module from your own handlers module, re-register the
+stages you replace (e.g. `finetune`, `score`) and pass it with `--handlers`.
+
+Inputs are the canonical parquet from notebook 01
+(`artifacts/canonical_bhc_{run_mode}.parquet`). Panel ID lists keep the
+`artifacts/slice_{t}/ids/` layout of `configs/slices.yaml`; everything else
+is written under `artifacts/sweep/`.
+"""
+from __future__ import annotations
+
+import hashlib
+import itertools
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .attacks.adaptive import ProbeStoppingRule, stability_probe_examples
+from .attacks.ensemble import train_oof_stacking
+from .attacks.lira import accumulate_reference_stats, lira_scores
+from .attacks.loss_confidence import score_examples
+from .attacks.ragged import as_masked, masked_mean
+from .attacks.win_k_min_k import aggregate_features
+from .constants import ARTIFACT_ROOT, PROJECT_ROOT
+from .data.loaders import export_canonical, load_canonical
+from .data.paraphrase import ParaphraseConfig, generate_paraphrases
+from .data.replay import iter_replay_mixture, plan_replay_mixture, save_replay_ids
+from .data.slicing import SliceConfig, assign_temporal_slices, build_member_panels, enforce_token_budget, load_panel_ids
+from .data.tokenization import PackingResult, RegexHashTokenizer, TokenizedCorpus, pack_corpus, tokenize_corpus
+from .eval.bootstrap import bootstrap_rank_metrics
+from .modeling.logprobs import token_level_stats
+from .modeling.scoring import (
+    FINGERPRINT_FILE,
+    BigramBackend,
+    bigram_counts,
+    open_scored_shards,
+    plan_length_buckets,
+    score_panels,
+)
+from .modeling.token_store import TokenStatsStore
+from .modeling.train import TokenBudgetTracker, TrainingScheduler, plan_steps
+from .sweep import Node, enabled_attacks, register_config_check, register_stage
+from .utils.cache import FeatureCache, FeatureCacheKey, file_digest
+from .utils.plots import FigureSpec, export_figures, results_manifest
+from .utils.results import RESULT_COLUMNS
+from .utils.runtime import current_run_mode
+from .utils.seed import derive_seed, int_seed, make_rng
+
+STANDIN_VOCAB_SIZE = 2048
+BIGRAM_ALPHA = 0.1
+SCORING_BATCH_TOKENS = 4096
+PANELS = ("members", "non_members", "past_members", "future_non_members")
+SWEEP_ROOT = ARTIFACT_ROOT / "sweep"
+
+FeatureBuilder = Callable[[Node, Mapping[str, Any], List[str], "_PanelStats"], Dict[str, np.ndarray]]
+_FEATURE_BUILDERS: Dict[str, FeatureBuilder] = {}
+
+
+def canonical_path() -> Path:
+    """Canonical parquet written by notebook 01 for the active run mode."""
+    return ARTIFACT_ROOT / f"canonical_bhc_{current_run_mode().name}.parquet"
+
+
+def _train_dir() -> Path:
+    """`slice_id`-partitioned `train` rows of the budgeted dataset (the replay source)."""
+    return SWEEP_ROOT / "sliced" / "train"
+
+
+def _tokenized_dir(slice_id: int, track: str) -> Path:
+    return SWEEP_ROOT / "tokenized" / f"slice_{slice_id}" / track
+
+
+def _run_dir(slice_id: int, track: str, seed: int) -> Path:
+    return SWEEP_ROOT / "runs" / f"slice_{slice_id}" / f"{track}_seed{seed}"
+
+
+def _checkpoint_path(slice_id: int, track: str, seed: int) -> Path:
+    return _run_dir(slice_id, track, seed) / "bigram.npz"
+
+
+def _ids_dir(slice_id: int) -> Path:
+    return ARTIFACT_ROOT / f"slice_{slice_id}" / "ids"
+
+
+def _slices_cfg(configs: Mapping[str, Any]) -> Mapping[str, Any]:
+    return configs["slices"]["slices"]
+
+
+def _data_seed(configs: Mapping[str, Any]) -> int:
+    return int(configs["train_llm"]["data"]["seed"])
+
+
+def _max_context(configs: Mapping[str, Any]) -> int:
+    return int(configs["train_llm"]["data"]["max_context_tokens"])
+
+
+def _tokenizer() -> RegexHashTokenizer:
+    return RegexHashTokenizer(vocab_size=STANDIN_VOCAB_SIZE)
+
+
+def _partition_files(root: Path, slice_id: int) -> List[str]:
+    return [str(path) for path in sorted((root / f"slice_id={slice_id}").glob("*.parquet"))]
+
+
+@lru_cache(maxsize=1)
+def _read_budgeted(path: str, mtime_ns: int, total_slices: int, tokens_per_slice: int) -> pd.DataFrame:
+    frame = assign_temporal_slices(load_canonical(Path(path)), total_slices=total_slices)
+    frame["slice_id"] = frame["slice_id"].astype(int)
+    return enforce_token_budget(frame, tokens_per_slice)
+
+
+def budgeted_frame(configs: Mapping[str, Any]) -> pd.DataFrame:
+    """Canonical notes with `slice_id` assigned and each slice trimmed to the token budget.
+
+    Panels and replay sources of every slice come from this one frame; it is
+    cached per process until the canonical file changes.
+    """
+    source = canonical_path()
+    if not source.exists():
+        raise FileNotFoundError(f"Canonical dataset {source} not found; run notebook 01 (export_canonical) first")
+    slices_cfg = _slices_cfg(configs)
+    return _read_budgeted(
+        str(source),
+        source.stat().st_mtime_ns,
+        int(slices_cfg["total"]),
+        int(slices_cfg["token_budget"]["tokens_per_slice"]),
+    )
+
+
+def _load_counts(slice_id: int, track: str, seed: int) -> sparse.csr_matrix:
+    """Bigram counts after fine-tuning on `slice_id`; the untrained prior before slice 0."""
+    if slice_id < 0:
+        return sparse.csr_matrix((STANDIN_VOCAB_SIZE, STANDIN_VOCAB_SIZE))
+    return sparse.load_npz(_checkpoint_path(slice_id, track, seed)).tocsr()
+
+
+def _checkpoint_key(slice_id: int, track: str, seed: int) -> str:
+    return file_digest(_checkpoint_path(slice_id, track, seed)) if slice_id >= 0 else "prior"
+
+
+@register_stage("slice_build")
+def build_slice(node: Node, configs: Mapping[str, Any]) -> Dict[str, Any]:
+    """Build this slice's ID panels and persist its `train` rows for replay planning."""
+    frame = budgeted_frame(configs)
+    splits = configs["data"]["splits"]
+    config = SliceConfig(
+        total_slices=int(_slices_cfg(configs)["total"]),
+        members=int(splits["member_count"]),
+        non_members=int(splits["non_member_count"]),
+        past_members=int(splits["temporal_panels"]["past_members"]),
+        future_non_members=int(splits["temporal_panels"]["future_non_members"]),
+    )
+    build_member_panels(
+        frame, config=config, artifact_dir=str(ARTIFACT_ROOT), rng=_data_seed(configs), slice_ids=[node.slice_id]
+    )
+    rows = frame[(frame["slice_id"] == node.slice_id) & (frame["split_tag"] == "train")]
+    export_canonical(rows, _train_dir(), partition_cols=["slice_id"], keep_other_partitions=True)
+    panel_files = [_ids_dir(node.slice_id) / f"{panel}.npy" for panel in PANELS]
+    outputs = [str(path) for path in panel_files if path.exists()]
+    return {"outputs": outputs + _partition_files(_train_dir(), node.slice_id)}
+
+
+def _save_packing(packing: PackingResult, out_dir: Path) -> Path:
+    path = out_dir / "packing.npz"
+    np.savez(path, **packing.__dict__)
+    summary = {
+        "sequences": packing.num_sequences,
+        "packed_tokens": packing.packed_tokens,
+        "padding_tokens": packing.padding_tokens,
+        "truncated_tokens": packing.truncated_tokens,
+        "efficiency": packing.efficiency,
+    }
+    (out_dir / "packing.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    return path
+
+
+def _load_packing(out_dir: Path) -> PackingResult:
+    with np.load(out_dir / "packing.npz") as data:
+        arrays = {name: data[name] for name in data.files}
+    for name in ("max_context_tokens", "truncated_tokens"):
+        arrays[name] = int(arrays[name])
+    return PackingResult(**arrays)
+
+
+@register_stage("tokenize")
+def tokenize_slice(node: Node, configs: Mapping[str, Any]) -> Dict[str, Any]:
+    """Plan the track's replay mixture, tokenize it and pack it into context windows."""
+    fraction = {c["name"]: float(c.get("replay_fraction", 0.0)) for c in _slices_cfg(configs)["replay_conditions"]}
+    source = _train_dir()
+    plan = plan_replay_mixture(
+        source,
+        node.slice_id,
+        tokens_per_slice=int(_slices_cfg(configs)["token_budget"]["tokens_per_slice"]),
+        replay_fraction=fraction[node.track],
+        seed=_data_seed(configs),
+    )
+    replay_ids = save_replay_ids(plan, ARTIFACT_ROOT, node.track)
+    frames = list(iter_replay_mixture(source, plan, columns=["text"]))
+    rows = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["hadm_id", "text"])
+
+    out_dir = _tokenized_dir(node.slice_id, node.track)
+    corpus = tokenize_corpus(rows["text"], rows["hadm_id"], _tokenizer(), out_dir)
+    packing = pack_corpus(corpus, _max_context(configs))
+    return {
+        "outputs": [
+            str(out_dir / "tokens.bin"),
+            str(out_dir / "ids.txt"),
+            str(_save_packing(packing, out_dir)),
+            str(replay_ids.with_suffix(".npy")),
+        ]
+    }
+
+
+@register_stage("finetune")
+def finetune_slice(node: Node, configs: Mapping[str, Any]) -> Dict[str, Any]:
+    """Continue the bigram stand-in from the slice `t - 1` checkpoint over this slice's packed windows.
+
+    Windows are visited in a seeded order and a `TrainingScheduler` stops at
+    the slice token budget, as the LoRA loop in notebook 04 does.
+    """
+    training = configs["train_llm"]["training"]
+    tokenized = _tokenized_dir(node.slice_id, node.track)
+    corpus = TokenizedCorpus.open(tokenized)
+    packing = _load_packing(tokenized)
+    tracker = TokenBudgetTracker(int(_slices_cfg(configs)["token_budget"]["tokens_per_slice"]))
+    packing.report_to(tracker)
+    micro_batch = int(training["micro_batch_size"])
+    plan = plan_steps(
+        tracker,
+        tokens_per_step_target=int(training["tokens_per_step_target"]),
+        micro_batch_size=micro_batch,
+        warmup_steps=int(training["warmup_steps"]),
+        max_steps=training.get("max_steps"),
+    )
+    scheduler = TrainingScheduler(plan, tracker)
+
+    seen: List[np.ndarray] = []
+    order = make_rng(node.seed, node.slice_id, node.track).permutation(packing.num_sequences)
+    for start in range(0, len(order), micro_batch):
+        windows = order[start : start + micro_batch]
+        for window in windows:
+            seen += [corpus.document(int(doc))[: packing.max_context_tokens] for doc in packing.window(int(window))]
+        real = int(packing.bin_tokens[windows].sum())
+        scheduler.record_micro_batch(real, len(windows) * packing.max_context_tokens - real)
+        if scheduler.done:
+            break
+
+    checkpoint = _checkpoint_path(node.slice_id, node.track, node.seed)
+    checkpoint.parent.mkdir(parents=True, exist_ok=True)
+    counts = _load_counts(node.slice_id - 1, node.track, node.seed) + bigram_counts(seen, STANDIN_VOCAB_SIZE)
+    sparse.save_npz(checkpoint, counts.tocsr())
+    state = scheduler.save(checkpoint.with_name("scheduler.json"))
+    return {"outputs": [str(checkpoint), str(state)]}
+
+
+def _panel_texts(configs: Mapping[str, Any], slice_id: int, panels: Mapping[str, Sequence[str]]) -> Dict[str, str]:
+    """Text per panel ID (subject): its earliest note where the panel was drawn from.
+
+    Members and past members use their slice `t` training notes, non-members
+    their held-out notes or notes outside `t`, and future non-members notes
+    after `t`. An ID already taken by an earlier panel keeps that text.
+    """
+    frame = budgeted_frame(configs).sort_values("discharge_time", kind="stable")
+    subjects = frame["subject_id"].astype(str)
+    slices = frame["slice_id"]
+    trained = (slices == slice_id) & (frame["split_tag"] == "train")
+    scope = {
+        "members": trained,
+        "past_members": trained,
+        "non_members": (slices != slice_id) | (frame["split_tag"] == "global_holdout"),
+        "future_non_members": slices > slice_id,
+    }
+    texts: Dict[str, str] = {}
+    for panel, ids in panels.items():
+        rows = frame[scope[panel] & subjects.isin({str(i) for i in ids})]
+        first = rows.assign(subject_id=subjects[rows.index]).drop_duplicates("subject_id")
+        for subject, text in first[["subject_id", "text"]].itertuples(index=False):
+            texts.setdefault(subject, text)
+    return texts
+
+
+@register_stage("score")
+def score_slice(node: Node, configs: Mapping[str, Any]) -> Dict[str, Any]:
+    """Score every panel ID with the fine-tuned checkpoint into per-token stat shards."""
+    panels = {panel: [str(i) for i in load_panel_ids(_ids_dir(node.slice_id) / f"{panel}.txt")] for panel in PANELS}
+    out_dir = _run_dir(node.slice_id, node.track, node.seed) / "token_stats"
+    backend = BigramBackend.from_counts(_load_counts(node.slice_id, node.track, node.seed), alpha=BIGRAM_ALPHA)
+    shards = score_panels(
+        panels,
+        _panel_texts(configs, node.slice_id, panels),
+        _tokenizer(),
+        backend,
+        out_dir,
+        max_context_tokens=_max_context(configs),
+        max_batch_tokens=SCORING_BATCH_TOKENS,
+        model_key=_checkpoint_key(node.slice_id, node.track, node.seed),
+    )
+    return {"outputs": [str(shard / "nll.bin") for shard in shards]}
+
+
+class _PanelStats:
+    """Ragged per-token columns for panel IDs spread over scored shards."""
+
+    def __init__(self, stores: Sequence[TokenStatsStore], ids: Sequence[str]) -> None:
+        self.stores = stores
+        self.ids = list(ids)
+
+    def ragged(self, column: str) -> Tuple[np.ndarray, np.ndarray]:
+        rows: Dict[str, np.ndarray] = {}
+        for store in self.stores:
+            stored = set(store.note_ids)
+            present = [note_id for note_id in self.ids if note_id in stored]
+            if not present:
+                continue
+            values, lengths = store.ragged(column, present)
+            rows.update(zip(present, np.split(np.asarray(values), np.cumsum(lengths)[:-1])))
+        parts = [rows[note_id] for note_id in self.ids]
+        lengths = np.array([len(part) for part in parts], dtype=np.int64)
+        return (np.concatenate(parts) if parts else np.zeros(0)), lengths
+
+
+def feature_builder(attack: str) -> Callable[[FeatureBuilder], FeatureBuilder]:
+    """Register how `attack_features` computes an attack's per-example scores (higher = more member-like)."""
+
+    def decorator(fn: FeatureBuilder) -> FeatureBuilder:
+        _FEATURE_BUILDERS[attack] = fn
+        return fn
+
+    return decorator
+
+
+@feature_builder("loss_confidence")
+def _loss_confidence(node: Node, configs: Mapping[str, Any], ids: List[str], stats: _PanelStats) -> Dict[str, np.ndarray]:
+    nll, lengths = stats.ragged("nll")
+    scores = score_examples(nll, stats.ragged("entropy")[0], stats.ragged("max_prob")[0], lengths=lengths)
+    oriented = {"nll": -scores["mean_nll"], "entropy": -scores["entropy"], "max_prob": scores["max_prob"]}
+    wanted = configs["attacks"]["attacks"]["loss_confidence"].get("metrics", list(oriented))
+    return {name: oriented[name] for name in wanted}
+
+
+@feature_builder("win_k_min_k")
+def _win_k_min_k(node: Node, configs: Mapping[str, Any], ids: List[str], stats: _PanelStats) -> Dict[str, np.ndarray]:
+    cfg = configs["attacks"]["attacks"]["win_k_min_k"]
+    nll, lengths = stats.ragged("nll")
+    ranks = stats.ragged("target_rank")[0]
+    wins = {f"win@{k}": ranks < int(k) for k in cfg["k_values"]}
+    features = aggregate_features(wins, nll, cfg["worst_percentiles"], lengths=lengths)
+    # Lower worst-k% loss means more member-like.
+    return {name: -values if name.startswith("min_loss") else values for name, values in features.items()}
+
+
+@feature_builder("label_free")
+def _label_free(node: Node, configs: Mapping[str, Any], ids: List[str], stats: _PanelStats) -> Dict[str, np.ndarray]:
+    # `label_free.stability_score` on stored entropies: 1 - entropy / log(vocab), averaged over tokens.
+    entropy, lengths = stats.ragged("entropy")
+    return {"stability": 1.0 - masked_mean(*as_masked(entropy, lengths)) / np.log(STANDIN_VOCAB_SIZE)}
+
+
+def _score_texts(
+    texts: Mapping[str, str], backend: BigramBackend, model_key: str, out_dir: Path, configs: Mapping[str, Any]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """`(nll, lengths)` ragged for `texts` in key order under `backend`.
+
+    Shards in `out_dir` are reused while `model_key` and the texts are unchanged.
+    """
+    ids = list(texts)
+    score_panels(
+        {"texts": ids},
+        texts,
+        _tokenizer(),
+        backend,
+        out_dir,
+        max_context_tokens=_max_context(configs),
+        max_batch_tokens=SCORING_BATCH_TOKENS,
+        model_key=model_key,
+    )
+    _, stores = open_scored_shards(out_dir)
+    return _PanelStats(stores, ids).ragged("nll")
+
+
+def _example_texts(node: Node, configs: Mapping[str, Any], ids: Sequence[str]) -> List[str]:
+    """The texts `score` scored for `ids`."""
+    texts = _panel_texts(configs, node.slice_id, _scored_panels(node))
+    return [texts[note_id] for note_id in ids]
+
+
+@feature_builder("lira")
+def _lira(node: Node, configs: Mapping[str, Any], ids: List[str], stats: _PanelStats) -> Dict[str, np.ndarray]:
+    # Reference (shadow) models continue the slice t-1 checkpoint on a seeded half of the
+    # panel texts, so every example is in exactly half of them; scores are mean token log-probs.
+    cfg = configs["attacks"]["attacks"]["lira"]
+    n_refs = int(cfg.get("reference_models", 4))
+    texts = dict(zip(ids, _example_texts(node, configs, ids)))
+    encoded = [
+        np.asarray(seq[: _max_context(configs)], dtype=np.int64) for seq in _tokenizer().encode_batch(list(texts.values()))
+    ]
+    base = _load_counts(node.slice_id - 1, node.track, node.seed)
+    base_key = _checkpoint_key(node.slice_id - 1, node.track, node.seed)
+    rng = make_rng(node.seed, node.slice_id, node.track, "lira")
+    in_masks = rng.random((n_refs, len(ids))).argsort(axis=0) < n_refs // 2
+
+    def references():
+        for ref, in_mask in enumerate(in_masks):
+            counts = base + bigram_counts([encoded[i] for i in np.flatnonzero(in_mask)], STANDIN_VOCAB_SIZE)
+            nll, lengths = _score_texts(
+                texts,
+                BigramBackend.from_counts(counts, alpha=BIGRAM_ALPHA),
+                f"{base_key}+{hashlib.blake2b(np.packbits(in_mask).tobytes(), digest_size=8).hexdigest()}",
+                _run_dir(node.slice_id, node.track, node.seed) / "lira_reference" / f"ref_{ref}",
+                configs,
+            )
+            yield -masked_mean(*as_masked(nll, lengths)), in_mask
+
+    reference = accumulate_reference_stats(references(), len(ids))
+    target = -masked_mean(*as_masked(*stats.ragged("nll")))
+    result = lira_scores(target, reference, online=bool(cfg.get("online", True)))
+    # `normalize` selects the z-score under the out-references instead of the likelihood ratio.
+    return {"llr": result.normalized_llr if cfg.get("normalize", True) else result.llr}
+
+
+@feature_builder("paraphrase")
+def _paraphrase(node: Node, configs: Mapping[str, Any], ids: List[str], stats: _PanelStats) -> Dict[str, np.ndarray]:
+    subset = configs.get("data", {}).get("paraphrase_subset", {})
+    defaults = ParaphraseConfig()
+    config = ParaphraseConfig(
+        seed=int_seed(node.seed, node.slice_id),
+        similarity_threshold=float(subset.get("similarity_threshold", defaults.similarity_threshold)),
+        length_ratio_bounds=tuple(subset.get("length_ratio_bounds", defaults.length_ratio_bounds)),
+        variants_per_example=tuple(subset.get("variants_per_member", defaults.variants_per_example)),
+    )
+    variants = generate_paraphrases(_example_texts(node, configs, ids), config)
+    owners = np.array([row for row, options in enumerate(variants) for _ in options], dtype=np.int64)
+    para_texts = {f"{ids[row]}#p{j}": text for row, options in enumerate(variants) for j, text in enumerate(options)}
+
+    nll, lengths = stats.ragged("nll")
+    original = masked_mean(*as_masked(nll, lengths))
+    gap = np.full(len(ids), np.nan)
+    if para_texts:
+        para_nll, para_lengths = _score_texts(
+            para_texts,
+            BigramBackend.from_counts(_load_counts(node.slice_id, node.track, node.seed), alpha=BIGRAM_ALPHA),
+            _checkpoint_key(node.slice_id, node.track, node.seed),
+            _run_dir(node.slice_id, node.track, node.seed) / "paraphrase_scores",
+            configs,
+        )
+        per_variant = masked_mean(*as_masked(para_nll, para_lengths))
+        totals = np.bincount(owners, weights=np.nan_to_num(per_variant), minlength=len(ids))
+        counts = np.bincount(owners, weights=np.isfinite(per_variant), minlength=len(ids))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # Members lose more likelihood under paraphrase than non-members.
+            gap = totals / counts - original
+    return {"nll_gap": gap}
+
+
+@feature_builder("adaptive")
+def _adaptive(node: Node, configs: Mapping[str, Any], ids: List[str], stats: _PanelStats) -> Dict[str, np.ndarray]:
+    # Each query re-scores the example with a seeded fraction (`context_noise`) of its
+    # context tokens replaced at random; targets stay the original tokens.
+    cfg = configs["attacks"]["attacks"]["adaptive"]
+    noise = float(cfg.get("context_noise", 0.1))
+    encoded = [
+        np.asarray(seq[: _max_context(configs)], dtype=np.int64)
+        for seq in _tokenizer().encode_batch(_example_texts(node, configs, ids))
+    ]
+    lengths = np.array([max(len(seq) - 1, 0) for seq in encoded], dtype=np.int64)
+    backend = BigramBackend.from_counts(_load_counts(node.slice_id, node.track, node.seed), alpha=BIGRAM_ALPHA)
+    rounds = itertools.count()
+
+    def query(rows: np.ndarray) -> np.ndarray:
+        rng = make_rng(node.seed, node.slice_id, node.track, "adaptive", next(rounds))
+        log_probs = np.zeros((len(rows), int(lengths[rows].max(initial=0))))
+        for members in plan_length_buckets(lengths[rows] + 1, SCORING_BATCH_TOKENS):
+            width = int(lengths[rows[members]].max(initial=0)) + 1
+            input_ids = np.zeros((len(members), width), dtype=np.int64)
+            for row, member in enumerate(members):
+                seq = encoded[rows[member]]
+                input_ids[row, : len(seq)] = seq
+            swap = rng.random(input_ids.shape) < noise
+            noisy = np.where(swap, rng.integers(0, STANDIN_VOCAB_SIZE, size=input_ids.shape), input_ids)
+            logits = backend.logits(noisy, np.ones_like(noisy))
+            nll = token_level_stats(logits[:, :-1], input_ids[:, 1:], vocab_chunk_size=8192, return_log_probs=False)["nll"]
+            log_probs[members, : width - 1] = -nll
+        return log_probs
+
+    summary = stability_probe_examples(query, lengths, ProbeStoppingRule.from_config(cfg))
+    # Members' likely continuations hinge on their trained context, so perturbing it moves them more.
+    return {"stability_var": summary["stability_var"], "stability_range": summary["stability_range"]}
+
+
+def _scored_panels(node: Node) -> Dict[str, List[str]]:
+    panels, _ = open_scored_shards(_run_dir(node.slice_id, node.track, node.seed) / "token_stats")
+    return panels
+
+
+def _attack_config(configs: Mapping[str, Any], attack: str) -> Dict[str, Any]:
+    """Settings that determine an attack's features (its `attacks.yaml` entry, plus the paraphrase subset)."""
+    section = {"attack": attack, **configs["attacks"]["attacks"].get(attack, {})}
+    if attack == "paraphrase":
+        section["paraphrase_subset"] = configs.get("data", {}).get("paraphrase_subset")
+    return section
+
+
+@register_config_check
+def _check_attacks(configs: Mapping[str, Any]) -> List[str]:
+    """Enabled attacks this module cannot compute, and attack settings it cannot run with."""
+    problems = [
+        f"attack {attack!r} is enabled but has no feature_builder; disable it or register one"
+        for attack in enabled_attacks(configs)
+        if attack not in _FEATURE_BUILDERS
+    ]
+    lira = configs.get("attacks", {}).get("attacks", {}).get("lira", {})
+    if "lira" in enabled_attacks(configs) and int(lira.get("reference_models", 4)) < 2:
+        problems.append("attacks.lira.reference_models must be at least 2")
+    return problems
+
+
+def _features_path(node: Node, attack: str) -> Path:
+    return _run_dir(node.slice_id, node.track, node.seed) / "features" / f"{attack}.npz"
+
+
+@register_stage("attack_features")
+def attack_features(node: Node, configs: Mapping[str, Any]) -> Dict[str, Any]:
+    """Per-example scores for one attack over every scored panel ID, saved as `features/{attack}.npz`."""
+    builder = _FEATURE_BUILDERS[node.attack]  # `_check_attacks` rejects attacks without one up front
+    token_stats = _run_dir(node.slice_id, node.track, node.seed) / "token_stats"
+    panels, stores = open_scored_shards(token_stats)
+    ids = list(dict.fromkeys(note_id for panel_ids in panels.values() for note_id in panel_ids))
+
+    def compute() -> Dict[str, np.ndarray]:
+        features = builder(node, configs, ids, _PanelStats(stores, ids))
+        return {"id": np.asarray(ids, dtype=str), **{name: np.asarray(values, dtype=np.float64) for name, values in features.items()}}
+
+    # Changing only `attacks.defaults` (bootstrap, FPR targets) or ensemble settings re-runs this
+    # node; the cache then returns the features without re-scoring references or paraphrases.
+    key = FeatureCacheKey.build(
+        f"attack_features.{node.attack}",
+        checkpoint=_checkpoint_path(node.slice_id, node.track, node.seed),
+        slice_id=node.slice_id,
+        track=node.track,
+        seed=node.seed,
+        id_list_paths=[_ids_dir(node.slice_id) / f"{panel}.npy" for panel in PANELS],
+        params={
+            "attack": _attack_config(configs, node.attack),
+            "scored_inputs": (token_stats / FINGERPRINT_FILE).read_text(encoding="utf-8"),
+        },
+    )
+    frame = FeatureCache().get_or_compute(key, compute)
+    path = _features_path(node, node.attack)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez(path, ids=frame["id"].to_numpy(dtype=str), **{name: frame[name].to_numpy() for name in frame.columns if name != "id"})
+    return {"outputs": [str(path)]}
+
+
+def _labeled_ids(node: Node) -> Tuple[np.ndarray, np.ndarray]:
+    """Members (1) and non-members (0); IDs in both panels are dropped from the non-members."""
+    panels = _scored_panels(node)
+    members = list(dict.fromkeys(panels["members"]))
+    taken = set(members)
+    non_members = [note_id for note_id in dict.fromkeys(panels["non_members"]) if note_id not in taken]
+    ids = np.asarray(members + non_members, dtype=str)
+    labels = np.r_[np.ones(len(members), dtype=np.int64), np.zeros(len(non_members), dtype=np.int64)]
+    return ids, labels
+
+
+def _attack_scores(node: Node, configs: Mapping[str, Any], ids: np.ndarray) -> Dict[str, np.ndarray]:
+    """`{attack.feature: scores}` aligned with `ids` for every enabled attack."""
+    scores: Dict[str, np.ndarray] = {}
+    for attack in enabled_attacks(configs):
+        with np.load(_features_path(node, attack)) as data:
+            rows = pd.Index(data["ids"]).get_indexer(ids)
+            for name in data.files:
+                if name != "ids":
+                    scores[f"{attack}.{name}"] = np.where(rows >= 0, data[name][rows], np.nan)
+    return scores
+
+
+@register_stage("ensemble")
+def ensemble_slice(node: Node, configs: Mapping[str, Any]) -> Dict[str, Any]:
+    """Out-of-fold stacking over every attack feature for the member/non-member panels."""
+    ids, labels = _labeled_ids(node)
+    features = np.column_stack(list(_attack_scores(node, configs, ids).values()))
+    # Missing scores (e.g. no paraphrase survived filtering) take the column mean.
+    fill = np.nan_to_num(np.nanmean(np.where(np.isfinite(features), features, np.nan), axis=0))
+    features = np.where(np.isfinite(features), features, fill)
+    result = train_oof_stacking(
+        features,
+        labels,
+        validation_fpr=float(configs["attacks"]["attacks"]["ensemble"].get("validation_fpr", 0.01)),
+        seed=derive_seed(node.seed, node.slice_id, node.track),
+    )
+    path = _run_dir(node.slice_id, node.track, node.seed) / "ensemble.npz"
+    np.savez(path, ids=ids, labels=labels, **result.oof_probs)
+    return {"outputs": [str(path)]}
+
+
+@register_stage("metrics")
+def metrics_slice(node: Node, configs: Mapping[str, Any]) -> Dict[str, Any]:
+    """Bootstrap AUC and TPR@FPR per attack score; rows go to the results store."""
+    defaults = configs["attacks"]["defaults"]
+    ids, labels = _labeled_ids(node)
+    scores = _attack_scores(node, configs, ids)
+    ensemble = _run_dir(node.slice_id, node.track, node.seed) / "ensemble.npz"
+    if configs["attacks"]["attacks"].get("ensemble", {}).get("enabled", True) and ensemble.exists():
+        with np.load(ensemble) as data:
+            rows = pd.Index(data["ids"]).get_indexer(ids)
+            scores.update({f"ensemble.{name}": data[name][rows] for name in data.files if name not in {"ids", "labels"}})
+
+    seed = derive_seed(int(defaults["random_seed"]), node.slice_id, node.track, node.seed)
+    results = []
+    curves = {}
+    for name, values in scores.items():
+        valid = np.isfinite(values)
+        if len(np.unique(labels[valid])) < 2:
+            continue
+        summary = bootstrap_rank_metrics(
+            labels[valid],
+            values[valid],
+            metrics=("auc", "tpr_at_fpr"),
+            target_fprs=tuple(defaults["tpr_targets"]),
+            n_resamples=int(defaults["bootstrap_samples"]),
+            seed=seed,
+            confidence=float(defaults["auc_confidence_level"]),
+        )
+        key = {"slice": node.slice_id, "track": node.track, "seed": node.seed, "attack": name}
+        results += [{**key, "metric": metric, "value": s["estimate"], **s} for metric, s in summary.items()]
+        # Unscored examples rank last on the ROC figure.
+        curves[name] = np.where(valid, values, np.nanmin(values[valid]) - 1.0)
+
+    out_dir = _run_dir(node.slice_id, node.track, node.seed)
+    table = out_dir / "metrics.csv"
+    pd.DataFrame(results, columns=RESULT_COLUMNS).to_csv(table, index=False)
+    roc = out_dir / "roc.npz"
+    np.savez(roc, labels=labels, **curves)
+    return {"outputs": [str(table), str(roc)], "results": [{c: row[c] for c in RESULT_COLUMNS} for row in results]}
+
+
+@register_stage("figures")
+def figures(node: Node, configs: Mapping[str, Any]) -> Dict[str, Any]:
+    """By-slice metric plots and one ROC figure per run, skipping unchanged figures."""
+    tables = sorted(SWEEP_ROOT.glob("runs/slice_*/*/metrics.csv"))
+    if not tables:
+        return {}
+    merged = SWEEP_ROOT / "metrics.csv"
+    pd.concat([pd.read_csv(path) for path in tables], ignore_index=True).to_csv(merged, index=False)
+    out_dir = PROJECT_ROOT / "reports" / "figs"
+    specs = results_manifest(merged, out_dir)
+    for roc in sorted(SWEEP_ROOT.glob("runs/slice_*/*/roc.npz")):
+        run = f"{roc.parent.parent.name}_{roc.parent.name}"
+        specs.append(
+            FigureSpec(
+                kind="roc",
+                path=out_dir / "roc" / f"{run}.png",
+                title=f"ROC: {run}",
+                source=roc,
+                xlabel="False Positive Rate",
+                ylabel="True Positive Rate",
+            )
+        )
+    return {"outputs": sorted(export_figures(specs))}
@@ -0,0 +1,407 @@
+"""Sweep orchestrator: expand configs into a stage DAG and run it on a process pool.
+
+Usage::
+
+    python -m src.sweep --concurrency 4
+    python -m src.sweep --handlers my_project.stages --slices 1 --tracks noreplay --dry-run
+
+Stage work is supplied by a handlers module that registers callables with
+`register_stage` (by default `src.stages`, the CPU reference pipeline); the
+orchestrator owns ordering, parallelism, skipping of unchanged nodes, and
+upserting metric rows into the results store (`utils.results`), re-exported to
+`reports/results.csv` after each run.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import importlib
+import json
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from functools import cached_property
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence
+
+import yaml
+
+from .constants import ARTIFACT_ROOT, PROJECT_ROOT
+from .utils.cache import checkpoint_identity
+from .utils.profiling import profile_from_env, span
+from .utils.results import DEFAULT_RESULTS_DB, ResultsStore
+
+DEFAULT_HANDLERS = "src.stages"
+STAGES = ("slice_build", "tokenize", "finetune", "score", "attack_features", "ensemble", "metrics", "figures")
+CONFIG_FILES = ("data.yaml", "slices.yaml", "train_llm.yaml", "attacks.yaml")
+
+StageHandler = Callable[["Node", Mapping[str, Any]], Optional[Dict[str, Any]]]
+ConfigCheck = Callable[[Mapping[str, Any]], Iterable[str]]
+_STAGE_HANDLERS: Dict[str, StageHandler] = {}
+_CONFIG_CHECKS: List[ConfigCheck] = []
+
+
+def register_stage(stage: str) -> Callable[[StageHandler], StageHandler]:
+    """Decorator registering the callable that executes one stage node.
+
+    Handlers receive the node and the loaded configs and may return a dict with
+    `outputs` (paths hashed into downstream nodes) and `results` (rows in the
+    `results.csv` schema).
+    """
+    if stage not in STAGES:
+        raise ValueError(f"Unknown stage {stage!r}; expected one of {STAGES}")
+
+    def decorator(fn: StageHandler) -> StageHandler:
+        _STAGE_HANDLERS[stage] = fn
+        return fn
+
+    return decorator
+
+
+def register_config_check(fn: ConfigCheck) -> ConfigCheck:
+    """Decorator registering a check of the loaded configs that returns problem messages.
+
+    Checks run before any node, so e.g. an enabled attack the handlers cannot
+    compute is reported up front instead of failing mid-sweep.
+    """
+    _CONFIG_CHECKS.append(fn)
+    return fn
+
+
+def config_problems(configs: Mapping[str, Any]) -> List[str]:
+    return [problem for check in _CONFIG_CHECKS for problem in check(configs)]
+
+
+@dataclass(frozen=True)
+class Node:
+    stage: str
+    slice_id: Optional[int] = None
+    track: Optional[str] = None
+    seed: Optional[int] = None
+    attack: Optional[str] = None
+
+    @property
+    def node_id(self) -> str:
+        parts = [self.stage]
+        for name, value in (("slice", self.slice_id), ("track", self.track), ("seed", self.seed), ("attack", self.attack)):
+            if value is not None:
+                parts.append(f"{name}={value}")
+        return "/".join(parts)
+
+
+@dataclass
+class SweepPlan:
+    nodes: List[Node]
+    deps: Dict[Node, List[Node]] = field(default_factory=dict)
+
+    def select(self, stages: Optional[Iterable[str]]) -> "SweepPlan":
+        """Restrict to `stages`.
+
+        Dependencies on unselected nodes are kept: the runner resolves them from
+        their saved `sweep_state` records, so their hashes and outputs still feed
+        into the selected nodes.
+        """
+        if not stages:
+            return self
+        wanted = set(stages)
+        nodes = [node for node in self.nodes if node.stage in wanted]
+        return SweepPlan(nodes, {node: list(self.deps.get(node, [])) for node in nodes})
+
+    def external_deps(self) -> List[Node]:
+        """Dependencies that are not nodes of this plan (in first-use order)."""
+        planned = set(self.nodes)
+        return list(dict.fromkeys(dep for node in self.nodes for dep in self.deps.get(node, []) if dep not in planned))
+
+
+def enabled_attacks(configs: Mapping[str, Any]) -> List[str]:
+    """Enabled attacks in `attacks.yaml` order, excluding the ensemble (its own stage)."""
+    return [
+        name
+        for name, spec in configs.get("attacks", {}).get("attacks", {}).items()
+        if spec.get("enabled", True) and name != "ensemble"
+    ]
+
+
+def load_configs(config_dir: Path) -> Dict[str, Any]:
+    return {
+        name.removesuffix(".yaml"): yaml.safe_load((config_dir / name).read_text(encoding="utf-8"))
+        for name in CONFIG_FILES
+        if (config_dir / name).exists()
+    }
+
+
+def build_plan(
+    configs: Mapping[str, Any],
+    *,
+    slices: Optional[Sequence[int]] = None,
+    tracks: Optional[Sequence[str]] = None,
+    seeds: Optional[Sequence[int]] = None,
+) -> SweepPlan:
+    """Expand slices x replay tracks x seeds x enabled attacks into the stage DAG.
+
+    Fine-tuning slice `t` always depends on the slice `t - 1` checkpoint of the
+    same track/seed, even when slice `t - 1` is not among `slices`; such a
+    dependency is resolved from its saved state when the plan runs.
+    """
+    slice_cfg = configs["slices"]
+    slices = list(slices) if slices is not None else list(range(slice_cfg["slices"]["total"]))
+    tracks = list(tracks) if tracks is not None else [c["name"] for c in slice_cfg["slices"]["replay_conditions"]]
+    seeds = list(seeds) if seeds is not None else list(slice_cfg["seeds"]["values"])
+    attacks = enabled_attacks(configs)
+    ensemble_enabled = configs.get("attacks", {}).get("attacks", {}).get("ensemble", {}).get("enabled", True)
+    replay = {c["name"]: float(c.get("replay_fraction", 0.0)) for c in slice_cfg["slices"]["replay_conditions"]}
+
+    plan = SweepPlan(nodes=[])
+
+    def add(node: Node, deps: Iterable[Node] = ()) -> Node:
+        plan.nodes.append(node)
+        plan.deps[node] = list(deps)
+        return node
+
+    metric_nodes = []
+    for slice_id in sorted(slices):
+        built = add(Node("slice_build", slice_id=slice_id))
+        earlier = [Node("slice_build", slice_id=previous) for previous in range(slice_id)]
+        for track in tracks:
+            # Replay tracks sample from every earlier slice.
+            sources = [built, *earlier] if replay.get(track, 0.0) > 0 else [built]
+            tokenized = add(Node("tokenize", slice_id=slice_id, track=track), sources)
+            for seed in seeds:
+                key = {"slice_id": slice_id, "track": track, "seed": seed}
+                # Continual fine-tuning: slice t starts from the slice t-1 checkpoint of the same track/seed.
+                chain = [Node("finetune", slice_id=slice_id - 1, track=track, seed=seed)] if slice_id > 0 else []
+                trained = add(Node("finetune", **key), [tokenized, *chain])
+                scored = add(Node("score", **key), [trained])
+                features = [add(Node("attack_features", attack=attack, **key), [scored]) for attack in attacks]
+                upstream = features
+                if ensemble_enabled:
+                    upstream = features + [add(Node("ensemble", **key), features)]
+                metric_nodes.append(add(Node("metrics", **key), upstream))
+    add(Node("figures"), metric_nodes)
+    return plan
+
+
+def _config_section(node: Node, configs: Mapping[str, Any]) -> Any:
+    """The part of the configs a stage depends on (changes elsewhere do not invalidate it)."""
+    if node.stage in {"slice_build", "tokenize"}:
+        return {key: configs.get(key) for key in ("data", "slices", "train_llm")}
+    if node.stage in {"finetune", "score"}:
+        return {key: configs.get(key) for key in ("slices", "train_llm")}
+    attacks = configs.get("attacks", {})
+    if node.stage == "attack_features":
+        section = {"defaults": attacks.get("defaults"), "attack": attacks.get("attacks", {}).get(node.attack)}
+        if node.attack == "paraphrase":
+            section["paraphrase_subset"] = configs.get("data", {}).get("paraphrase_subset")
+        return section
+    return attacks
+
+
+def node_hash(node: Node, configs: Mapping[str, Any], upstream_hashes: Sequence[str], input_digests: Sequence[str]) -> str:
+    payload = json.dumps(
+        {
+            "node": asdict(node),
+            "config": _config_section(node, configs),
+            "upstream": list(upstream_hashes),
+            "inputs": list(input_digests),
+        },
+        sort_keys=True,
+        default=str,
+    ).encode()
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def _run_node(handlers_module: Optional[str], node: Node, configs: Mapping[str, Any]) -> Dict[str, Any]:
+    if handlers_module:
+        importlib.import_module(handlers_module)
+    handler = _STAGE_HANDLERS.get(node.stage)
+    if handler is None:
+        raise LookupError(f"No handler registered for stage {node.stage!r} (pass --handlers)")
+    # One profile per node when SECURE_LLM_MIA_PROFILE is set; workers write their own files.
+    with profile_from_env(node.node_id), span(f"stage.{node.stage}"):
+        return handler(node, configs) or {}
+
+
+@dataclass
+class SweepRunner:
+    plan: SweepPlan
+    configs: Mapping[str, Any]
+    handlers_module: Optional[str] = None
+    concurrency: int = 1
+    state_dir: Path = ARTIFACT_ROOT / "sweep_state"
+    results_path: Path = PROJECT_ROOT / "reports" / "results.csv"
+    results_db: Path = DEFAULT_RESULTS_DB
+    force: bool = False
+
+    @cached_property
+    def _store(self) -> ResultsStore:
+        return ResultsStore(self.results_db, seed_csv=self.results_path)
+
+    def _state_path(self, node: Node) -> Path:
+        return self.state_dir / f"{node.node_id.replace('/', '__')}.json"
+
+    def _load_state(self, node: Node) -> Optional[Dict[str, Any]]:
+        path = self._state_path(node)
+        return json.loads(path.read_text(encoding="utf-8")) if path.exists() else None
+
+    def _save_state(self, node: Node, digest: str, outputs: Sequence[str]) -> None:
+        path = self._state_path(node)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"hash": digest, "outputs": list(outputs)}, indent=2), encoding="utf-8")
+
+    @staticmethod
+    def _output_digests(outputs: Sequence[str]) -> List[str]:
+        # Directories hash their files' paths and contents; missing outputs hash to their path.
+        return [checkpoint_identity(p) for p in outputs]
+
+    def run(self) -> Dict[str, str]:
+        """Execute the plan; returns `{node_id: "ran" | "skipped" | "failed: ..."}`.
+
+        Dependencies outside the plan (unselected stages or slices) contribute
+        the hash and outputs of their last recorded run; a node whose external
+        dependency has never run fails without running.
+        """
+        status: Dict[str, str] = {}
+        hashes: Dict[Node, str] = {}
+        outputs: Dict[Node, List[str]] = {}
+        for dep in self.plan.external_deps():
+            recorded = self._load_state(dep)
+            if recorded is not None:
+                hashes[dep] = recorded["hash"]
+                outputs[dep] = recorded["outputs"]
+        planned = set(self.plan.nodes)
+        remaining = {node: {d for d in self.plan.deps.get(node, []) if d in planned} for node in self.plan.nodes}
+        dependents: Dict[Node, List[Node]] = {node: [] for node in self.plan.nodes}
+        for node, deps in remaining.items():
+            for dep in deps:
+                dependents[dep].append(node)
+
+        ready = [node for node, deps in remaining.items() if not deps]
+        running: Dict[Future, tuple] = {}
+        pool = ProcessPoolExecutor(max_workers=self.concurrency) if self.concurrency > 1 else None
+
+        def finish(node: Node, state: str) -> None:
+            status[node.node_id] = state
+            for child in dependents[node]:
+                if state.startswith("failed"):
+                    continue
+                remaining[child].discard(node)
+                if not remaining[child]:
+                    ready.append(child)
+
+        try:
+            while ready or running:
+                while ready:
+                    node = ready.pop(0)
+                    deps = self.plan.deps.get(node, [])
+                    unresolved = [dep.node_id for dep in deps if dep not in hashes]
+                    if unresolved:
+                        finish(node, f"failed: upstream {', '.join(unresolved)} has no recorded run")
+                        continue
+                    inputs = [digest for dep in deps for digest in self._output_digests(outputs.get(dep, []))]
+                    digest = node_hash(node, self.configs, [hashes[dep] for dep in deps], inputs)
+                    hashes[node] = digest
+                    previous = self._load_state(node)
+                    # Outputs deleted since the recorded run make the node re-run.
+                    if (
+                        not self.force
+                        and previous
+                        and previous["hash"] == digest
+                        and all(Path(p).exists() for p in previous["outputs"])
+                    ):
+                        outputs[node] = previous["outputs"]
+                        finish(node, "skipped")
+                        continue
+                    if pool is None:
+                        try:
+                            result = _run_node(self.handlers_module, node, self.configs)
+                        except Exception as err:
+                            finish(node, f"failed: {err}")
+                            continue
+                        self._complete(node, digest, result, outputs)
+                        finish(node, "ran")
+                    else:
+                        running[pool.submit(_run_node, self.handlers_module, node, self.configs)] = (node, digest)
+                if running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        node, digest = running.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as err:
+                            finish(node, f"failed: {err}")
+                            continue
+                        self._complete(node, digest, result, outputs)
+                        finish(node, "ran")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        for node in self.plan.nodes:
+            status.setdefault(node.node_id, "blocked")
+        if any(state == "ran" for state in status.values()):
+            self._store.export_csv(self.results_path)
+        return status
+
+    def _complete(self, node: Node, digest: str, result: Mapping[str, Any], outputs: Dict[Node, List[str]]) -> None:
+        self._store.upsert(result.get("results", []))
+        outputs[node] = [str(p) for p in result.get("outputs", [])]
+        self._save_state(node, digest, outputs[node])
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the slice x track x seed x attack sweep.")
+    parser.add_argument("--configs", type=Path, default=PROJECT_ROOT / "configs")
+    parser.add_argument(
+        "--handlers",
+        default=DEFAULT_HANDLERS,
+        help="Module that registers stage handlers via register_stage (default: %(default)s).",
+    )
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--slices", type=int, nargs="*")
+    parser.add_argument("--tracks", nargs="*")
+    parser.add_argument("--seeds", type=int, nargs="*")
+    parser.add_argument("--stages", nargs="*", choices=STAGES, help="Only run these stages.")
+    parser.add_argument("--results", type=Path, default=PROJECT_ROOT / "reports" / "results.csv", help="CSV export.")
+    parser.add_argument("--results-db", type=Path, default=DEFAULT_RESULTS_DB)
+    parser.add_argument("--state-dir", type=Path, default=ARTIFACT_ROOT / "sweep_state")
+    parser.add_argument("--force", action="store_true", help="Re-run nodes even if unchanged.")
+    parser.add_argument("--dry-run", action="store_true", help="Print the DAG without running it.")
+    args = parser.parse_args(argv)
+
+    configs = load_configs(args.configs)
+    plan = build_plan(configs, slices=args.slices, tracks=args.tracks, seeds=args.seeds).select(args.stages)
+    if args.dry_run:
+        external = set(plan.external_deps())
+        for node in plan.nodes:
+            deps = ", ".join(dep.node_id + ("*" if dep in external else "") for dep in plan.deps.get(node, []))
+            print(f"{node.node_id}" + (f"  <- {deps}" if deps else ""))
+        if external:
+            print("* not selected; resolved from its recorded run")
+        return 0
+
+    importlib.import_module(args.handlers)
+    missing = sorted({node.stage for node in plan.nodes} - set(_STAGE_HANDLERS), key=STAGES.index)
+    if missing:
+        parser.error(f"no handler registered for stage(s) {', '.join(missing)} in {args.handlers}")
+    problems = config_problems(configs)
+    if problems:
+        parser.error("invalid configs: " + "; ".join(problems))
+
+    runner = SweepRunner(
+        plan,
+        configs,
+        handlers_module=args.handlers,
+        concurrency=args.concurrency,
+        state_dir=args.state_dir,
+        results_path=args.results,
+        results_db=args.results_db,
+        force=args.force,
+    )
+    status = runner.run()
+    for node_id, state in status.items():
+        print(f"[{state}] {node_id}")
+    return 1 if any(not s.startswith(("ran", "skipped")) for s in status.values()) else 0
+
+
+if __name__ == "__main__":
+    # Re-enter through the importable module so handlers that `import src.sweep`
+    # register into the same registry that `main` reads.
+    raise SystemExit(importlib.import_module(__spec__.name).main())
@@ -0,0 +1,186 @@
+"""Content-addressed cache for attack features shared across notebooks."""
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Iterable, Mapping, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from ..constants import DATA_CACHE_DIR
+
+# Bump when feature extraction changes so stale cache entries stop matching.
+FEATURE_EXTRACTOR_VERSION = "1"
+DEFAULT_CACHE_BYTES = 20 * 1024**3
+_CHUNK_BYTES = 1 << 20
+
+Features = Union[pd.DataFrame, Mapping[str, np.ndarray], Any]
+
+
+def file_digest(path: Path) -> str:
+    """blake2b digest of a file's content."""
+    digest = hashlib.blake2b(digest_size=16)
+    with Path(path).open("rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def checkpoint_identity(checkpoint: Union[str, Path]) -> str:
+    """Identity of a checkpoint/adapter: content digest of its files, or the name itself."""
+    path = Path(checkpoint)
+    if path.is_file():
+        return file_digest(path)
+    if path.is_dir():
+        digest = hashlib.blake2b(digest_size=16)
+        for file in sorted(p for p in path.rglob("*") if p.is_file()):
+            digest.update(file.relative_to(path).as_posix().encode())
+            digest.update(file_digest(file).encode())
+        return digest.hexdigest()
+    return str(checkpoint)
+
+
+@dataclass(frozen=True)
+class FeatureCacheKey:
+    """Everything that determines a feature table; hashed into its cache address."""
+
+    stage: str
+    checkpoint: str
+    slice_id: int
+    track: str
+    seed: int
+    id_lists: str
+    extractor_version: str = FEATURE_EXTRACTOR_VERSION
+    params: str = ""
+
+    @classmethod
+    def build(
+        cls,
+        stage: str,
+        *,
+        checkpoint: Union[str, Path],
+        slice_id: int,
+        track: str,
+        seed: int,
+        id_list_paths: Iterable[Path],
+        extractor_version: str = FEATURE_EXTRACTOR_VERSION,
+        params: Optional[Mapping[str, Any]] = None,
+    ) -> "FeatureCacheKey":
+        """Key from on-disk inputs; `params` holds extractor settings (e.g. the attack's config section)."""
+        id_lists = hashlib.blake2b(digest_size=16)
+        for path in id_list_paths:
+            id_lists.update(Path(path).name.encode())
+            id_lists.update(file_digest(path).encode())
+        return cls(
+            stage=stage,
+            checkpoint=checkpoint_identity(checkpoint),
+            slice_id=int(slice_id),
+            track=track,
+            seed=int(seed),
+            id_lists=id_lists.hexdigest(),
+            extractor_version=extractor_version,
+            params=json.dumps(params, sort_keys=True, default=str) if params else "",
+        )
+
+    def digest(self) -> str:
+        fields = dataclasses.asdict(self)
+        if not fields["params"]:
+            # Keys without params keep the addresses they had before the field existed.
+            del fields["params"]
+        payload = json.dumps(fields, sort_keys=True).encode()
+        return hashlib.blake2b(payload, digest_size=20).hexdigest()
+
+
+def _to_frame(features: Features) -> pd.DataFrame:
+    if isinstance(features, pd.DataFrame):
+        return features
+    if dataclasses.is_dataclass(features):
+        features = dataclasses.asdict(features)
+    return pd.DataFrame({name: np.asarray(values) for name, values in features.items()})
+
+
+def _atomic_write_bytes(path: Path, write: Callable[[Path], None]) -> None:
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(Path(tmp))
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+@dataclass
+class FeatureCache:
+    """Parquet feature tables addressed by `FeatureCacheKey.digest()` with an LRU size cap.
+
+    Writes go to a temporary file and are renamed into place, so concurrent
+    readers never see partial tables. Reads refresh the entry's mtime, which is
+    the recency signal used when evicting down to `max_bytes`.
+    """
+
+    root: Path = DATA_CACHE_DIR / "features"
+    max_bytes: Optional[int] = DEFAULT_CACHE_BYTES
+
+    def __post_init__(self) -> None:
+        self.root = Path(self.root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, key: FeatureCacheKey) -> Path:
+        return self.root / f"{key.digest()}.parquet"
+
+    def get(self, key: FeatureCacheKey) -> Optional[pd.DataFrame]:
+        path = self.path_for(key)
+        try:
+            frame = pd.read_parquet(path)
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # evicted by another process after the read; the frame is still valid
+        return frame
+
+    def put(self, key: FeatureCacheKey, features: Features) -> Path:
+        path = self.path_for(key)
+        frame = _to_frame(features)
+        _atomic_write_bytes(path, lambda tmp: frame.to_parquet(tmp, index=False))
+        sidecar = path.with_suffix(".json")
+        _atomic_write_bytes(sidecar, lambda tmp: tmp.write_text(json.dumps(dataclasses.asdict(key), indent=2)))
+        self.evict()
+        return path
+
+    def get_or_compute(self, key: FeatureCacheKey, compute: Callable[[], Features]) -> pd.DataFrame:
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        frame = _to_frame(compute())
+        # Return the computed frame itself: `put` may evict it again (a table
+        # larger than `max_bytes`, or a concurrent eviction elsewhere).
+        self.put(key, frame)
+        return frame
+
+    def evict(self) -> None:
+        """Delete least recently used tables until the cache fits in `max_bytes`."""
+        if self.max_bytes is None:
+            return
+        entries = []
+        for path in self.root.glob("*.parquet"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            path.with_suffix(".json").unlink(missing_ok=True)
+            total -= size
@@ -1,10 +1,28 @@
 """Matplotlib plotting helpers to keep notebooks tidy."""
 from __future__ import annotations
 
+import argparse
+import hashlib
+import json
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Sequence
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence
 
+import matplotlib
 import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+
+from ..eval.metrics import downsample_roc, roc_summaries
+from .cache import file_digest
+from .profiling import instrument
+from .results import ResultsStore
+
+DEFAULT_ROC_POINTS = 512
+FIGURE_STATE_FILE = ".figure_hashes.json"
 
 
 def save_roc_curve(fpr: Sequence[float], tpr: Sequence[float], *, title: str, path: Path) -> None:
@@ -31,3 +49,254 @@ def save_bar_plot(labels: Sequence[str], values: Sequence[float], *, title: str,
     path.parent.mkdir(parents=True, exist_ok=True)
     fig.savefig(path, bbox_inches="tight", dpi=200)
     plt.close(fig)
+
+
+@dataclass
+class FigureSpec:
+    """One figure in a batch export.
+
+    `kind` is `roc` (`data["curves"]`: name -> `(fpr, tpr)`, or a `source`
+    `.npz` holding `labels` plus one score array per attack; thinned to
+    `data["max_points"]`, default `DEFAULT_ROC_POINTS`), `line`
+    (`data["x"]`, `data["series"]`: name -> y) or `bar` (`data["labels"]`,
+    `data["values"]`).
+    """
+
+    kind: str
+    path: Path
+    title: str = ""
+    data: Dict[str, Any] = field(default_factory=dict)
+    source: Optional[Path] = None
+    xlabel: str = ""
+    ylabel: str = ""
+    dpi: int = 200
+
+    def digest(self) -> str:
+        """Hash of everything that affects the rendered file, including `source` content."""
+        digest = hashlib.blake2b(digest_size=16)
+        header = [self.kind, self.title, self.xlabel, self.ylabel, self.dpi]
+        digest.update(json.dumps(header).encode("utf-8"))
+        _hash_value(digest, self.data)
+        if self.source is not None:
+            digest.update(file_digest(self.source).encode("ascii"))
+        return digest.hexdigest()
+
+
+def _hash_value(digest: "hashlib._Hash", value: Any) -> None:
+    if isinstance(value, Mapping):
+        for key in sorted(value, key=str):
+            digest.update(f"k:{key}".encode("utf-8"))
+            _hash_value(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"l:{len(value)}".encode("ascii"))
+        for item in value:
+            _hash_value(digest, item)
+    elif isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        digest.update(f"a:{array.dtype.str}:{array.shape}".encode("ascii"))
+        digest.update(array.tobytes() if array.dtype != object else repr(array.tolist()).encode("utf-8"))
+    else:
+        digest.update(f"v:{value!r}".encode("utf-8"))
+
+
+def roc_spec(
+    path: Path,
+    labels: np.ndarray,
+    scores: Mapping[str, np.ndarray],
+    *,
+    title: str = "",
+    max_points: int = DEFAULT_ROC_POINTS,
+    log_scale: bool = True,
+) -> FigureSpec:
+    """ROC figure spec for several attacks, each curve thinned on a log-FPR grid.
+
+    All attacks are sorted in one pass (`roc_summaries`); only the thinned
+    points are kept, so specs stay small when shipped to worker processes.
+    """
+    names = list(scores)
+    summaries = roc_summaries(labels, np.stack([np.asarray(scores[name]) for name in names]))
+    curves = {name: summary.curve(max_points) for name, summary in zip(names, summaries)}
+    return FigureSpec(
+        kind="roc",
+        path=Path(path),
+        title=title,
+        data={"curves": curves, "log_scale": log_scale, "max_points": max_points},
+        xlabel="False Positive Rate",
+        ylabel="True Positive Rate",
+    )
+
+
+def _roc_curves(spec: FigureSpec) -> Dict[str, Any]:
+    """Curves thinned to `data["max_points"]`; `roc_spec` curves are already within it and pass unchanged."""
+    max_points = spec.data.get("max_points", DEFAULT_ROC_POINTS)
+    if spec.source is None:
+        return {name: downsample_roc(fpr, tpr, max_points) for name, (fpr, tpr) in spec.data["curves"].items()}
+    with np.load(spec.source) as data:
+        names = [name for name in data.files if name != "labels"]
+        summaries = roc_summaries(data["labels"], np.stack([data[name] for name in names]))
+    return {name: summary.curve(max_points) for name, summary in zip(names, summaries)}
+
+
+def _draw_roc(ax, spec: FigureSpec) -> None:
+    for name, (fpr, tpr) in _roc_curves(spec).items():
+        ax.plot(fpr, tpr, label=name, linewidth=1.2)
+    if spec.data.get("log_scale", True):
+        ax.set_xscale("log")
+        ax.set_yscale("log")
+    else:
+        ax.plot([0, 1], [0, 1], linestyle="--", color="gray", linewidth=1)
+    ax.legend(fontsize="small")
+
+
+def _draw_line(ax, spec: FigureSpec) -> None:
+    for name, values in spec.data["series"].items():
+        ax.plot(spec.data["x"], values, marker="o", label=name)
+    ax.grid(True, linestyle="--", alpha=0.4)
+    ax.legend(fontsize="small")
+
+
+def _draw_bar(ax, spec: FigureSpec) -> None:
+    ax.bar(spec.data["labels"], spec.data["values"], color="#2a9d8f")
+    ax.grid(axis="y", linestyle="--", alpha=0.4)
+
+
+_DRAWERS = {"roc": (_draw_roc, (4, 4)), "line": (_draw_line, (6, 4)), "bar": (_draw_bar, (6, 4))}
+
+
+def _use_agg() -> None:
+    matplotlib.use("Agg", force=True)
+
+
+@instrument()
+def render_figure(spec: FigureSpec) -> Path:
+    """Render one spec with the object-oriented API (no pyplot global state)."""
+    draw, figsize = _DRAWERS[spec.kind]
+    fig = Figure(figsize=figsize)
+    ax = fig.add_subplot()
+    draw(ax, spec)
+    ax.set_xlabel(spec.xlabel)
+    ax.set_ylabel(spec.ylabel)
+    ax.set_title(spec.title)
+    path = Path(spec.path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(path, bbox_inches="tight", dpi=spec.dpi)
+    return path
+
+
+def _load_state(path: Path) -> Dict[str, str]:
+    return json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+
+
+@instrument()
+def export_figures(
+    specs: Iterable[FigureSpec],
+    *,
+    n_jobs: int = 1,
+    force: bool = False,
+) -> Dict[str, str]:
+    """Render a manifest of figures, skipping those whose inputs are unchanged.
+
+    Each output directory keeps `FIGURE_STATE_FILE`, mapping file names to
+    `FigureSpec.digest()`; a figure is re-rendered only if its file is missing
+    or its digest changed. Pending figures render on a pool of `n_jobs`
+    processes using the Agg backend. Returns `{path: "rendered" | "skipped"}`.
+    """
+    specs = list(specs)
+    unknown = {spec.kind for spec in specs} - set(_DRAWERS)
+    if unknown:
+        raise ValueError(f"Unknown figure kinds: {sorted(unknown)}")
+
+    states: Dict[Path, Dict[str, str]] = {}
+    status: Dict[str, str] = {}
+    pending: List[FigureSpec] = []
+    digests: Dict[str, str] = {}
+    for spec in specs:
+        path = Path(spec.path)
+        state = states.setdefault(path.parent, _load_state(path.parent / FIGURE_STATE_FILE))
+        digests[str(path)] = spec.digest()
+        if not force and path.exists() and state.get(path.name) == digests[str(path)]:
+            status[str(path)] = "skipped"
+        else:
+            pending.append(spec)
+
+    if n_jobs > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_use_agg) as pool:
+            rendered = list(pool.map(render_figure, pending))
+    else:
+        rendered = [render_figure(spec) for spec in pending]
+
+    for path in rendered:
+        states[path.parent][path.name] = digests[str(path)]
+        status[str(path)] = "rendered"
+    for directory, state in states.items():
+        if state:
+            directory.mkdir(parents=True, exist_ok=True)
+            (directory / FIGURE_STATE_FILE).write_text(json.dumps(state, indent=2, sort_keys=True), encoding="utf-8")
+    return status
+
+
+def load_manifest(path: Path) -> List[FigureSpec]:
+    """Read a JSON list of `FigureSpec` fields; relative paths resolve against the manifest."""
+    path = Path(path)
+    specs = []
+    for entry in json.loads(path.read_text(encoding="utf-8")):
+        entry = dict(entry)
+        entry["path"] = path.parent / entry["path"]
+        if entry.get("source"):
+            entry["source"] = path.parent / entry["source"]
+        specs.append(FigureSpec(**entry))
+    return specs
+
+
+def results_manifest(results_path: Path, out_dir: Path) -> List[FigureSpec]:
+    """Per attack and metric, a by-slice line plot with one series per track (mean over seeds).
+
+    `results_path` is a `results.csv` export or a `utils.results` SQLite store.
+    """
+    results_path = Path(results_path)
+    if results_path.suffix in {".sqlite", ".db"}:
+        results = ResultsStore(results_path).query()
+    else:
+        results = pd.read_csv(results_path)
+    if results.empty:
+        return []
+    specs = []
+    for (attack, metric), group in results.groupby(["attack", "metric"], sort=True):
+        table = group.pivot_table(index="slice", columns="track", values="value", aggfunc="mean").sort_index()
+        stem = re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{attack}_{metric}".replace("@", "_at_"))
+        specs.append(
+            FigureSpec(
+                kind="line",
+                path=Path(out_dir) / f"{stem}.png",
+                title=f"{attack}: {metric} by slice",
+                data={"x": table.index.to_numpy(), "series": {str(t): table[t].to_numpy() for t in table.columns}},
+                xlabel="Slice ID",
+                ylabel=metric,
+            )
+        )
+    return specs
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    from ..constants import PROJECT_ROOT
+
+    reports = PROJECT_ROOT / "reports"
+    parser = argparse.ArgumentParser(description="Batch-export report figures.")
+    parser.add_argument("--results", type=Path, default=reports / "results.csv")
+    parser.add_argument("--manifest", type=Path, action="append", default=[], help="Extra JSON figure manifests.")
+    parser.add_argument("--out", type=Path, default=reports / "figs")
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--force", action="store_true", help="Re-render even if inputs are unchanged.")
+    args = parser.parse_args(argv)
+
+    specs = results_manifest(args.results, args.out) if args.results.exists() else []
+    for manifest in args.manifest:
+        specs.extend(load_manifest(manifest))
+    status = export_figures(specs, n_jobs=args.jobs, force=args.force)
+    for path, outcome in sorted(status.items()):
+        print(f"[{outcome}] {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
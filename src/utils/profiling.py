@@ -0,0 +1,210 @@
+"""Opt-in instrumentation for pipeline entry points.
+
+Functions decorated with `instrument` (and blocks wrapped in `span`) record
+call counts, wall/CPU time, input array bytes and, optionally, tracemalloc
+peaks, but only while a `profile_run` is active in the current process. When
+profiling is off the wrapper is a single attribute check and a call.
+
+Set `SECURE_LLM_MIA_PROFILE=1` (or `memory` to also track allocations) to have
+the sweep profile every node into `artifacts/profiles/`.
+"""
+from __future__ import annotations
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+from ..constants import ARTIFACT_ROOT
+
+PROFILE_ENV = "SECURE_LLM_MIA_PROFILE"
+PROFILE_DIR = ARTIFACT_ROOT / "profiles"
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@dataclass
+class _Frame:
+    start_alloc: int = 0
+    child_peak: int = 0
+
+
+@dataclass
+class RunProfile:
+    """Events recorded during one `profile_run`; `save` writes the summary and a Chrome trace."""
+
+    name: str
+    memory: bool = False
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    origin_ns: int = field(default_factory=time.perf_counter_ns)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per-name totals: calls, wall/CPU seconds, input bytes and max peak allocation."""
+        totals: Dict[str, Dict[str, float]] = {}
+        for event in self.events:
+            entry = totals.setdefault(
+                event["name"], {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "input_bytes": 0, "peak_alloc_bytes": 0}
+            )
+            entry["calls"] += 1
+            entry["wall_s"] += event["dur_us"] / 1e6
+            entry["cpu_s"] += event["cpu_us"] / 1e6
+            entry["input_bytes"] += event["input_bytes"]
+            entry["peak_alloc_bytes"] = max(entry["peak_alloc_bytes"], event.get("peak_alloc_bytes", 0))
+        return dict(sorted(totals.items(), key=lambda item: -item[1]["wall_s"]))
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Trace Event Format (complete `X` events) for chrome://tracing or Perfetto."""
+        trace_events = [
+            {
+                "name": event["name"],
+                "cat": event["name"].split(".", 1)[0],
+                "ph": "X",
+                "ts": event["ts_us"],
+                "dur": event["dur_us"],
+                "pid": event["pid"],
+                "tid": event["tid"],
+                "args": {key: event[key] for key in ("cpu_us", "input_bytes", "peak_alloc_bytes") if key in event},
+            }
+            for event in self.events
+        ]
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms", "otherData": {"run": self.name}}
+
+    def save(self, out_dir: Path) -> Path:
+        """Write `{name}.profile.json` and `{name}.trace.json` into `out_dir`."""
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        stem = self.name.replace("/", "__")
+        (out_dir / f"{stem}.trace.json").write_text(json.dumps(self.chrome_trace()), encoding="utf-8")
+        path = out_dir / f"{stem}.profile.json"
+        payload = {"run": self.name, "memory": self.memory, "summary": self.summary(), "events": self.events}
+        path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+        return path
+
+
+class _State(threading.local):
+    def __init__(self) -> None:
+        self.stack: List[_Frame] = []
+
+
+# Process-wide active profile; per-thread frame stacks for nested tracemalloc peaks.
+_ACTIVE: Dict[str, Optional[RunProfile]] = {"profile": None}
+_LOCAL = _State()
+
+
+def active_profile() -> Optional[RunProfile]:
+    return _ACTIVE["profile"]
+
+
+def _input_bytes(args: Any, kwargs: Dict[str, Any]) -> int:
+    total = 0
+    for value in (*args, *kwargs.values()):
+        nbytes = getattr(value, "nbytes", None)
+        if isinstance(nbytes, int):
+            total += nbytes
+        elif hasattr(value, "memory_usage") and hasattr(value, "columns"):
+            total += int(value.memory_usage(index=False).sum())
+    return total
+
+
+@contextmanager
+def _record(profile: RunProfile, name: str, input_bytes: int) -> Iterator[None]:
+    frame = _Frame()
+    if profile.memory and tracemalloc.is_tracing():
+        frame.start_alloc, peak = tracemalloc.get_traced_memory()
+        if _LOCAL.stack:
+            # reset_peak below clears the parent's peak; carry it on the parent frame.
+            parent = _LOCAL.stack[-1]
+            parent.child_peak = max(parent.child_peak, peak)
+        tracemalloc.reset_peak()
+    _LOCAL.stack.append(frame)
+    start_ns, start_cpu = time.perf_counter_ns(), time.thread_time_ns()
+    try:
+        yield
+    finally:
+        end_ns, end_cpu = time.perf_counter_ns(), time.thread_time_ns()
+        _LOCAL.stack.pop()
+        event = {
+            "name": name,
+            "ts_us": (start_ns - profile.origin_ns) / 1e3,
+            "dur_us": (end_ns - start_ns) / 1e3,
+            "cpu_us": (end_cpu - start_cpu) / 1e3,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "input_bytes": input_bytes,
+        }
+        if profile.memory and tracemalloc.is_tracing():
+            peak = max(tracemalloc.get_traced_memory()[1], frame.child_peak)
+            event["peak_alloc_bytes"] = max(peak - frame.start_alloc, 0)
+            if _LOCAL.stack:
+                parent = _LOCAL.stack[-1]
+                parent.child_peak = max(parent.child_peak, peak)
+        profile.events.append(event)
+
+
+def instrument(name: Optional[str] = None) -> Callable[[F], F]:
+    """Decorator recording each call of the wrapped function while profiling is active.
+
+    The default name is the module path below `src` plus the function name,
+    e.g. `eval.bootstrap.bootstrap_rank_metrics`.
+    """
+
+    def decorator(fn: F) -> F:
+        label = name or f"{fn.__module__.split('src.', 1)[-1]}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            profile = _ACTIVE["profile"]
+            if profile is None:
+                return fn(*args, **kwargs)
+            with _record(profile, label, _input_bytes(args, kwargs)):
+                return fn(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def span(name: str, *, input_bytes: int = 0):
+    """Context manager timing an arbitrary block (a no-op when profiling is off)."""
+    profile = _ACTIVE["profile"]
+    if profile is None:
+        return nullcontext()
+    return _record(profile, name, input_bytes)
+
+
+@contextmanager
+def profile_run(name: str, *, out_dir: Optional[Path] = PROFILE_DIR, memory: bool = False) -> Iterator[RunProfile]:
+    """Activate profiling for this process; on exit the profile is saved to `out_dir` (if given).
+
+    `memory=True` starts tracemalloc, which slows allocation-heavy code
+    noticeably; keep it for memory investigations.
+    """
+    if _ACTIVE["profile"] is not None:
+        raise RuntimeError("A profile_run is already active in this process")
+    profile = RunProfile(name=name, memory=memory)
+    started_tracing = memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    _ACTIVE["profile"] = profile
+    try:
+        yield profile
+    finally:
+        _ACTIVE["profile"] = None
+        if started_tracing:
+            tracemalloc.stop()
+        if out_dir is not None:
+            profile.save(out_dir)
+
+
+def profile_from_env(name: str, out_dir: Path = PROFILE_DIR):
+    """`profile_run` if `SECURE_LLM_MIA_PROFILE` is set (`memory` also traces allocations), else a no-op."""
+    mode = os.environ.get(PROFILE_ENV, "").strip().lower()
+    if mode in {"", "0", "false", "off"} or _ACTIVE["profile"] is not None:
+        return nullcontext()
+    return profile_run(name, out_dir=out_dir, memory=mode == "memory")
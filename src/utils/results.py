@@ -0,0 +1,169 @@
+"""SQLite-backed results store shared by sweep workers, tables and figures."""
+from __future__ import annotations
+
+import csv
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Mapping, Optional, Sequence
+
+import pandas as pd
+
+from ..constants import PROJECT_ROOT
+
+RESULT_KEY = ("slice", "track", "seed", "attack", "metric")
+RESULT_COLUMNS = [*RESULT_KEY, "value", "ci_low", "ci_high"]
+DEFAULT_RESULTS_DB = PROJECT_ROOT / "reports" / "results.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    slice INTEGER NOT NULL,
+    track TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    attack TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL,
+    ci_low REAL,
+    ci_high REAL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (slice, track, seed, attack, metric)
+);
+CREATE INDEX IF NOT EXISTS results_by_metric ON results (metric, attack, track, slice);
+CREATE INDEX IF NOT EXISTS results_by_track ON results (track, seed, slice);
+"""
+
+
+def _optional_float(value: Any) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    value = float(value)
+    return None if value != value else value
+
+
+class ResultsStore:
+    """Metric rows keyed on `(slice, track, seed, attack, metric)`.
+
+    The database runs in WAL mode, so any number of processes can read while
+    one writes, and writers wait up to `timeout` seconds for the lock instead
+    of failing. Connections are opened per call, which keeps the store safe to
+    use from pool workers (nothing is shared across `fork`).
+
+    When the database is created, rows already in `seed_csv` (normally the
+    `results.csv` it exports to) are imported first, so the first export does
+    not drop rows written before the store existed.
+    """
+
+    def __init__(self, path: Path = DEFAULT_RESULTS_DB, *, timeout: float = 60.0, seed_csv: Optional[Path] = None) -> None:
+        self.path = Path(path)
+        self.timeout = timeout
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        created = not self.path.exists()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        if created and seed_csv is not None and Path(seed_csv).exists():
+            try:
+                self.import_csv(Path(seed_csv))
+            except BaseException:
+                # Leave no half-seeded store behind; the next open retries the import.
+                for suffix in ("", "-wal", "-shm"):
+                    Path(f"{self.path}{suffix}").unlink(missing_ok=True)
+                raise
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def upsert(self, rows: Iterable[Mapping[str, Any]]) -> int:
+        """Insert rows, replacing value/CI of rows whose key already exists."""
+        now = time.time()
+        records = []
+        for row in rows:
+            missing = [key for key in RESULT_KEY if row.get(key) is None]
+            if missing:
+                raise ValueError(f"result row is missing key columns {missing}: {dict(row)}")
+            records.append(
+                (
+                    int(row["slice"]),
+                    str(row["track"]),
+                    int(row["seed"]),
+                    str(row["attack"]),
+                    str(row["metric"]),
+                    _optional_float(row.get("value")),
+                    _optional_float(row.get("ci_low")),
+                    _optional_float(row.get("ci_high")),
+                    now,
+                )
+            )
+        if not records:
+            return 0
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE takes the write lock up front, so concurrent writers queue on busy_timeout.
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    """
+                    INSERT INTO results (slice, track, seed, attack, metric, value, ci_low, ci_high, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (slice, track, seed, attack, metric) DO UPDATE SET
+                        value = excluded.value,
+                        ci_low = excluded.ci_low,
+                        ci_high = excluded.ci_high,
+                        updated_at = excluded.updated_at
+                    """,
+                    records,
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return len(records)
+
+    def query(
+        self,
+        *,
+        slices: Optional[Sequence[int]] = None,
+        tracks: Optional[Sequence[str]] = None,
+        seeds: Optional[Sequence[int]] = None,
+        attacks: Optional[Sequence[str]] = None,
+        metrics: Optional[Sequence[str]] = None,
+    ) -> pd.DataFrame:
+        """Rows matching every given filter, ordered by key, as a DataFrame with `RESULT_COLUMNS`."""
+        clauses: List[str] = []
+        params: List[Any] = []
+        for column, values in (
+            ("slice", slices),
+            ("track", tracks),
+            ("seed", seeds),
+            ("attack", attacks),
+            ("metric", metrics),
+        ):
+            if values is not None:
+                values = list(values)
+                clauses.append(f"{column} IN ({', '.join('?' * len(values))})" if values else "0")
+                params.extend(values)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT {', '.join(RESULT_COLUMNS)} FROM results{where} ORDER BY {', '.join(RESULT_KEY)}"
+        with self._connect() as conn:
+            return pd.read_sql_query(sql, conn, params=params)
+
+    def export_csv(self, path: Path = PROJECT_ROOT / "reports" / "results.csv", **filters: Any) -> Path:
+        """Write the (filtered) store as the reviewer-facing CSV, replacing it atomically."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        self.query(**filters).to_csv(tmp, index=False, columns=RESULT_COLUMNS)
+        os.replace(tmp, path)
+        return path
+
+    def import_csv(self, path: Path) -> int:
+        """Upsert rows from a `results.csv`-style file (e.g. one maintained by hand)."""
+        with Path(path).open(newline="", encoding="utf-8") as f:
+            return self.upsert(csv.DictReader(f))
@@ -1,9 +1,14 @@
-"""Deterministic seeding helpers."""
+"""Deterministic seeding helpers.
+
+Library code takes explicit seeds or Generators and derives independent child
+streams keyed by stable names (slice, shard, worker), so results do not depend
+on which thread or process runs a task.
+"""
 from __future__ import annotations
 
-import os
+import hashlib
 import random
-from typing import Optional
+from typing import List, Optional, Sequence, Union
 
 import numpy as np
 
@@ -12,10 +17,81 @@ try:  # torch is optional on CPU-only environments.
 except Exception:  # pragma: no cover - torch not installed in lightweight envs.
     torch = None  # type: ignore
 
+SeedLike = Union[None, int, Sequence[int], np.random.SeedSequence, np.random.Generator]
+StreamKey = Union[int, str]
+
+
+def _key_to_int(key: StreamKey) -> int:
+    if isinstance(key, str):
+        # Stable across processes, unlike `hash()` under hash randomization.
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=4).digest(), "little")
+    if key < 0:
+        raise ValueError("stream keys must be non-negative")
+    return int(key)
+
+
+def as_seed_sequence(seed: SeedLike) -> np.random.SeedSequence:
+    """Root `SeedSequence` for an int, int sequence, `SeedSequence` or `Generator`.
+
+    A `Generator` maps to the sequence it was created from, so streams derived
+    from it depend only on how it was seeded, not on draws already made.
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        seed_seq = seed.bit_generator.seed_seq
+        if not isinstance(seed_seq, np.random.SeedSequence):
+            raise TypeError("Generator was not seeded from a SeedSequence")
+        return seed_seq
+    return np.random.SeedSequence(seed)
+
+
+def derive_seed(seed: SeedLike, *keys: StreamKey) -> np.random.SeedSequence:
+    """Child sequence of `seed` at the path `keys` (ints or names).
+
+    `derive_seed(s, i)` equals the `i`-th child of `SeedSequence(s).spawn(...)`,
+    but is a pure function: it never advances the parent's spawn counter, so
+    any worker can rebuild its stream from `(seed, keys)` alone.
+    """
+    parent = as_seed_sequence(seed)
+    return np.random.SeedSequence(
+        parent.entropy,
+        spawn_key=tuple(parent.spawn_key) + tuple(_key_to_int(key) for key in keys),
+        pool_size=parent.pool_size,
+    )
+
+
+def make_rng(seed: SeedLike, *keys: StreamKey) -> np.random.Generator:
+    """`Generator` for the stream `derive_seed(seed, *keys)`; a bare Generator is returned as-is."""
+    if isinstance(seed, np.random.Generator) and not keys:
+        return seed
+    return np.random.default_rng(derive_seed(seed, *keys))
+
+
+def spawn_seeds(seed: SeedLike, count: int) -> List[np.random.SeedSequence]:
+    """`count` independent children, identical to a fresh `SeedSequence(seed).spawn(count)`."""
+    parent = as_seed_sequence(seed)
+    return [derive_seed(parent, index) for index in range(count)]
+
+
+def int_seed(seed: SeedLike, *keys: StreamKey) -> int:
+    """32-bit integer seed for APIs that only accept ints (scikit-learn, XGBoost).
+
+    Plain ints without keys pass through unchanged.
+    """
+    if isinstance(seed, (int, np.integer)) and not keys:
+        return int(seed)
+    return int(derive_seed(seed, *keys).generate_state(1)[0])
+
 
 def set_global_seed(seed: int, *, deterministic_torch: bool = True) -> None:
     """Seed python, numpy, and torch RNGs.
 
+    This mutates process-wide state, so library functions do not call it; pass
+    seeds or Generators explicitly instead. Hash randomization cannot be
+    changed from inside a running interpreter: export `PYTHONHASHSEED` before
+    launching Python if string-hash order matters.
+
     Parameters
     ----------
     seed: int
@@ -25,7 +101,6 @@ def set_global_seed(seed: int, *, deterministic_torch: bool = True) -> None:
     """
     random.seed(seed)
     np.random.seed(seed)
-    os.environ["PYTHONHASHSEED"] = str(seed)
 
     if torch is None:
         return
@@ -38,10 +113,22 @@ def set_global_seed(seed: int, *, deterministic_torch: bool = True) -> None:
         torch.backends.cudnn.benchmark = False  # type: ignore[attr-defined]
 
 
-def seed_worker(worker_id: int) -> None:
-    """Pytorch DataLoader worker seeding hook."""
-    seed = np.random.get_state()[1][0] + worker_id
-    set_global_seed(int(seed % (2**32)))
+def seed_worker(worker_id: int, base_seed: Optional[int] = None) -> None:
+    """Pytorch DataLoader worker seeding hook.
+
+    Each worker derives its stream from the loader's per-epoch base seed
+    (`torch.initial_seed()` inside workers) and its `worker_id`, and seeds
+    python and numpy's legacy global state from it. Pass `base_seed` to use
+    the hook outside a DataLoader.
+    """
+    if base_seed is None:
+        if torch is None:
+            raise RuntimeError("seed_worker needs torch or an explicit base_seed")
+        # DataLoader already sets torch's seed to base_seed + worker_id in each worker.
+        base_seed = torch.initial_seed() - worker_id
+    state = derive_seed(int(base_seed) % 2**64, worker_id).generate_state(2)
+    np.random.seed(int(state[0]))
+    random.seed(int(state[1]))
 
 
 def generate_seeds(base_seed: int, count: int) -> list[int]: